@@ -1,6 +1,7 @@
 import streamlit as st
 import os
 import time
+import uuid
 from pathlib import Path
 
 # 環境変数を最初に読み込み（確実に）
@@ -15,12 +16,37 @@ print(f"   GROQ_API_KEY: {'設定済み' if os.getenv('GROQ_API_KEY') else '未
 from config import config
 from src.document_processor import DocumentProcessor
 from src.chatbot import NetworkManualChatbot
+from src.index_versions import get_index_versions
+from src.products import ALL_PRODUCTS, product_label
+from src.retrieval import create_retriever
+from src.session_registry import get_session_registry
+from src.ingestion_jobs import get_job_queue, submit_uploads
 from src.logger import setup_logger, get_logger
 from src.performance import get_performance_monitor, log_system_status
+from src.warmup import start_background_warmup, get_warmup_status
+from src.embeddings import get_query_embedding_stats
+from src.metrics import start_metrics_server
+from src.profiling import get_profile_store
+from src.memory_tracking import get_memory_tracker
+from src.tracing import request_context
 
 # ロガーの初期化
 logger = setup_logger(log_dir=config.LOG_DIR, log_level=config.LOG_LEVEL)
 
+# メトリクス配信サーバーの起動（プロセス内で1回のみ）
+if config.METRICS_PORT:
+    start_metrics_server(config.METRICS_PORT, config.METRICS_HOST)
+
+# 埋め込みモデル・ベクトルストアの事前ロード（プロセス内で1回のみ）
+if config.ENABLE_WARMUP:
+    start_background_warmup()
+
+# 前回のプロセスで中断したインジェストを再開（プロセス内で1回のみ）
+get_job_queue().resume_interrupted()
+
+# インジェストジョブの進捗を再描画する間隔（秒）
+INGESTION_POLL_INTERVAL_SEC = 1.0
+
 # ページ設定
 st.set_page_config(
     page_title="ネットワーク製品 Knowledge Database",
@@ -32,11 +58,17 @@ st.set_page_config(
 def initialize_session_state():
     """セッション状態を初期化"""
     default_states = {
-        "chatbot": None,
+        # チャットボットはセッションIDをキーに SessionRegistry が保持する
+        "session_id": uuid.uuid4().hex,
+        "model_name": config.MODEL_NAME,
         "chat_history": [],
+        "message_seq": 0,
+        "history_pages": 1,
         "vectorstore_loaded": False,
         "api_key_validated": False,
         "last_system_check": 0,
+        "ingestion_job_id": None,
+        "index_version": None,
         "env_api_key_checked": False,  # 新規追加
         "default_api_key": ""          # 新規追加
     }
@@ -75,20 +107,156 @@ def show_performance_stats():
         if stats:
             for func_name, func_stats in stats.items():
                 st.write(f"**{func_name}**")
-                col1, col2, col3 = st.columns(3)
+                col1, col2, col3, col4, col5 = st.columns(5)
                 with col1:
                     st.metric("実行回数", func_stats['call_count'])
                 with col2:
-                    st.metric("平均実行時間", f"{func_stats['avg_execution_time']:.3f}秒")
+                    st.metric("p50", f"{func_stats['p50_execution_time']:.3f}秒")
                 with col3:
+                    st.metric("p95", f"{func_stats['p95_execution_time']:.3f}秒")
+                with col4:
+                    st.metric("p99", f"{func_stats['p99_execution_time']:.3f}秒")
+                with col5:
                     st.metric("平均メモリ使用量", f"{func_stats['avg_memory_usage_mb']:.1f}MB")
         else:
             st.info("まだ統計データがありません")
+        
+        # 処理段階ごとの内訳（ask.retrieval など）
+        span_stats = monitor.get_span_stats()
+        if span_stats:
+            st.write("**⏱️ 処理段階別の実行時間（秒）**")
+            st.dataframe(
+                [
+                    {
+                        "段階": span_name,
+                        "回数": summary["count"],
+                        "p50": round(summary["p50"], 3),
+                        "p95": round(summary["p95"], 3),
+                        "p99": round(summary["p99"], 3),
+                        "最大": round(summary["max"], 3)
+                    }
+                    for span_name, summary in span_stats.items()
+                ],
+                use_container_width=True
+            )
+
+def show_warmup_status():
+    """ウォームアップ状態とインポート時間を表示"""
+    with st.expander("🔥 ウォームアップ状態", expanded=False):
+        warmup_status = get_warmup_status()
+        st.write(f"**状態:** {warmup_status['status']}")
+        if warmup_status["total_time"] is not None:
+            st.write(f"**所要時間:** {warmup_status['total_time']:.2f}秒")
+        if warmup_status["error"]:
+            st.error(warmup_status["error"])
+        if warmup_status["step_times"]:
+            st.write("**ステップ別時間（秒）**")
+            st.json({name: round(elapsed, 3) for name, elapsed in warmup_status["step_times"].items()})
+        if warmup_status["import_times"]:
+            st.write("**モジュール別インポート時間（秒）**")
+            st.json({name: round(elapsed, 3) for name, elapsed in warmup_status["import_times"].items()})
+
+def show_profiles():
+    """保存された遅いリクエストのプロファイルを表示"""
+    if not config.PROFILE_ENABLED:
+        return
+    with st.expander("🔬 プロファイル（遅いリクエスト）", expanded=False):
+        profiles = get_profile_store().list_profiles()
+        if not profiles:
+            st.info("まだプロファイルがありません")
+            return
+        
+        labels = [
+            f"{p['captured_at']} {p['name']} ({p['duration_sec']:.2f}秒, {p['mode']}) [{p['request_id']}]"
+            for p in profiles
+        ]
+        selected = st.selectbox("プロファイル", range(len(profiles)), format_func=lambda i: labels[i])
+        profile = profiles[selected]
+        
+        st.write("**ホットな関数（上位）**")
+        rows = []
+        for row in profile["functions"][:15]:
+            location = f"{Path(row['file']).name}:{row['line']}"
+            if profile["mode"] == "cprofile":
+                rows.append({
+                    "関数": row["function"], "場所": location, "呼び出し回数": row["calls"],
+                    "自己時間(秒)": round(row["self_sec"], 4), "累積時間(秒)": round(row["cumulative_sec"], 4)
+                })
+            else:
+                rows.append({
+                    "関数": row["function"], "場所": location,
+                    "自己(%)": round(row["self_pct"], 1), "累積(%)": round(row["total_pct"], 1)
+                })
+        st.dataframe(rows, use_container_width=True)
+
+def show_memory_reports():
+    """処理段階ごとのピークメモリを表示"""
+    if not config.MEMORY_TRACKING:
+        return
+    with st.expander("🧠 メモリ使用量（ピーク）", expanded=False):
+        tracker = get_memory_tracker()
+        summary = tracker.get_peak_summary()
+        if not summary:
+            st.info("まだ計測データがありません")
+            return
+        
+        st.dataframe(
+            [
+                {
+                    "段階": stage,
+                    "回数": entry["runs"],
+                    "最大ピークRSS(MB)": round(entry["max_peak_rss_mb"], 1),
+                    "最大ピークヒープ(MB)": round(entry["max_peak_heap_mb"], 1)
+                }
+                for stage, entry in summary.items()
+            ],
+            use_container_width=True
+        )
+        
+        # 直近の計測で確保量の多かった箇所
+        for report in tracker.get_reports()[:5]:
+            if report["top_allocations"]:
+                st.write(f"**{report['stage']}** の主な確保箇所")
+                st.dataframe(
+                    [
+                        {"場所": a["location"], "増加量(MB)": round(a["size_diff_mb"], 2), "件数": a["count_diff"]}
+                        for a in report["top_allocations"]
+                    ],
+                    use_container_width=True
+                )
+
+def show_session_stats():
+    """画面のセッション数とセッションあたりのメモリを表示"""
+    with st.expander("👥 セッション", expanded=False):
+        stats = get_session_registry().get_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("アクティブ", f"{stats['active']}/{stats['max_sessions']}")
+        with col2:
+            st.metric("RSS/セッション", f"{stats['rss_per_session_mb']:.1f}MB")
+        with col3:
+            st.metric("履歴/セッション", f"{stats['data_per_session_kb']:.1f}KB")
+        with col4:
+            st.metric("破棄/作り直し", f"{stats['evicted_total']}/{stats['rebuilt_total']}")
+        if stats["sessions"]:
+            st.dataframe(
+                [
+                    {
+                        "セッション": session["session_id"][:8],
+                        "無操作(秒)": round(session["idle_sec"]),
+                        "メッセージ数": session["history_messages"],
+                        "推定サイズ(KB)": round(session["data_kb"], 1)
+                    }
+                    for session in stats["sessions"]
+                ],
+                use_container_width=True
+            )
 
 def show_cache_stats():
     """キャッシュ統計を表示"""
-    if st.session_state.chatbot and config.ENABLE_CACHE:
-        cache_stats = st.session_state.chatbot.get_cache_stats()
+    chatbot = get_session_registry().peek(st.session_state.session_id)
+    if chatbot and config.ENABLE_CACHE:
+        cache_stats = chatbot.get_cache_stats()
         if cache_stats:
             st.write("**💾 キャッシュ統計**")
             col1, col2, col3, col4 = st.columns(4)
@@ -100,6 +268,156 @@ def show_cache_stats():
                 st.metric("ヒット率", f"{cache_stats['hit_rate']:.1f}%")
             with col4:
                 st.metric("キャッシュファイル数", cache_stats['cache_files'])
+    
+    query_embedding_stats = get_query_embedding_stats()
+    if query_embedding_stats:
+        st.write("**🧮 質問埋め込みキャッシュ**")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("ヒット数", query_embedding_stats['hits'])
+        with col2:
+            st.metric("ヒット率", f"{query_embedding_stats['hit_rate']:.1f}%")
+        with col3:
+            st.metric("件数", f"{query_embedding_stats['size']}/{query_embedding_stats['max_size']}")
+
+def _build_chatbot() -> NetworkManualChatbot:
+    """現在のバージョンのベクトルストアでチャットボットを作成し、表示用の履歴から会話メモリを復元"""
+    chatbot = NetworkManualChatbot(create_retriever(DocumentProcessor()), model_name=st.session_state.model_name)
+    history = st.session_state.chat_history
+    chatbot.restore_memory([
+        (message["content"], reply["content"])
+        for message, reply in zip(history, history[1:])
+        if message["role"] == "user" and reply["role"] == "assistant"
+    ])
+    return chatbot
+
+def get_chatbot() -> NetworkManualChatbot:
+    """このセッションのチャットボットを取得（無操作で破棄されていれば作り直す）"""
+    if not st.session_state.vectorstore_loaded:
+        return None
+    return get_session_registry().get(st.session_state.session_id, _build_chatbot, st.session_state.chat_history)
+
+def load_chatbot(model_name: str):
+    """現在のバージョンのベクトルストアと model_name でチャットボットを用意（会話履歴は引き継ぐ）"""
+    st.session_state.model_name = model_name
+    st.session_state.vectorstore_loaded = True
+    st.session_state.index_version = get_index_versions().current_version()
+    registry = get_session_registry()
+    chatbot = registry.peek(st.session_state.session_id)
+    if chatbot is not None and chatbot.model_name == model_name:
+        chatbot.retriever = create_retriever(DocumentProcessor())
+        return
+    # モデルが変わった場合は作り直し、会話メモリを引き継ぐ
+    registry.discard(st.session_state.session_id)
+    new_chatbot = get_chatbot()
+    if chatbot is not None:
+        new_chatbot.restore_memory(chatbot.get_chat_history())
+
+def append_history(message: dict):
+    """表示用の履歴に追加（CHAT_HISTORY_MAX_MESSAGES を超えた古いメッセージは破棄）"""
+    st.session_state.message_seq += 1
+    message["id"] = st.session_state.message_seq
+    history = st.session_state.chat_history
+    history.append(message)
+    if len(history) > config.CHAT_HISTORY_MAX_MESSAGES:
+        # SessionRegistry がサイズの見積もりに同じリストを参照しているため、置き換えずに削除する
+        del history[:len(history) - config.CHAT_HISTORY_MAX_MESSAGES]
+
+def show_sources(sources: list):
+    """参照元（ファイル名・ページ・抜粋）を表示"""
+    for i, source in enumerate(sources, 1):
+        st.markdown(f"**{i}. {source['file']}** (ページ: {source['page']})")
+        st.markdown(f"```\n{source['content']}\n```")
+
+def show_chat_history():
+    """表示用の履歴の新しい方から CHAT_HISTORY_PAGE_SIZE 件ずつ表示（参照元は開いたときのみ描画）"""
+    history = st.session_state.chat_history
+    hidden = max(0, len(history) - config.CHAT_HISTORY_PAGE_SIZE * st.session_state.history_pages)
+    if hidden and st.button(f"⬆️ 以前の会話を表示（残り {hidden}件）"):
+        st.session_state.history_pages += 1
+        st.rerun()
+    for message in history[hidden:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            sources = message.get("sources")
+            if sources and st.toggle(f"📄 参照元を表示（{len(sources)}件）", key=f"sources_{message['id']}"):
+                show_sources(sources)
+
+def select_product() -> str:
+    """検索対象の製品を選択（None: 質問から推定 / ALL_PRODUCTS: すべて）"""
+    chatbot = get_chatbot()
+    retriever = chatbot.retriever if chatbot else None
+    products = retriever.products() if hasattr(retriever, "products") else {}
+    if not products:
+        return None
+    options = [None, ALL_PRODUCTS] + sorted(products, key=lambda product: -products[product])
+    labels = {None: "自動（質問から推定）", ALL_PRODUCTS: "すべての製品"}
+    selected = st.selectbox(
+        "🔎 製品で絞り込み",
+        options,
+        format_func=lambda product: labels.get(product) or f"{product_label(product)} ({products[product]}チャンク)",
+        help="選んだ製品のマニュアルだけを検索します。自動の場合は質問に製品名が1つだけ含まれるときに絞り込みます"
+    )
+    return selected
+
+def show_ingestion_job(model_name: str):
+    """インジェストジョブの進捗を表示（実行中は main の最後で再描画する）"""
+    job_id = st.session_state.ingestion_job_id
+    job = get_job_queue().get(job_id) if job_id else None
+    if job is None:
+        return
+    
+    status = job.to_dict()
+    status_labels = {
+        "queued": "⏳ 待機中",
+        "running": "🔄 処理中",
+        "succeeded": "✅ 完了",
+        "failed": "❌ 失敗",
+        "cancelled": "⏹️ キャンセル"
+    }
+    stage_labels = {
+        "remove": "古い内容の削除",
+        "parse": "PDF読み込み",
+        "split": "テキスト分割",
+        "embed": "埋め込み計算",
+        "persist": "書き込み",
+        "activate": "切り替え"
+    }
+    
+    st.write(f"**処理ジョブ** `{status['job_id']}` - {status_labels.get(status['status'], status['status'])}")
+    stage = status["stage"]
+    stage_text = stage_labels.get(stage, stage or "")
+    if stage in status["stages"] and status["stages"][stage].get("total"):
+        stage_text += f" ({status['stages'][stage].get('done', 0)}/{status['stages'][stage]['total']})"
+    st.progress(status["progress"], text=stage_text)
+    
+    with st.expander("ファイル別の進捗"):
+        for file_state in status["files"]:
+            detail = f"{file_state['pages']}ページ"
+            if "pages_per_sec" in file_state:
+                detail += (
+                    f", {file_state['pages_per_sec']}ページ/秒"
+                    f", フォールバック率 {file_state['fallback_rate']:.1%}"
+                )
+            st.write(f"• {file_state['name']}: {file_state['status']} ({detail})")
+    
+    if status["status"] in ("queued", "running"):
+        if status["cancel_requested"]:
+            st.caption("キャンセル要求済み")
+        elif st.button("⏹️ 処理をキャンセル"):
+            get_job_queue().cancel(job_id)
+            st.rerun()
+    elif status["status"] == "succeeded":
+        # 新しいバージョンへの切り替え後、このセッションの検索対象も更新
+        if st.session_state.index_version != status["version"]:
+            load_chatbot(model_name)
+            logger.info(f"マニュアル処理完了 - バージョン: {status['version']}")
+        st.success(
+            f"✅ マニュアルの処理が完了しました！ "
+            f"(処理ファイル数: {len(status['files'])}, 処理済みのためスキップ: {status['skipped_count']})"
+        )
+    elif status["status"] == "failed":
+        st.error(f"❌ 処理エラー: {status['error']}")
 
 def main():
     """メイン関数"""
@@ -168,6 +486,11 @@ def main():
             model_options,
             index=model_options.index(config.MODEL_NAME) if config.MODEL_NAME in model_options else 0
         )
+        if config.MODEL_ROUTING:
+            st.caption(
+                f"用語・コマンドの確認など簡単な質問は {config.ROUTER_SMALL_MODEL} で回答し、"
+                "レート制限・タイムアウト時は他のモデルに切り替えます"
+            )
         
         temperature = st.slider(
             "Temperature（回答の創造性）",
@@ -207,40 +530,37 @@ def main():
             if not st.session_state.api_key_validated:
                 st.error("❌ 有効なAPIキーを入力してください")
             else:
-                with st.spinner("PDFを処理中..."):
+                with st.spinner("ファイルを保存中..."):
                     try:
-                        # アップロードされたファイルを保存
-                        manual_dir = Path("./data/manuals")
-                        manual_dir.mkdir(parents=True, exist_ok=True)
-                        
-                        saved_files = []
-                        for uploaded_file in uploaded_files:
-                            file_path = manual_dir / uploaded_file.name
-                            with open(file_path, "wb") as f:
-                                f.write(uploaded_file.getbuffer())
-                            saved_files.append(file_path.name)
-                            logger.info(f"ファイル保存: {file_path.name}")
-                        
-                        # ドキュメント処理
-                        processor = DocumentProcessor()
-                        vectorstore = processor.process_documents(str(manual_dir))
-                        
-                        # チャットボットの初期化（設定値を反映）
-                        retriever = vectorstore.as_retriever(search_kwargs={"k": config.SEARCH_K})
-                        st.session_state.chatbot = NetworkManualChatbot(
-                            retriever, 
-                            model_name=selected_model
+                        # 内容ハッシュ単位で保存し、未インジェストの内容のみバックグラウンドで処理
+                        job, skipped_count = submit_uploads(
+                            [(uploaded_file.name, uploaded_file) for uploaded_file in uploaded_files]
                         )
-                        st.session_state.vectorstore_loaded = True
-                        
-                        st.success(f"✅ マニュアルの処理が完了しました！ (ファイル数: {len(saved_files)})")
-                        logger.info(f"マニュアル処理完了 - ファイル数: {len(saved_files)}")
+                        if job is None:
+                            load_chatbot(selected_model)
+                            st.success(f"✅ すべて処理済みのマニュアルです (スキップ: {skipped_count})")
+                        else:
+                            st.session_state.ingestion_job_id = job.job_id
+                            logger.info(
+                                f"マニュアル処理ジョブ登録 - ジョブID: {job.job_id}, "
+                                f"ファイル数: {len(job.files)}, スキップ: {skipped_count}"
+                            )
                         
                     except Exception as e:
                         error_msg = f"処理エラー: {str(e)}"
                         st.error(f"❌ {error_msg}")
                         logger.error(error_msg)
         
+        # 処理中・直近のジョブの進捗
+        show_ingestion_job(selected_model)
+        
+        # 他のセッションの処理で新しいバージョンに切り替わった場合も検索対象を更新
+        if (
+            st.session_state.vectorstore_loaded
+            and st.session_state.index_version != get_index_versions().current_version()
+        ):
+            load_chatbot(selected_model)
+        
         st.divider()
         
         # 既存のベクトルストアを読み込む
@@ -259,17 +579,12 @@ def main():
                         elif vectorstore_info["status"] == "error":
                             st.error(f"❌ データ読み込みエラー: {vectorstore_info['error']}")
                         else:
-                            vectorstore = processor.load_vectorstore()
-                            retriever = vectorstore.as_retriever(search_kwargs={"k": config.SEARCH_K})
-                            st.session_state.chatbot = NetworkManualChatbot(
-                                retriever,
-                                model_name=selected_model
-                            )
-                            st.session_state.vectorstore_loaded = True
+                            load_chatbot(selected_model)
                             
                             st.success(
                                 f"✅ データを読み込みました！ "
-                                f"(ドキュメント数: {vectorstore_info['document_count']}, "
+                                f"(ファイル数: {vectorstore_info['file_count']}, "
+                                f"ドキュメント数: {vectorstore_info['document_count']}, "
                                 f"サイズ: {vectorstore_info['size_mb']:.1f}MB)"
                             )
                             logger.info(f"ベクトルストア読み込み完了")
@@ -279,6 +594,11 @@ def main():
                     st.error(f"❌ {error_msg}")
                     logger.error(error_msg)
         
+        # 検索対象の製品
+        selected_product = None
+        if st.session_state.vectorstore_loaded:
+            selected_product = select_product()
+        
         # 管理機能
         if st.session_state.vectorstore_loaded:
             st.divider()
@@ -287,21 +607,28 @@ def main():
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("🗑️ 会話履歴をクリア"):
-                    if st.session_state.chatbot:
-                        st.session_state.chatbot.clear_memory()
-                    st.session_state.chat_history = []
+                    chatbot = get_session_registry().peek(st.session_state.session_id)
+                    if chatbot:
+                        chatbot.clear_memory()
+                    st.session_state.chat_history.clear()
+                    st.session_state.history_pages = 1
                     st.rerun()
             
             with col2:
                 if st.button("💾 キャッシュをクリア") and config.ENABLE_CACHE:
-                    if st.session_state.chatbot:
-                        st.session_state.chatbot.clear_cache()
+                    chatbot = get_chatbot()
+                    if chatbot:
+                        chatbot.clear_cache()
                     st.success("キャッシュをクリアしました")
         
         # システム情報の表示
         if config.DEBUG:
             st.divider()
             show_performance_stats()
+            show_warmup_status()
+            show_profiles()
+            show_memory_reports()
+            show_session_stats()
             show_cache_stats()
     
     # メインコンテンツ
@@ -334,14 +661,7 @@ def main():
             """)
     else:
         # チャット履歴の表示
-        for message in st.session_state.chat_history:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
-                if "sources" in message and message["sources"]:
-                    with st.expander("📄 参照元を表示"):
-                        for i, source in enumerate(message["sources"], 1):
-                            st.markdown(f"**{i}. {source['file']}** (ページ: {source['page']})")
-                            st.markdown(f"```\n{source['content']}\n```")
+        show_chat_history()
         
         # ユーザー入力
         if prompt := st.chat_input("質問を入力してください..."):
@@ -353,28 +673,36 @@ def main():
             # ユーザーメッセージを表示
             with st.chat_message("user"):
                 st.markdown(prompt)
-            st.session_state.chat_history.append({"role": "user", "content": prompt})
+            append_history({"role": "user", "content": prompt})
             
             # アシスタントの回答を生成
             with st.chat_message("assistant"):
                 with st.spinner("回答を生成中..."):
                     try:
                         start_time = time.time()
-                        answer, sources = st.session_state.chatbot.ask(prompt)
+                        # ログ・トレース・プロファイルを同じリクエストIDで関連付ける
+                        chatbot = get_chatbot()
+                        with request_context() as request_id:
+                            answer, sources = chatbot.ask(prompt, product=selected_product)
                         processing_time = time.time() - start_time
                         
                         st.markdown(answer)
+                        if chatbot.last_product:
+                            st.caption(f"🔎 検索した製品: {product_label(chatbot.last_product)}")
                         
                         # 処理時間とメタ情報の表示
                         if config.DEBUG:
-                            st.caption(f"⏱️ 処理時間: {processing_time:.2f}秒 | 📄 参照元数: {len(sources)}")
+                            route = chatbot.last_route or {}
+                            st.caption(
+                                f"⏱️ 処理時間: {processing_time:.2f}秒 | 📄 参照元数: {len(sources)} | "
+                                f"🤖 モデル: {route.get('model', '-')} ({route.get('route') or '固定'}) | "
+                                f"🔖 リクエストID: {request_id}"
+                            )
                         
                         # ソース情報を表示
                         if sources:
                             with st.expander("📄 参照元を表示"):
-                                for i, source in enumerate(sources, 1):
-                                    st.markdown(f"**{i}. {source['file']}** (ページ: {source['page']})")
-                                    st.markdown(f"```\n{source['content']}\n```")
+                                show_sources(sources)
                         else:
                             st.info("ℹ️ 関連する文書が見つかりませんでした")
                         
@@ -389,7 +717,7 @@ def main():
                         sources = []
             
             # 履歴に追加
-            st.session_state.chat_history.append({
+            append_history({
                 "role": "assistant",
                 "content": answer,
                 "sources": sources
@@ -437,6 +765,14 @@ def show_footer():
                 }
             })
 
+def poll_ingestion_job():
+    """ジョブの実行中は一定間隔で再描画して進捗を更新"""
+    job_id = st.session_state.get("ingestion_job_id")
+    job = get_job_queue().get(job_id) if job_id else None
+    if job is not None and job.status in ("queued", "running"):
+        time.sleep(INGESTION_POLL_INTERVAL_SEC)
+        st.rerun()
+
 if __name__ == "__main__":
     try:
         main()
@@ -445,4 +781,6 @@ if __name__ == "__main__":
         st.error(f"❌ アプリケーションエラー: {str(e)}")
         logger.error(f"アプリケーションエラー: {str(e)}")
         st.info("📋 詳細なエラー情報はログファイルを確認してください")
+    
+    poll_ingestion_job()
 
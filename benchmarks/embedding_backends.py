@@ -0,0 +1,142 @@
+"""埋め込みバックエンドのベンチマーク
+
+各バックエンド（torch / onnx / onnx-int8）を別プロセスで読み込み、
+チャンク/秒・RSS・PyTorch版とのコサイン類似度を計測する。
+
+使い方:
+    python benchmarks/embedding_backends.py --chunks 2000 --batch-size 32 --threads 4
+    python benchmarks/embedding_backends.py --pdf-dir ./data/manuals --backends torch onnx-int8
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+from typing import List, Dict, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+SAMPLE_LINES = [
+    "interface GigabitEthernet0/{n}",
+    " description uplink-{n}",
+    " ip address 10.{n}.0.1 255.255.255.0",
+    "router ospf {n}",
+    " network 10.{n}.0.0 0.0.0.255 area 0",
+    "VRRPグループ{n}の優先度を設定し、プリエンプトを有効にします。",
+    "show ip bgp summary でネイバー{n}の状態を確認してください。",
+]
+
+def build_synthetic_chunks(count: int, chunk_size: int) -> List[str]:
+    """ネットワークマニュアル風の合成チャンクを生成"""
+    chunks = []
+    for i in range(count):
+        text = ""
+        n = 0
+        while len(text) < chunk_size:
+            text += SAMPLE_LINES[n % len(SAMPLE_LINES)].format(n=i + n) + "\n"
+            n += 1
+        chunks.append(text[:chunk_size])
+    return chunks
+
+def load_pdf_chunks(pdf_dir: str, limit: int) -> List[str]:
+    """PDFディレクトリから実チャンクを読み込み"""
+    from src.document_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    documents = []
+    for pdf_file in sorted(Path(pdf_dir).glob("*.pdf")):
+        documents.extend(processor.load_pdf(str(pdf_file)))
+        if len(documents) >= limit:
+            break
+    split_docs = processor.text_splitter.split_documents(documents)
+    return [doc.page_content for doc in split_docs[:limit]]
+
+def _run_backend(backend: str, chunks: List[str], batch_size: int, threads: int, queue):
+    """1バックエンドを計測（子プロセスで実行）"""
+    import psutil
+    from src.embeddings import SentenceTransformerEmbeddings, check_compatibility
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss / 1024 / 1024
+
+    load_start = time.perf_counter()
+    embeddings = SentenceTransformerEmbeddings(backend=backend, batch_size=batch_size, num_threads=threads)
+    load_time = time.perf_counter() - load_start
+
+    # 初回呼び出しのオーバーヘッドを除外
+    embeddings.embed_documents(chunks[:batch_size])
+
+    embed_start = time.perf_counter()
+    embeddings.embed_documents(chunks)
+    embed_time = time.perf_counter() - embed_start
+
+    rss_after = process.memory_info().rss / 1024 / 1024
+
+    compatibility = None
+    if backend != "torch":
+        reference = SentenceTransformerEmbeddings(backend="torch", batch_size=batch_size, num_threads=threads)
+        compatibility = check_compatibility(embeddings, reference, texts=chunks[:64])
+
+    queue.put({
+        "backend": backend,
+        "chunks": len(chunks),
+        "load_time_sec": load_time,
+        "embed_time_sec": embed_time,
+        "chunks_per_sec": len(chunks) / embed_time if embed_time > 0 else 0.0,
+        "rss_before_mb": rss_before,
+        "rss_after_mb": rss_after,
+        "compatibility": compatibility
+    })
+
+def run_benchmark(backends: List[str], chunks: List[str], batch_size: int, threads: int) -> List[Dict[str, Any]]:
+    """各バックエンドを独立したプロセスで計測"""
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for backend in backends:
+        queue = context.Queue()
+        process = context.Process(target=_run_backend, args=(backend, chunks, batch_size, threads, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0 or queue.empty():
+            results.append({"backend": backend, "error": f"終了コード {process.exitcode}"})
+            continue
+        results.append(queue.get())
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="埋め込みバックエンドのベンチマーク")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--chunks", type=int, default=1000, help="計測するチャンク数")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="合成チャンクの文字数")
+    parser.add_argument("--pdf-dir", default=None, help="実際のPDFからチャンクを作成する場合のディレクトリ")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0, help="intra-opスレッド数（0: 既定）")
+    parser.add_argument("--output", default=None, help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    if args.pdf_dir:
+        chunks = load_pdf_chunks(args.pdf_dir, args.chunks)
+    else:
+        chunks = build_synthetic_chunks(args.chunks, args.chunk_size)
+
+    results = run_benchmark(args.backends, chunks, args.batch_size, args.threads)
+
+    print(f"{'backend':<10} {'chunks/s':>10} {'RSS(MB)':>10} {'load(s)':>8} {'min cos':>8}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:<10} エラー: {result['error']}")
+            continue
+        min_cos = result["compatibility"]["min_similarity"] if result["compatibility"] else 1.0
+        print(
+            f"{result['backend']:<10} {result['chunks_per_sec']:>10.1f} "
+            f"{result['rss_after_mb']:>10.1f} {result['load_time_sec']:>8.2f} {min_cos:>8.4f}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""Groq API互換のローカルサーバー（負荷試験用）
+
+OpenAI形式の chat completions（通常・ストリーミング）を返し、最初のトークンまでの遅延・
+トークン生成速度・429/5xxエラーの注入を設定できる。Groqの利用枠を消費せず、オフラインで
+NetworkManualChatbot の再試行・モデル切り替え・期限の動作を確認するために使う。
+
+使い方:
+    python benchmarks/fake_groq_server.py --port 8090 --latency-ms 300 --tokens-per-sec 200 --rate-limit-ratio 0.1
+    GROQ_BASE_URL=http://127.0.0.1:8090 GROQ_API_KEY=fake streamlit run app.py
+
+エンドポイント:
+    POST /openai/v1/chat/completions
+    GET  /openai/v1/models
+    GET  /stats          受け付けたリクエスト数・注入したエラー数
+    POST /stats/reset
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+# 回答として返す文（トークン数に達するまで繰り返す）
+ANSWER_TOKENS = (
+    "【概要】 VRRP の 優先度 を 設定 します 。\n"
+    "1. 設定 モード に 入り ます : configure terminal\n"
+    "2. インターフェース を 選択 します : interface GigabitEthernet0/1\n"
+    "3. 優先度 を 設定 します : vrrp 1 priority 110\n"
+    "【注意点】 プリエンプト が 無効 の 場合 は 切り替わり ません 。\n"
+).split(" ")
+
+class FakeGroqServer:
+    """Groq API の chat completions を模擬するサーバー"""
+
+    def __init__(
+        self,
+        latency_ms: float = 200.0,
+        jitter_ms: float = 50.0,
+        tokens_per_sec: float = 300.0,
+        answer_tokens: int = 120,
+        rate_limit_ratio: float = 0.0,
+        error_ratio: float = 0.0,
+        rpm: int = 0,
+        retry_after_sec: float = 1.0,
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.answer_tokens = answer_tokens
+        self.rate_limit_ratio = rate_limit_ratio
+        self.error_ratio = error_ratio
+        self.rpm = rpm
+        self.retry_after_sec = retry_after_sec
+        self.random = random.Random(seed)
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats: Dict[str, Any] = {
+            "requests": 0,
+            "completed": 0,
+            "streamed": 0,
+            "rate_limited": 0,
+            "server_errors": 0,
+            "completion_tokens": 0,
+            "by_model": {}
+        }
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/openai/v1/chat/completions", self.handle_chat_completions)
+        app.router.add_get("/openai/v1/models", self.handle_models)
+        app.router.add_get("/stats", self.handle_stats)
+        app.router.add_post("/stats/reset", self.handle_reset)
+        return app
+
+    def _rate_limited(self) -> Optional[float]:
+        """429を返す場合は Retry-After の秒数、返さない場合はNone"""
+        if self.rpm > 0:
+            now = time.monotonic()
+            if now - self._window_start >= 60.0:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            if self._window_count > self.rpm:
+                return max(0.0, 60.0 - (now - self._window_start))
+        if self.random.random() < self.rate_limit_ratio:
+            return self.retry_after_sec
+        return None
+
+    @staticmethod
+    def _error_response(status: int, message: str, error_type: str, code: str = None, headers: dict = None):
+        error = {"message": message, "type": error_type}
+        if code:
+            error["code"] = code
+        return web.json_response({"error": error}, status=status, headers=headers)
+
+    def _answer(self) -> List[str]:
+        return [ANSWER_TOKENS[i % len(ANSWER_TOKENS)] + " " for i in range(self.answer_tokens)]
+
+    def _first_token_delay(self) -> float:
+        return max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    async def handle_chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "unknown")
+        self.stats["requests"] += 1
+        self.stats["by_model"][model] = self.stats["by_model"].get(model, 0) + 1
+
+        retry_after = self._rate_limited()
+        if retry_after is not None:
+            self.stats["rate_limited"] += 1
+            return self._error_response(
+                429, f"Rate limit reached for model `{model}` (fake server)", "tokens", "rate_limit_exceeded",
+                headers={"retry-after": f"{retry_after:.0f}"}
+            )
+        if self.random.random() < self.error_ratio:
+            self.stats["server_errors"] += 1
+            status = self.random.choice((500, 503))
+            return self._error_response(status, "Internal Server Error (fake server)", "internal_server_error")
+
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 2
+        tokens = self._answer()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)
+        }
+        await asyncio.sleep(self._first_token_delay())
+
+        if not body.get("stream"):
+            if self.tokens_per_sec > 0:
+                await asyncio.sleep(len(tokens) / self.tokens_per_sec)
+            self.stats["completed"] += 1
+            self.stats["completion_tokens"] += len(tokens)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "logprobs": None,
+                    "finish_reason": "stop"
+                }],
+                "usage": usage,
+                "system_fingerprint": "fp_fake",
+                "x_groq": {"id": f"req_{uuid.uuid4().hex}"}
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None, extra: dict = None) -> bytes:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "system_fingerprint": "fp_fake",
+                "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}]
+            }
+            if extra:
+                payload.update(extra)
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        await response.write(chunk({"role": "assistant", "content": ""}))
+        interval = 1.0 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+        for token in tokens:
+            await response.write(chunk({"content": token}))
+            if interval:
+                await asyncio.sleep(interval)
+        await response.write(chunk({}, "stop", {"x_groq": {"id": f"req_{uuid.uuid4().hex}", "usage": usage}}))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        self.stats["streamed"] += 1
+        self.stats["completion_tokens"] += len(tokens)
+        return response
+
+    async def handle_models(self, request: web.Request) -> web.Response:
+        models = sorted(self.stats["by_model"]) or ["llama3-70b-8192", "llama3-8b-8192"]
+        return web.json_response({
+            "object": "list",
+            "data": [{"id": model, "object": "model", "owned_by": "fake"} for model in models]
+        })
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    async def handle_reset(self, request: web.Request) -> web.Response:
+        self.reset_stats()
+        return web.json_response(self.stats)
+
+def start_in_thread(server: FakeGroqServer, host: str = "127.0.0.1", port: int = 0) -> str:
+    """別スレッドのイベントループでサーバーを起動し、接続先のURLを返す"""
+    ready = threading.Event()
+    address: Dict[str, Any] = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(server.create_app())
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, host, port)
+        loop.run_until_complete(site.start())
+        address["port"] = runner.addresses[0][1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="fake-groq-server", daemon=True).start()
+    if not ready.wait(timeout=10):
+        raise RuntimeError("模擬Groqサーバーを起動できませんでした")
+    return f"http://{host}:{address['port']}"
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """サーバーの動作を調整する引数（load_test.py と共通）"""
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="最初のトークンまでの遅延")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="遅延のばらつき（±）")
+    parser.add_argument("--tokens-per-sec", type=float, default=300.0, help="トークンの生成速度（0で待機なし）")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="回答のトークン数")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="429を返す割合")
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="500/503を返す割合")
+    parser.add_argument("--rpm", type=int, default=0, help="1分あたりのリクエスト上限（超過分は429、0で無制限）")
+    parser.add_argument("--retry-after-sec", type=float, default=1.0, help="--rate-limit-ratio の429に付ける Retry-After")
+    parser.add_argument("--seed", type=int, default=None)
+
+def server_from_arguments(args: argparse.Namespace) -> FakeGroqServer:
+    return FakeGroqServer(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        answer_tokens=args.answer_tokens,
+        rate_limit_ratio=args.rate_limit_ratio,
+        error_ratio=args.error_ratio,
+        rpm=args.rpm,
+        retry_after_sec=args.retry_after_sec,
+        seed=args.seed
+    )
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Groq API互換のローカルサーバー（負荷試験用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    print(f"模擬Groqサーバー起動 - GROQ_BASE_URL=http://{args.host}:{args.port}")
+    web.run_app(server_from_arguments(args).create_app(), host=args.host, port=args.port, print=None)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""インジェストのスループットベンチマーク
+
+合成マニュアル（synthetic_pdf.py）または指定したPDFを、インジェストと同じ処理で段階ごとに実行し、
+各段階の処理時間・ページ/秒・チャンク/秒・ピークRSSを計測する。
+結果はJSONで保存し、--baseline で以前の結果と比較して退行を検出する（退行があれば終了コード1）。
+
+段階: parse（PDF抽出） → clean（_clean_text） → split（テキスト分割） → embed（埋め込み） → persist（Chroma書き込み）
+
+使い方:
+    python benchmarks/ingestion_benchmark.py --pages 200 --files 2 --layout mixed --output baseline.json
+    python benchmarks/ingestion_benchmark.py --pages 200 --files 2 --baseline baseline.json --tolerance 0.15
+    python benchmarks/ingestion_benchmark.py --pdf-dir ./data/manuals --output real_manuals.json
+"""
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Dict, Any, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from synthetic_pdf import LAYOUTS, generate_manuals
+
+STAGES = ("parse", "clean", "split", "embed", "persist")
+
+def run_stage(func: Callable[[], Any], interval: float) -> Tuple[Any, Dict[str, Any]]:
+    """1段階を実行し、(結果, 処理時間とピークRSS) を返す"""
+    from src.memory_tracking import MemorySampler
+
+    sampler = MemorySampler(interval)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+    finally:
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+    return result, {
+        "sec": elapsed,
+        "peak_rss_mb": sampler.peak_rss / 1024 / 1024,
+        "rss_growth_mb": (sampler.peak_rss - sampler.start_rss) / 1024 / 1024
+    }
+
+def run_benchmark(pdf_files: List[Path], embed_batch_size: int, interval: float) -> Dict[str, Any]:
+    """PDFをインジェストと同じ処理で段階ごとに実行"""
+    from config import config
+    from src.document_processor import INSERT_BATCH_SIZE, DocumentProcessor, _directory_size
+    from src.ingestion_checkpoint import chunk_id
+    from src.lazy_imports import lazy_import
+    from src.pdf_extraction import get_extraction_engine
+
+    setup_start = time.perf_counter()
+    processor = DocumentProcessor(persist_directory=tempfile.mkdtemp(prefix="ingestion_benchmark_"))
+    embeddings = processor.embeddings
+    Document = lazy_import("langchain_core.documents").Document
+    Chroma = lazy_import("langchain_community.vectorstores").Chroma
+    setup_time = time.perf_counter() - setup_start
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    def parse():
+        extracted = []
+        for pdf_file in pdf_files:
+            pages, stats = get_extraction_engine().extract(str(pdf_file))
+            extracted.append((pdf_file.name, pages, stats))
+        return extracted
+
+    extracted, stages["parse"] = run_stage(parse, interval)
+    page_count = sum(len(pages) for _, pages, _ in extracted)
+    fallback_pages = sum(stats["fallback_pages"] for _, _, stats in extracted)
+    stages["parse"].update({
+        "pages": page_count,
+        "pages_per_sec": page_count / stages["parse"]["sec"] if stages["parse"]["sec"] > 0 else 0.0,
+        "fallback_rate": fallback_pages / page_count if page_count else 0.0
+    })
+
+    def clean():
+        documents = []
+        for file_name, pages, _ in extracted:
+            for page in pages:
+                content = processor._clean_text(page["text"]) if page["text"].strip() else ""
+                if content.strip():
+                    documents.append(Document(
+                        page_content=content,
+                        metadata={"source": file_name, "file_name": file_name, "page": page["index"] + 1}
+                    ))
+        return documents
+
+    documents, stages["clean"] = run_stage(clean, interval)
+    stages["clean"]["pages_per_sec"] = page_count / stages["clean"]["sec"] if stages["clean"]["sec"] > 0 else 0.0
+
+    chunks, stages["split"] = run_stage(lambda: processor.text_splitter.split_documents(documents), interval)
+    texts = [chunk.page_content for chunk in chunks]
+    stages["split"].update({
+        "chunks": len(chunks),
+        "chunks_per_sec": len(chunks) / stages["split"]["sec"] if stages["split"]["sec"] > 0 else 0.0
+    })
+
+    # 初回呼び出しのオーバーヘッドを除外
+    embeddings.embed_documents(texts[:embed_batch_size])
+
+    def embed():
+        vectors = []
+        for start in range(0, len(texts), embed_batch_size):
+            vectors.extend(embeddings.embed_documents(texts[start:start + embed_batch_size]))
+        return vectors
+
+    vectors, stages["embed"] = run_stage(embed, interval)
+    stages["embed"]["chunks_per_sec"] = len(texts) / stages["embed"]["sec"] if stages["embed"]["sec"] > 0 else 0.0
+
+    def persist():
+        vectorstore = Chroma(persist_directory=processor.persist_directory, embedding_function=embeddings)
+        for start in range(0, len(chunks), INSERT_BATCH_SIZE):
+            batch = chunks[start:start + INSERT_BATCH_SIZE]
+            vectorstore._collection.upsert(
+                ids=[chunk_id(chunk.metadata["file_name"], start + i) for i, chunk in enumerate(batch)],
+                embeddings=vectors[start:start + INSERT_BATCH_SIZE],
+                metadatas=[chunk.metadata for chunk in batch],
+                documents=texts[start:start + INSERT_BATCH_SIZE]
+            )
+
+    _, stages["persist"] = run_stage(persist, interval)
+    stages["persist"].update({
+        "chunks_per_sec": len(chunks) / stages["persist"]["sec"] if stages["persist"]["sec"] > 0 else 0.0,
+        "index_size_mb": _directory_size(Path(processor.persist_directory)) / 1024 / 1024
+    })
+    shutil.rmtree(processor.persist_directory, ignore_errors=True)
+
+    total_sec = sum(stage["sec"] for stage in stages.values())
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor()
+        },
+        "settings": {
+            "files": len(pdf_files),
+            "pages": page_count,
+            "chunk_size": config.CHUNK_SIZE,
+            "chunk_overlap": config.CHUNK_OVERLAP,
+            "embedding_model": getattr(embeddings, "model_name", config.EMBEDDING_MODEL),
+            "embedding_backend": getattr(embeddings, "backend", config.EMBEDDING_BACKEND),
+            "embed_batch_size": embed_batch_size,
+            "pdf_primary_extractor": config.PDF_PRIMARY_EXTRACTOR,
+            "pdf_fallback_extractor": config.PDF_FALLBACK_EXTRACTOR
+        },
+        "setup_sec": setup_time,
+        "stages": stages,
+        "total": {
+            "sec": total_sec,
+            "pages_per_sec": page_count / total_sec if total_sec > 0 else 0.0,
+            "chunks_per_sec": len(chunks) / total_sec if total_sec > 0 else 0.0,
+            "peak_rss_mb": max(stage["peak_rss_mb"] for stage in stages.values())
+        }
+    }
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, memory_tolerance: float) -> List[Dict[str, Any]]:
+    """段階ごとに以前の結果と比較（処理時間・ピークRSSが許容範囲を超えて増えたものを退行とする）"""
+    rows = []
+    for stage in STAGES + ("total",):
+        current = result["stages"].get(stage) if stage != "total" else result["total"]
+        previous = baseline.get("stages", {}).get(stage) if stage != "total" else baseline.get("total")
+        if not current or not previous or previous.get("sec", 0) <= 0:
+            continue
+        time_ratio = current["sec"] / previous["sec"]
+        memory_ratio = current["peak_rss_mb"] / previous["peak_rss_mb"] if previous.get("peak_rss_mb") else 1.0
+        rows.append({
+            "stage": stage,
+            "baseline_sec": previous["sec"],
+            "current_sec": current["sec"],
+            "time_ratio": time_ratio,
+            "baseline_peak_rss_mb": previous.get("peak_rss_mb"),
+            "current_peak_rss_mb": current["peak_rss_mb"],
+            "memory_ratio": memory_ratio,
+            "regression": time_ratio > 1 + tolerance or memory_ratio > 1 + memory_tolerance
+        })
+    return rows
+
+def print_report(result: Dict[str, Any]):
+    settings = result["settings"]
+    print(
+        f"ファイル: {settings['files']} / ページ: {settings['pages']} / "
+        f"チャンク: {result['stages']['split']['chunks']} | 準備（モデル読み込み）: {result['setup_sec']:.1f}秒"
+    )
+    print(f"{'stage':<8} {'sec':>8} {'pages/s':>9} {'chunks/s':>9} {'peak RSS':>9} {'RSS +':>7}")
+    for stage in STAGES:
+        data = result["stages"][stage]
+        pages_per_sec = f"{data['pages_per_sec']:.1f}" if "pages_per_sec" in data else "-"
+        chunks_per_sec = f"{data['chunks_per_sec']:.1f}" if "chunks_per_sec" in data else "-"
+        print(
+            f"{stage:<8} {data['sec']:>8.2f} {pages_per_sec:>9} {chunks_per_sec:>9} "
+            f"{data['peak_rss_mb']:>8.0f}M {data['rss_growth_mb']:>6.0f}M"
+        )
+    total = result["total"]
+    print(
+        f"{'total':<8} {total['sec']:>8.2f} {total['pages_per_sec']:>9.1f} {total['chunks_per_sec']:>9.1f} "
+        f"{total['peak_rss_mb']:>8.0f}M"
+    )
+    print(f"PDF抽出のフォールバック率: {result['stages']['parse']['fallback_rate']:.1%}")
+
+def print_comparison(rows: List[Dict[str, Any]], baseline: Dict[str, Any], result: Dict[str, Any]):
+    if baseline.get("settings") != result["settings"]:
+        print("\n⚠️ ベースラインと設定（ページ数・チャンク設定・モデルなど）が異なります。比較は参考値です")
+    print(f"\nベースライン比較（{baseline.get('created_at', '-')}）")
+    print(f"{'stage':<8} {'base(s)':>8} {'now(s)':>8} {'time':>7} {'RSS':>7}")
+    for row in rows:
+        mark = "  ← 退行" if row["regression"] else ""
+        print(
+            f"{row['stage']:<8} {row['baseline_sec']:>8.2f} {row['current_sec']:>8.2f} "
+            f"{row['time_ratio'] - 1:>+7.1%} {row['memory_ratio'] - 1:>+7.1%}{mark}"
+        )
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="インジェストのスループットベンチマーク")
+    parser.add_argument("--pdf-dir", default=None, help="合成PDFの代わりに使うPDFのディレクトリ")
+    parser.add_argument("--files", type=int, default=1, help="合成PDFのファイル数")
+    parser.add_argument("--pages", type=int, default=100, help="合成PDF1ファイルあたりのページ数")
+    parser.add_argument("--layout", choices=LAYOUTS, default="mixed", help="合成PDFのレイアウト")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embed-batch-size", type=int, default=256, help="embed_documents 1回あたりのチャンク数")
+    parser.add_argument("--sample-interval-ms", type=float, default=20.0, help="RSSの読み取り間隔")
+    parser.add_argument("--output", default=None, help="結果を保存するJSONファイル（次回の --baseline に使う）")
+    parser.add_argument("--baseline", default=None, help="比較する以前の結果（JSON）")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="処理時間の増加の許容割合")
+    parser.add_argument("--memory-tolerance", type=float, default=0.1, help="ピークRSSの増加の許容割合")
+    args = parser.parse_args()
+
+    if args.pdf_dir:
+        pdf_files = sorted(Path(args.pdf_dir).glob("*.pdf"))
+        if not pdf_files:
+            print(f"PDFファイルがありません: {args.pdf_dir}")
+            return 1
+        result = run_benchmark(pdf_files, args.embed_batch_size, args.sample_interval_ms / 1000)
+        result["settings"]["source"] = str(args.pdf_dir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="synthetic_manuals_") as pdf_dir:
+            generate_manuals(pdf_dir, args.files, args.pages, args.layout, args.seed)
+            result = run_benchmark(sorted(Path(pdf_dir).glob("*.pdf")), args.embed_batch_size, args.sample_interval_ms / 1000)
+        result["settings"]["source"] = f"synthetic:{args.layout}:seed={args.seed}"
+
+    print_report(result)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(result, baseline, args.tolerance, args.memory_tolerance)
+        print_comparison(rows, baseline, result)
+        result["comparison"] = {"baseline": args.baseline, "stages": rows}
+        if any(row["regression"] for row in rows):
+            exit_code = 1
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
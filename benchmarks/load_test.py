@@ -0,0 +1,267 @@
+"""NetworkManualChatbot のエンドツーエンド負荷試験
+
+模擬Groqサーバー（fake_groq_server.py）に接続し、複数スレッドから ask / ask_stream を同時に呼び出して
+スループット・レイテンシのパーセンタイル・再試行/モデル切り替えの回数・キャッシュの効果を計測する。
+APIサーバーと同じく、LLMクライアント・モデルの振り分け・回答キャッシュは全セッションで共有し、
+会話履歴のみセッションごとに持つ。既定では検索も合成の文書を返すため、ネットワークなしで実行できる。
+
+使い方:
+    python benchmarks/load_test.py --concurrency 16 --requests 400
+    python benchmarks/load_test.py --concurrency 32 --rate-limit-ratio 0.2 --deadline-sec 5 --stream
+    python benchmarks/load_test.py --retriever index --repeat-ratio 0.5    # 作成済みのベクトルストアで検索
+    python benchmarks/load_test.py --base-url http://127.0.0.1:8090         # 別プロセスの模擬サーバーを使う
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_groq_server import add_server_arguments, server_from_arguments, start_in_thread
+
+QUESTIONS = [
+    "VRRPの設定手順を教えてください",
+    "BGPの基本設定方法は？",
+    "show コマンドの使い方を説明してください",
+    "OSPFのエリア設計のポイントは？",
+    "VLANのトランク設定方法",
+    "ACLでSSHのみ許可するには？",
+    "HSRPとVRRPの違いは？",
+    "スパニングツリーのルートブリッジを固定する方法",
+    "LACPとは？",
+    "NTPのデフォルトのポート番号は？",
+]
+
+# 合成の検索結果（--retriever synthetic）
+SYNTHETIC_EXCERPT = (
+    "VRRPグループ{n}の優先度を設定するには、インターフェース設定モードで vrrp {n} priority 110 を実行します。\n"
+    "プリエンプトが有効な場合、優先度の高いルーターがマスターに切り替わります。\n"
+    "show vrrp brief で状態を確認してください。"
+)
+
+def create_synthetic_retriever(k: int, delay_sec: float):
+    """固定の抜粋を返す検索器（埋め込みモデル・ベクトルストアを使わない）"""
+    from langchain_core.documents import Document
+    from langchain_core.retrievers import BaseRetriever
+
+    class SyntheticRetriever(BaseRetriever):
+        k: int = 4
+        delay_sec: float = 0.0
+
+        def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+            if self.delay_sec:
+                time.sleep(self.delay_sec)
+            return [
+                Document(
+                    page_content=SYNTHETIC_EXCERPT.format(n=i + 1),
+                    metadata={"file_name": "synthetic_manual.pdf", "page": i + 1}
+                )
+                for i in range(self.k)
+            ]
+
+    return SyntheticRetriever(k=k, delay_sec=delay_sec)
+
+def _metric_values(samples: Dict[str, float], name: str) -> Dict[str, float]:
+    """メトリクス名に一致するサンプルを {ラベル: 値} で返す（ラベルなしは空文字）"""
+    values = {}
+    for sample, value in samples.items():
+        match = re.fullmatch(re.escape(name) + r"(?:\{(.*)\})?", sample)
+        if match:
+            values[match.group(1) or ""] = value
+    return values
+
+def _fetch_json(url: str) -> Optional[Dict[str, Any]]:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except Exception:
+        return None
+
+def run_load(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    """設定を読み込んでから同時に質問し、結果を集計"""
+    # 設定はインポート時に環境変数から読まれるため、先に接続先を設定する
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    os.environ["LLM_STUB"] = "false"
+    os.environ["ENABLE_CACHE"] = "false" if args.no_cache else "true"
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="load_test_cache_")
+
+    from config import config
+    from src.cache import SimpleCache
+    from src.chatbot import NetworkManualChatbot, create_llm
+    from src.metrics import get_metrics_registry, parse_metrics
+    from src.model_router import ModelRouter, get_llm
+    from src.performance import _percentile
+
+    if args.retriever == "index":
+        from src.retrieval import create_retriever
+        retriever = create_retriever()
+    else:
+        retriever = create_synthetic_retriever(config.SEARCH_K, args.retrieval_ms / 1000)
+
+    router = ModelRouter(config.MODEL_NAME) if config.MODEL_ROUTING else None
+    llm = get_llm(config.MODEL_NAME) if router else create_llm(config.MODEL_NAME, max_retries=0)
+    cache = None if args.no_cache else SimpleCache(cache_dir=cache_dir)
+
+    latencies: List[float] = []
+    first_token_latencies: List[float] = []
+    stream_errors = 0
+    lock = threading.Lock()
+    next_request = iter(range(args.requests))
+
+    def take_request() -> Optional[int]:
+        with lock:
+            return next(next_request, None)
+
+    def worker(thread_index: int):
+        nonlocal stream_errors
+        rng = random.Random(thread_index if args.seed is None else args.seed + thread_index)
+        chatbot = None
+        asked = 0
+        while True:
+            request_index = take_request()
+            if request_index is None:
+                break
+            # セッションを --questions-per-session 件ごとに新しくする（2問目以降は言い換えが入る）
+            if chatbot is None or asked >= args.questions_per_session:
+                chatbot = NetworkManualChatbot(
+                    retriever, model_name=config.MODEL_NAME, llm=llm, cache=cache, router=router
+                )
+                asked = 0
+            asked += 1
+            if rng.random() < args.repeat_ratio:
+                question = rng.choice(QUESTIONS)
+            else:
+                question = f"{rng.choice(QUESTIONS)} (ケース{request_index})"
+
+            start = time.perf_counter()
+            first_token = None
+            failed = False
+            if args.stream:
+                for event in chatbot.ask_stream(question, deadline_sec=args.deadline_sec):
+                    if event["type"] == "token" and first_token is None:
+                        first_token = time.perf_counter() - start
+                    elif event["type"] == "error":
+                        failed = True
+            else:
+                chatbot.ask(question, deadline_sec=args.deadline_sec)
+            elapsed = time.perf_counter() - start
+
+            with lock:
+                latencies.append(elapsed)
+                if first_token is not None:
+                    first_token_latencies.append(first_token)
+                if failed:
+                    stream_errors += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - wall_start
+
+    samples = parse_metrics(get_metrics_registry().render())
+    outcomes = _metric_values(samples, "chatbot_requests_total")
+    duration_sums = _metric_values(samples, "chatbot_request_duration_seconds_sum")
+    duration_counts = _metric_values(samples, "chatbot_request_duration_seconds_count")
+    server_stats = _fetch_json(f"{base_url}/stats")
+
+    latencies.sort()
+    first_token_latencies.sort()
+    result = {
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "stream": args.stream,
+        "wall_time_sec": wall_time,
+        "throughput_rps": len(latencies) / wall_time if wall_time > 0 else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p90_ms": _percentile(latencies, 90) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "outcomes": {
+            labels: {
+                "count": count,
+                "mean_ms": duration_sums.get(labels, 0.0) / duration_counts[labels] * 1000
+                if duration_counts.get(labels) else None
+            }
+            for labels, count in outcomes.items()
+        },
+        "retries": _metric_values(samples, "chatbot_llm_retries_total"),
+        "rate_limit_wait_sec": sum(_metric_values(samples, "chatbot_rate_limit_wait_seconds_total").values()),
+        "model_fallbacks": _metric_values(samples, "chatbot_model_fallbacks_total"),
+        "degraded": _metric_values(samples, "chatbot_degraded_responses_total"),
+        "cache": cache.get_stats() if cache else None,
+        "llm_server": server_stats
+    }
+    if first_token_latencies:
+        result["ttft_p50_ms"] = _percentile(first_token_latencies, 50) * 1000
+        result["ttft_p95_ms"] = _percentile(first_token_latencies, 95) * 1000
+    if args.stream:
+        result["stream_errors"] = stream_errors
+    return result
+
+def print_report(result: Dict[str, Any]):
+    print(
+        f"リクエスト: {result['requests']} (同時実行 {result['concurrency']}) | "
+        f"{result['throughput_rps']:.1f} req/s | 所要時間 {result['wall_time_sec']:.1f}秒"
+    )
+    print(
+        f"レイテンシ(ms): p50 {result['p50_ms']:.0f} / p90 {result['p90_ms']:.0f} / "
+        f"p95 {result['p95_ms']:.0f} / p99 {result['p99_ms']:.0f} / max {result['max_ms']:.0f}"
+    )
+    if "ttft_p50_ms" in result:
+        print(f"最初のトークン(ms): p50 {result['ttft_p50_ms']:.0f} / p95 {result['ttft_p95_ms']:.0f}")
+    for labels, outcome in sorted(result["outcomes"].items()):
+        mean = f"{outcome['mean_ms']:.0f}ms" if outcome["mean_ms"] is not None else "-"
+        print(f"  {labels or '(none)'}: {outcome['count']:.0f}件 平均 {mean}")
+    print(f"再試行: {result['retries'] or 0} | レート制限の待機: {result['rate_limit_wait_sec']:.1f}秒")
+    print(f"モデル切り替え: {result['model_fallbacks'] or 0} | 簡易回答: {result['degraded'] or 0}")
+    if result["cache"]:
+        print(f"キャッシュ: ヒット率 {result['cache']['hit_rate']:.1f}% ({result['cache']['hits']}/{result['cache']['total_requests']})")
+    server = result["llm_server"]
+    if server:
+        print(
+            f"模擬Groq: リクエスト {server['requests']} / 429 {server['rate_limited']} / "
+            f"5xx {server['server_errors']} / モデル別 {server['by_model']}"
+        )
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="チャットボットのエンドツーエンド負荷試験")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--stream", action="store_true", help="ask_stream で計測（最初のトークンまでの時間も出力）")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="既出の質問を繰り返す割合（キャッシュの効果）")
+    parser.add_argument("--questions-per-session", type=int, default=1, help="1セッションで続けて質問する件数")
+    parser.add_argument("--deadline-sec", type=float, default=None, help="質問1件あたりの期限（既定: ASK_DEADLINE_SEC）")
+    parser.add_argument("--retriever", choices=("synthetic", "index"), default="synthetic")
+    parser.add_argument("--retrieval-ms", type=float, default=20.0, help="合成の検索にかける時間")
+    parser.add_argument("--no-cache", action="store_true", help="回答キャッシュを無効にする")
+    parser.add_argument("--cache-dir", default=None, help="回答キャッシュの保存先（既定: 一時ディレクトリ）")
+    parser.add_argument("--base-url", default=None, help="起動済みの模擬Groqサーバー（未指定ならプロセス内で起動）")
+    parser.add_argument("--output", default=None, help="結果を保存するJSONファイル")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    base_url = args.base_url or start_in_thread(server_from_arguments(args))
+    result = run_load(args, base_url)
+    print_report(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
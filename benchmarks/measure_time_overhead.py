@@ -0,0 +1,62 @@
+"""measure_time デコレータのオーバーヘッド計測
+
+何もしない関数を素のまま・各サンプリング率でデコレートした場合に呼び出し、
+1回あたりの追加コスト（ナノ秒）を出力する。ログ出力は無効にして計測する。
+
+使い方:
+    python benchmarks/measure_time_overhead.py --calls 200000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.performance import measure_time
+
+def _noop():
+    return None
+
+async def _async_noop():
+    return None
+
+def _time_sync(func, calls: int) -> float:
+    """1回あたりの平均実行時間（ナノ秒）"""
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter_ns() - start) / calls
+
+async def _time_async(func, calls: int) -> float:
+    """1回あたりの平均実行時間（ナノ秒、async関数）"""
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        await func()
+    return (time.perf_counter_ns() - start) / calls
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="measure_time のオーバーヘッド計測")
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--rates", nargs="+", type=float, default=[0.0, 0.01, 0.1, 1.0])
+    args = parser.parse_args()
+
+    baseline = _time_sync(_noop, args.calls)
+    async_baseline = asyncio.run(_time_async(_async_noop, args.calls))
+
+    print(f"{'sample_rate':>11} {'sync(ns)':>10} {'overhead':>10} {'async(ns)':>10} {'overhead':>10}")
+    print(f"{'(なし)':>11} {baseline:>10.0f} {0:>10.0f} {async_baseline:>10.0f} {0:>10.0f}")
+    for rate in args.rates:
+        sync_func = measure_time(log_result=False, sample_rate=rate)(_noop)
+        async_func = measure_time(log_result=False, sample_rate=rate)(_async_noop)
+        sync_ns = _time_sync(sync_func, args.calls)
+        async_ns = asyncio.run(_time_async(async_func, args.calls))
+        print(
+            f"{rate:>11.2f} {sync_ns:>10.0f} {sync_ns - baseline:>10.0f} "
+            f"{async_ns:>10.0f} {async_ns - async_baseline:>10.0f}"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""質問埋め込みのレイテンシベンチマーク
+
+直接呼び出し・専用ワーカー・LRUキャッシュ付きの各構成で、
+複数スレッドから同時に embed_query を呼んだときのレイテンシを計測する。
+
+使い方:
+    python benchmarks/query_embedding.py --concurrency 16 --requests 400
+"""
+import argparse
+import random
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+QUESTIONS = [
+    "VRRPの設定手順を教えてください",
+    "BGPの基本設定方法は？",
+    "show コマンドの使い方を説明してください",
+    "OSPFのエリア設計のポイントは？",
+    "VLANのトランク設定方法",
+    "ACLでSSHのみ許可するには？",
+    "HSRPとVRRPの違いは？",
+    "スパニングツリーのルートブリッジを固定する方法",
+]
+
+def run_scenario(embeddings, concurrency: int, requests: int, repeat_ratio: float) -> Dict[str, Any]:
+    from src.performance import _percentile
+
+    """同時実行でembed_queryを呼び出してレイテンシを集計"""
+    latencies: List[float] = []
+    lock = threading.Lock()
+    per_thread = max(1, requests // concurrency)
+
+    def worker(thread_index: int):
+        rng = random.Random(thread_index)
+        for i in range(per_thread):
+            if rng.random() < repeat_ratio:
+                question = rng.choice(QUESTIONS)
+            else:
+                question = f"{rng.choice(QUESTIONS)} (ケース{thread_index}-{i})"
+            start = time.perf_counter()
+            embeddings.embed_query(question)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - wall_start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / wall_time,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "stdev_ms": statistics.pstdev(latencies) * 1000
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="質問埋め込みのレイテンシベンチマーク")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="既出の質問を繰り返す割合")
+    args = parser.parse_args()
+
+    from src.embeddings import create_embeddings, CachedQueryEmbeddings
+
+    base = create_embeddings()
+    base.embed_query("warmup")
+
+    scenarios = {
+        "direct": base,
+        "worker": CachedQueryEmbeddings(base, max_size=0, use_worker=True),
+        "worker+lru": CachedQueryEmbeddings(base, use_worker=True),
+    }
+
+    print(f"{'scenario':<12} {'rps':>8} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'stdev':>8}")
+    for name, embeddings in scenarios.items():
+        result = run_scenario(embeddings, args.concurrency, args.requests, args.repeat_ratio)
+        print(
+            f"{name:<12} {result['throughput_rps']:>8.1f} {result['p50_ms']:>9.1f} "
+            f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['stdev_ms']:>8.1f}"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""検索パラメータ（CHUNK_SIZE / CHUNK_OVERLAP / SEARCH_K）の評価
+
+正解ページ付きの質問集を使い、チャンク設定の組み合わせごとに一時的なインデックスを作成して
+recall@k・MRR・インデックスサイズ・作成時間・検索レイテンシを計測する。
+チャンクの埋め込みは内容のハッシュでキャッシュするため、同じ内容のチャンクや2回目以降の実行では再計算しない。
+
+質問集（JSONL、1行1問。page は1始まりで、参照元に表示されるページ番号と同じ）:
+    {"question": "VRRPのプリエンプトを無効にするには？", "expected": [{"file": "router.pdf", "page": 42}]}
+
+使い方:
+    python benchmarks/retrieval_sweep.py --pdf-dir ./data/manuals --questions ./data/eval_questions.jsonl
+    python benchmarks/retrieval_sweep.py --pdf-dir ./data/manuals --questions q.jsonl \\
+        --chunk-sizes 500 800 1000 1500 --overlaps 100 200 --k 2 4 6 --min-recall 0.85 --output sweep.json
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+from array import array
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+class EmbeddingCache:
+    """チャンクの埋め込みのキャッシュ（SQLite、キーはモデルと内容のハッシュ）"""
+
+    def __init__(self, cache_dir: str, model_key: str):
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(Path(cache_dir) / "embeddings.sqlite3"))
+        self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self.model_key = model_key
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_key}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, embeddings, texts: List[str], batch_size: int = 256) -> Tuple[List[List[float]], int]:
+        """キャッシュにないチャンクのみ埋め込みを計算し、(ベクトル, キャッシュヒット数) を返す"""
+        keys = [self._key(text) for text in texts]
+        cached: Dict[str, List[float]] = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self.connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+            )
+            for key, blob in rows:
+                cached[key] = array("f", blob).tolist()
+        hits = sum(1 for key in keys if key in cached)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        missing_items = list(missing.items())
+        for start in range(0, len(missing_items), batch_size):
+            batch = missing_items[start:start + batch_size]
+            vectors = embeddings.embed_documents([text for _, text in batch])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for (key, _), vector in zip(batch, vectors)]
+            )
+            self.connection.commit()
+            for (key, _), vector in zip(batch, vectors):
+                cached[key] = list(vector)
+
+        return [cached[key] for key in keys], hits
+
+    def close(self):
+        self.connection.close()
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """質問集を読み込み（expected は (ファイル名, ページ) の集合に変換）"""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            expected = {(item["file"], int(item["page"])) for item in record.get("expected", [])}
+            if not expected:
+                raise ValueError(f"{path}:{line_number} に正解ページ (expected) がありません")
+            questions.append({"question": record["question"], "expected": expected})
+    return questions
+
+def load_pages(pdf_dir: str, processor) -> list:
+    """PDFディレクトリの全ページを読み込み（インジェストと同じ抽出・クリーニング）"""
+    pages = []
+    for pdf_file in sorted(Path(pdf_dir).glob("*.pdf")):
+        documents = processor.load_pdf(str(pdf_file))
+        for doc in documents:
+            doc.metadata["source"] = pdf_file.name
+            doc.metadata["file_name"] = pdf_file.name
+        pages.extend(documents)
+    return pages
+
+def score(retrieved: List[Tuple[str, int]], expected: Set[Tuple[str, int]], k: int) -> Tuple[float, float]:
+    """上位k件の (recall, 逆順位) を返す"""
+    top = retrieved[:k]
+    recall = len(expected & set(top)) / len(expected)
+    reciprocal_rank = 0.0
+    for rank, page in enumerate(top, 1):
+        if page in expected:
+            reciprocal_rank = 1.0 / rank
+            break
+    return recall, reciprocal_rank
+
+def evaluate_setting(
+    pages: list,
+    questions: List[Dict[str, Any]],
+    query_vectors: List[List[float]],
+    chunk_size: int,
+    chunk_overlap: int,
+    k_values: List[int],
+    embeddings,
+    cache: EmbeddingCache
+) -> List[Dict[str, Any]]:
+    """1つのチャンク設定でインデックスを作成し、kごとの指標を返す"""
+    from src.document_processor import INSERT_BATCH_SIZE, _directory_size, create_text_splitter
+    from src.lazy_imports import lazy_import
+    from src.performance import _percentile
+
+    Chroma = lazy_import("langchain_community.vectorstores").Chroma
+    max_k = max(k_values)
+
+    with tempfile.TemporaryDirectory(prefix="retrieval_sweep_") as index_dir:
+        build_start = time.perf_counter()
+        chunks = create_text_splitter(chunk_size, chunk_overlap).split_documents(pages)
+        texts = [chunk.page_content for chunk in chunks]
+
+        embed_start = time.perf_counter()
+        vectors, cache_hits = cache.embed_documents(embeddings, texts)
+        embed_time = time.perf_counter() - embed_start
+
+        vectorstore = Chroma(persist_directory=index_dir, embedding_function=embeddings)
+        for start in range(0, len(chunks), INSERT_BATCH_SIZE):
+            vectorstore._collection.add(
+                ids=[str(i) for i in range(start, min(start + INSERT_BATCH_SIZE, len(chunks)))],
+                embeddings=vectors[start:start + INSERT_BATCH_SIZE],
+                metadatas=[chunk.metadata for chunk in chunks[start:start + INSERT_BATCH_SIZE]],
+                documents=texts[start:start + INSERT_BATCH_SIZE]
+            )
+        build_time = time.perf_counter() - build_start
+        index_size = _directory_size(Path(index_dir))
+
+        # 質問の埋め込みは設定によらないため、検索（ベクトル近傍探索）のみを計測する
+        latencies = []
+        results = []
+        for query_vector in query_vectors:
+            search_start = time.perf_counter()
+            documents = vectorstore.similarity_search_by_vector(query_vector, k=max_k)
+            latencies.append(time.perf_counter() - search_start)
+            results.append(documents)
+
+    rows = []
+    for k in k_values:
+        recalls, reciprocal_ranks, context_chars = [], [], []
+        for question, documents in zip(questions, results):
+            retrieved = [(doc.metadata.get("file_name"), doc.metadata.get("page")) for doc in documents]
+            recall, reciprocal_rank = score(retrieved, question["expected"], k)
+            recalls.append(recall)
+            reciprocal_ranks.append(reciprocal_rank)
+            context_chars.append(sum(len(doc.page_content) for doc in documents[:k]))
+        rows.append({
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "k": k,
+            "recall_at_k": sum(recalls) / len(recalls),
+            "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks),
+            "avg_context_chars": sum(context_chars) / len(context_chars),
+            "chunks": len(chunks),
+            "index_size_mb": index_size / 1024 / 1024,
+            "build_time_sec": build_time,
+            "embed_time_sec": embed_time,
+            "cached_chunks": cache_hits,
+            "search_p50_ms": _percentile(sorted(latencies), 50) * 1000,
+            "search_p95_ms": _percentile(sorted(latencies), 95) * 1000
+        })
+    return rows
+
+def recommend(rows: List[Dict[str, Any]], min_recall: float, min_mrr: float) -> Optional[Dict[str, Any]]:
+    """品質基準を満たす設定のうち、LLMに渡す文脈が最も短いもの（同程度ならインデックスが小さいもの）"""
+    candidates = [row for row in rows if row["recall_at_k"] >= min_recall and row["mrr"] >= min_mrr]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda row: (row["avg_context_chars"], row["index_size_mb"], row["search_p95_ms"]))
+
+def main() -> int:
+    from config import config
+
+    parser = argparse.ArgumentParser(description="チャンク設定と検索件数の評価")
+    parser.add_argument("--pdf-dir", required=True, help="評価に使うPDFのディレクトリ")
+    parser.add_argument("--questions", required=True, help="正解ページ付きの質問集（JSONL）")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[500, 1000, 1500])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--k", type=int, nargs="+", default=[2, 4, 8], help="評価する SEARCH_K")
+    parser.add_argument("--min-recall", type=float, default=0.8, help="推奨設定に必要な recall@k")
+    parser.add_argument("--min-mrr", type=float, default=0.0, help="推奨設定に必要な MRR")
+    parser.add_argument("--cache-dir", default=".retrieval_sweep_cache", help="埋め込みキャッシュの保存先")
+    parser.add_argument("--output", default=None, help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    from src.document_processor import DocumentProcessor
+
+    questions = load_questions(args.questions)
+    processor = DocumentProcessor()
+    embeddings = processor.embeddings
+    pages = load_pages(args.pdf_dir, processor)
+    if not pages:
+        print(f"PDFからテキストを抽出できませんでした: {args.pdf_dir}")
+        return 1
+    print(f"ページ数: {len(pages)}, 質問数: {len(questions)}")
+
+    model_key = "{}:{}".format(
+        getattr(embeddings, "model_name", config.EMBEDDING_MODEL),
+        getattr(embeddings, "backend", config.EMBEDDING_BACKEND)
+    )
+    cache = EmbeddingCache(args.cache_dir, model_key)
+    query_vectors = [embeddings.embed_query(question["question"]) for question in questions]
+
+    rows = []
+    try:
+        for chunk_size in args.chunk_sizes:
+            for chunk_overlap in args.overlaps:
+                if chunk_overlap >= chunk_size:
+                    continue
+                print(f"評価中: CHUNK_SIZE={chunk_size}, CHUNK_OVERLAP={chunk_overlap}")
+                rows.extend(evaluate_setting(
+                    pages, questions, query_vectors, chunk_size, chunk_overlap, sorted(args.k), embeddings, cache
+                ))
+    finally:
+        cache.close()
+
+    print(
+        f"{'size':>5} {'overlap':>7} {'k':>3} {'recall':>7} {'MRR':>6} {'ctx chars':>9} "
+        f"{'chunks':>7} {'MB':>7} {'build(s)':>8} {'cached':>7} {'p50(ms)':>8} {'p95(ms)':>8}"
+    )
+    for row in rows:
+        print(
+            f"{row['chunk_size']:>5} {row['chunk_overlap']:>7} {row['k']:>3} {row['recall_at_k']:>7.3f} "
+            f"{row['mrr']:>6.3f} {row['avg_context_chars']:>9.0f} {row['chunks']:>7} {row['index_size_mb']:>7.1f} "
+            f"{row['build_time_sec']:>8.1f} {row['cached_chunks']:>7} "
+            f"{row['search_p50_ms']:>8.2f} {row['search_p95_ms']:>8.2f}"
+        )
+
+    best = recommend(rows, args.min_recall, args.min_mrr)
+    if best:
+        print(
+            f"\n推奨: CHUNK_SIZE={best['chunk_size']} CHUNK_OVERLAP={best['chunk_overlap']} SEARCH_K={best['k']} "
+            f"(recall@k {best['recall_at_k']:.3f}, MRR {best['mrr']:.3f}, 文脈 {best['avg_context_chars']:.0f}文字)"
+        )
+    else:
+        print(f"\nrecall@k >= {args.min_recall}, MRR >= {args.min_mrr} を満たす設定はありません")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": rows, "recommended": best}, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""シャード検索のスケーリングベンチマーク
+
+合成のベクトル（マニュアル数・チャンク数・次元を指定）をスナップショットに書き出し、
+シャード数を 1..N と変えて ShardPool で検索したときのレイテンシ・スループット・シャードごとの時間を、
+プロセス内で全件を総当たりした場合（ベースライン）と比較する。結果の上位k件がベースラインと
+一致する割合も出力する。埋め込みモデル・ベクトルストアは使わない。
+--product を指定すると、その製品のチャンクだけを検索する場合（製品による絞り込み）を計測する。
+合成データのマニュアルには --products 種類の製品を順に割り当てる。
+
+使い方:
+    python benchmarks/sharded_retrieval.py --chunks 200000 --max-shards 8
+    python benchmarks/sharded_retrieval.py --shards 1,2,4 --partition hash --concurrency 8 --output shards.json
+    python benchmarks/sharded_retrieval.py --partition product --product nx-os
+    python benchmarks/sharded_retrieval.py --snapshot data/vectorstore/versions/<version>/shards.vsnap
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from src.performance import _percentile
+from src.products import PRODUCT_KEYS
+from src.sharded_retrieval import PARTITION_STRATEGIES, ShardPool
+from src.snapshot import VectorSnapshot, write_snapshot
+
+# 合成スナップショットを書き出す単位（チャンク数）
+WRITE_BATCH_SIZE = 10000
+
+def write_synthetic_snapshot(path: str, chunks: int, dim: int, files: int, products: int, seed: int):
+    """正規化した乱数ベクトルのスナップショットを作成（チャンクはマニュアルごとに連続して並ぶ）"""
+    rng = np.random.default_rng(seed)
+    product_keys = PRODUCT_KEYS[:max(1, products)]
+
+    def metadata(row: int) -> dict:
+        file_index = row * files // chunks
+        return {
+            "file_name": f"manual_{file_index:03d}.pdf",
+            "page": row % 500,
+            "product": product_keys[file_index % len(product_keys)]
+        }
+
+    def batches():
+        for start in range(0, chunks, WRITE_BATCH_SIZE):
+            end = min(start + WRITE_BATCH_SIZE, chunks)
+            vectors = rng.standard_normal((end - start, dim)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            rows = range(start, end)
+            yield (
+                vectors,
+                [f"chunk-{row}" for row in rows],
+                [f"synthetic chunk {row}" for row in rows],
+                [metadata(row) for row in rows]
+            )
+
+    write_snapshot(path, batches(), {"embedding_model": "synthetic", "chunk_count": chunks})
+
+def make_queries(count: int, dim: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    queries = rng.standard_normal((count, dim)).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def exact_search(vectors: np.ndarray, norms: np.ndarray, query: np.ndarray, k: int, rows: np.ndarray = None) -> List[int]:
+    """プロセス内で総当たりした上位k件（ShardPool と同じ二乗ユークリッド距離。rows を指定するとその行のみ）"""
+    if rows is not None:
+        vectors, norms = vectors[rows], norms[rows]
+    distances = norms - 2.0 * (vectors @ query) + float(query @ query)
+    k = min(k, len(distances))
+    top = np.argpartition(distances, k - 1)[:k]
+    top = top[np.argsort(distances[top], kind="stable")]
+    return (rows[top] if rows is not None else top).tolist()
+
+def measure(search, queries: np.ndarray, concurrency: int) -> Dict[str, Any]:
+    """1件ずつ検索したレイテンシと、concurrency スレッドから同時に検索したスループット"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+
+    next_index = iter(range(len(queries)))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                index = next(next_index, None)
+            if index is None:
+                break
+            search(queries[index])
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - wall_start
+    latencies.sort()
+    return {
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "throughput_qps": len(queries) / wall_time if wall_time > 0 else 0.0
+    }
+
+def run_benchmark(
+    snapshot_path: str,
+    shard_counts: List[int],
+    partition: str,
+    queries: np.ndarray,
+    k: int,
+    concurrency: int,
+    product: str = None
+) -> Dict[str, Any]:
+    snapshot = VectorSnapshot(snapshot_path, verify=False)
+    vectors = np.ascontiguousarray(snapshot.vectors, dtype=np.float32)
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+    rows = None
+    if product:
+        _, _, metadatas = snapshot.records()
+        rows = np.array([row for row, metadata in enumerate(metadatas) if metadata.get("product") == product], dtype=np.int64)
+        if not len(rows):
+            raise ValueError(f"スナップショットに製品 {product} のチャンクがありません")
+        print(f"製品 {product}: {len(rows)}/{snapshot.count}チャンク")
+    expected = [exact_search(vectors, norms, query, k, rows) for query in queries]
+
+    # ベースラインは製品で絞り込まずに全件を総当たりした場合（絞り込みによる短縮も含めて比較する）
+    baseline = measure(lambda query: exact_search(vectors, norms, query, k), queries, concurrency)
+    print(f"ベースライン（プロセス内・全件）: p50 {baseline['p50_ms']:.2f}ms / {baseline['throughput_qps']:.0f} qps")
+
+    settings = []
+    for shards in shard_counts:
+        start = time.perf_counter()
+        pool = ShardPool(snapshot_path, shards, partition)
+        startup_sec = time.perf_counter() - start
+        try:
+            shard_times: List[List[float]] = []
+            matched = 0
+            for query, expected_rows in zip(queries, expected):
+                hits, timings = pool.search(query, k, product=product)
+                shard_times.append(list(timings.values()) or [0.0])
+                matched += [row for _, row in hits] == expected_rows
+            result = measure(lambda query: pool.search(query, k, product=product), queries, concurrency)
+        finally:
+            pool.close()
+
+        result.update({
+            "shards": shards,
+            "startup_sec": startup_sec,
+            "chunks_per_shard": [len(rows) for rows in pool.partitions],
+            "shard_mean_ms": sum(sum(times) / len(times) for times in shard_times) / len(shard_times) * 1000,
+            "shard_max_ms": sum(max(times) for times in shard_times) / len(shard_times) * 1000,
+            "topk_match_rate": matched / len(queries),
+            "speedup_p50": baseline["p50_ms"] / result["p50_ms"] if result["p50_ms"] else 0.0
+        })
+        settings.append(result)
+        print(
+            f"シャード {shards}: p50 {result['p50_ms']:.2f}ms / p95 {result['p95_ms']:.2f}ms / "
+            f"{result['throughput_qps']:.0f} qps | シャード平均 {result['shard_mean_ms']:.2f}ms "
+            f"最大 {result['shard_max_ms']:.2f}ms | 一致率 {result['topk_match_rate']:.0%} | 起動 {startup_sec:.1f}秒"
+        )
+
+    return {
+        "settings": {
+            "snapshot": snapshot_path,
+            "chunks": snapshot.count,
+            "dim": snapshot.dim,
+            "partition": partition,
+            "product": product,
+            "product_chunks": len(rows) if rows is not None else snapshot.count,
+            "queries": len(queries),
+            "k": k,
+            "concurrency": concurrency,
+            "cpu_count": os.cpu_count()
+        },
+        "baseline": baseline,
+        "results": settings
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="シャード検索のスケーリングベンチマーク")
+    parser.add_argument("--snapshot", default=None, help="既存のスナップショット（未指定なら合成データを作成）")
+    parser.add_argument("--chunks", type=int, default=100000, help="合成データのチャンク数")
+    parser.add_argument("--dim", type=int, default=384, help="合成データの次元（all-MiniLM-L6-v2 は384）")
+    parser.add_argument("--files", type=int, default=40, help="合成データのマニュアル数（--partition file の分割単位）")
+    parser.add_argument("--shards", default=None, help="試すシャード数（カンマ区切り、既定: 1..--max-shards）")
+    parser.add_argument("--max-shards", type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument("--products", type=int, default=4, help="合成データの製品の種類数（マニュアルに順に割り当てる）")
+    parser.add_argument("--partition", choices=PARTITION_STRATEGIES, default="file")
+    parser.add_argument("--product", default=None, help="この製品のチャンクだけを検索する（製品による絞り込み）")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4, help="スループット計測の同時実行数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    if args.shards:
+        shard_counts = [int(value) for value in args.shards.split(",") if value.strip()]
+    else:
+        shard_counts = list(range(1, args.max_shards + 1))
+
+    with tempfile.TemporaryDirectory(prefix="sharded_retrieval_") as work_dir:
+        snapshot_path = args.snapshot
+        if snapshot_path is None:
+            snapshot_path = str(Path(work_dir) / "synthetic.vsnap")
+            start = time.perf_counter()
+            write_synthetic_snapshot(snapshot_path, args.chunks, args.dim, args.files, args.products, args.seed)
+            print(f"合成スナップショット作成: {args.chunks}チャンク x {args.dim}次元 ({time.perf_counter() - start:.1f}秒)")
+        dim = VectorSnapshot(snapshot_path, verify=False).dim
+        queries = make_queries(args.queries, dim, args.seed)
+        result = run_benchmark(
+            snapshot_path, shard_counts, args.partition, queries, args.k, args.concurrency, args.product
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
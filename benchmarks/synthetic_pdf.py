@@ -0,0 +1,249 @@
+"""ネットワークマニュアル風の合成PDFを生成
+
+見出し・日本語の説明文・CLIの設定例・パラメータ表を含むページを、外部ライブラリなしで書き出す。
+文字コードはUnicodeのコードポイントをそのままCIDとして書き（Identity-H）、ToUnicode を付けるため
+pypdf・pdfplumber で元のテキストを抽出できる（フォントは埋め込まないため、ビューアでの表示は崩れる）。
+同じ seed からは常に同じPDFが生成される。
+
+使い方:
+    python benchmarks/synthetic_pdf.py --output-dir ./data/synthetic --files 3 --pages 200 --layout mixed
+"""
+import argparse
+import random
+import sys
+import zlib
+from pathlib import Path
+from typing import List, Dict, Any, Set
+
+# A4（ポイント）
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN_LEFT = 50
+MARGIN_TOP = 60
+MARGIN_BOTTOM = 60
+# 説明文1行あたりの全角文字数
+PROSE_LINE_CHARS = 42
+
+LAYOUTS = ("mixed", "prose", "cli", "table")
+
+TOPICS = [
+    ("VRRP", "vrrp 1 ip 10.{a}.0.254", "vrrp 1 priority {p}"),
+    ("OSPF", "router ospf {a}", "network 10.{a}.0.0 0.0.0.255 area 0"),
+    ("BGP", "router bgp 650{a:02d}", "neighbor 192.0.2.{a} remote-as 65{p}"),
+    ("VLAN", "vlan {a}", "switchport trunk allowed vlan {a},{p}"),
+    ("ACL", "ip access-list extended MGMT-{a}", "permit tcp 10.{a}.0.0 0.0.0.255 any eq 22"),
+    ("STP", "spanning-tree mode rapid-pvst", "spanning-tree vlan {a} priority 4096"),
+    ("LACP", "interface Port-channel{a}", "channel-group {a} mode active"),
+    ("NTP", "ntp server 192.0.2.{a}", "ntp source Loopback0"),
+    ("SNMP", "snmp-server community RO-{a} RO", "snmp-server host 192.0.2.{p} version 2c RO-{a}"),
+    ("QoS", "class-map match-any VOICE-{a}", "priority percent {p}"),
+]
+
+SENTENCES = [
+    "{topic}を有効にする前に、対向機器の設定とソフトウェアのバージョンを確認してください。",
+    "設定はグローバルコンフィギュレーションモードで行い、変更後は必ず設定を保存します。",
+    "{topic}の状態は show コマンドで確認でき、問題がある場合はログに警告が出力されます。",
+    "冗長構成では両方の機器に同じパラメータを設定しないと、切り替えが正しく行われません。",
+    "既定値のままでも動作しますが、大規模なネットワークではタイマーの調整を推奨します。",
+    "{topic}の設定を変更すると、一時的に通信が途切れる場合があります。メンテナンス時間内に実施してください。",
+    "インターフェース番号は機種により異なります。ハードウェアガイドの対応表を参照してください。",
+    "設定例のIPアドレスは説明用です。実際の環境に合わせて変更してください。",
+]
+
+TABLE_ROWS = [
+    ("priority", "100", "値が大きい機器が優先されます"),
+    ("timer", "3秒", "送信間隔。短くすると切り替えが速くなります"),
+    ("preempt", "有効", "優先度の高い機器が復帰したときに切り替えます"),
+    ("hold-time", "10秒", "応答がない場合に障害と判断するまでの時間"),
+    ("cost", "自動", "帯域幅から計算されます"),
+    ("mtu", "1500", "対向機器と一致させる必要があります"),
+    ("authentication", "なし", "MD5 または SHA を推奨します"),
+    ("logging", "無効", "状態の変化をログに記録します"),
+]
+
+def _hex(text: str) -> str:
+    """Identity-H の16進文字列（コードポイントを2バイトのCIDとして書く）"""
+    return text.encode("utf-16-be").hex().upper()
+
+class _PageWriter:
+    """1ページ分のコンテンツストリームを組み立てる"""
+
+    def __init__(self):
+        self.y = PAGE_HEIGHT - MARGIN_TOP
+        self.operations: List[str] = []
+        self.chars: Set[str] = set()
+        self.char_count = 0
+
+    def fits(self, lines: int, leading: float) -> bool:
+        return self.y - lines * leading >= MARGIN_BOTTOM
+
+    def text(self, x: float, size: float, text: str):
+        self.chars.update(text)
+        self.char_count += len(text)
+        self.operations.append(f"BT /F1 {size} Tf {x} {self.y:.1f} Td <{_hex(text)}> Tj ET")
+
+    def line(self, x: float, size: float, text: str, leading: float):
+        self.text(x, size, text)
+        self.y -= leading
+
+    def content(self) -> bytes:
+        return "\n".join(self.operations).encode("ascii")
+
+def _prose_block(page: _PageWriter, rng: random.Random, topic: str) -> bool:
+    text = "".join(rng.choice(SENTENCES).format(topic=topic) for _ in range(rng.randint(2, 4)))
+    lines = [text[i:i + PROSE_LINE_CHARS] for i in range(0, len(text), PROSE_LINE_CHARS)]
+    if not page.fits(len(lines) + 1, 15):
+        return False
+    for text_line in lines:
+        page.line(MARGIN_LEFT, 10, text_line, 15)
+    page.y -= 8
+    return True
+
+def _cli_block(page: _PageWriter, rng: random.Random, topic_index: int) -> bool:
+    _, command, sub_command = TOPICS[topic_index]
+    count = rng.randint(3, 8)
+    if not page.fits(count + 3, 12):
+        return False
+    page.line(MARGIN_LEFT, 10, "設定例:", 14)
+    page.line(MARGIN_LEFT + 10, 9, "Router# configure terminal", 12)
+    for i in range(count):
+        a, p = rng.randint(1, 99), rng.randint(50, 250)
+        prompt = "Router(config)# " if i == 0 else "Router(config-if)# "
+        template = command if i == 0 else sub_command
+        page.line(MARGIN_LEFT + 10, 9, prompt + template.format(a=a, p=p), 12)
+    page.line(MARGIN_LEFT + 10, 9, "Router(config-if)# end", 12)
+    page.y -= 8
+    return True
+
+def _table_block(page: _PageWriter, rng: random.Random, topic: str) -> bool:
+    rows = rng.sample(TABLE_ROWS, rng.randint(3, 6))
+    if not page.fits(len(rows) + 3, 13):
+        return False
+    columns = (MARGIN_LEFT, MARGIN_LEFT + 130, MARGIN_LEFT + 210)
+    page.line(MARGIN_LEFT, 10, f"表: {topic}のパラメータ", 14)
+    for cells in [("パラメータ", "既定値", "説明")] + rows:
+        for x, cell in zip(columns, cells):
+            page.text(x, 9, cell)
+        page.y -= 13
+    page.y -= 8
+    return True
+
+def _build_page(rng: random.Random, page_number: int, layout: str) -> _PageWriter:
+    page = _PageWriter()
+    topic_index = (page_number // 5) % len(TOPICS)
+    topic = TOPICS[topic_index][0]
+    page.line(MARGIN_LEFT, 14, f"{page_number // 5 + 1}.{page_number % 5 + 1} {topic}の設定", 24)
+
+    blocks = {"prose": ["prose"], "cli": ["cli", "cli", "prose"], "table": ["table", "table", "prose"]}.get(
+        layout, ["prose", "prose", "cli", "table"]
+    )
+    failures = 0
+    while failures < 3:
+        kind = rng.choice(blocks)
+        if kind == "prose":
+            placed = _prose_block(page, rng, topic)
+        elif kind == "cli":
+            placed = _cli_block(page, rng, topic_index)
+        else:
+            placed = _table_block(page, rng, topic)
+        failures = 0 if placed else failures + 1
+
+    footer_y, page.y = page.y, 30
+    page.text(PAGE_WIDTH / 2 - 10, 8, f"- {page_number + 1} -")
+    page.y = footer_y
+    return page
+
+def _to_unicode_cmap(chars: Set[str]) -> bytes:
+    """使用した文字のCIDをそのままUnicodeに対応付ける ToUnicode CMap"""
+    high_bytes = sorted({ord(char) >> 8 for char in chars})
+    ranges = [f"<{high:02X}00> <{high:02X}FF> <{high:02X}00>" for high in high_bytes]
+    blocks = []
+    for start in range(0, len(ranges), 100):
+        batch = ranges[start:start + 100]
+        blocks.append(f"{len(batch)} beginbfrange\n" + "\n".join(batch) + "\nendbfrange")
+    return (
+        "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+        "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+        "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+        + "\n".join(blocks) +
+        "\nendcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n"
+    ).encode("ascii")
+
+def _stream(data: bytes) -> bytes:
+    compressed = zlib.compress(data)
+    return b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(compressed) + compressed + b"\nendstream"
+
+def write_manual_pdf(path: str, pages: int, layout: str = "mixed", seed: int = 0) -> Dict[str, Any]:
+    """合成マニュアルを書き出し、ページ数・文字数を返す"""
+    if layout not in LAYOUTS:
+        raise ValueError(f"未対応のレイアウトです: {layout} (対応: {', '.join(LAYOUTS)})")
+    rng = random.Random(seed)
+    page_writers = [_build_page(rng, number, layout) for number in range(pages)]
+    chars: Set[str] = set()
+    for page in page_writers:
+        chars |= page.chars
+
+    # 1: Catalog, 2: Pages, 3: Type0フォント, 4: CIDフォント, 5: FontDescriptor, 6: ToUnicode, 7以降: ページと内容
+    page_ids = [7 + 2 * i for i in range(pages)]
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % pid for pid in page_ids) + b"] /Count %d >>" % pages,
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /HeiseiKakuGo-W5 /Encoding /Identity-H "
+        b"/DescendantFonts [4 0 R] /ToUnicode 6 0 R >>",
+        b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /HeiseiKakuGo-W5 "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+        b"/FontDescriptor 5 0 R /DW 1000 /W [32 126 500] >>",
+        b"<< /Type /FontDescriptor /FontName /HeiseiKakuGo-W5 /Flags 4 /FontBBox [-92 -250 1010 922] "
+        b"/ItalicAngle 0 /Ascent 752 /Descent -221 /CapHeight 737 /StemV 114 >>",
+        _stream(_to_unicode_cmap(chars)),
+    ]
+    for page_id, page in zip(page_ids, page_writers):
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (PAGE_WIDTH, PAGE_HEIGHT, page_id + 1)
+        )
+        objects.append(_stream(page.content()))
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_bytes(bytes(output))
+    return {
+        "path": str(path),
+        "pages": pages,
+        "chars": sum(page.char_count for page in page_writers),
+        "size_bytes": len(output)
+    }
+
+def generate_manuals(output_dir: str, files: int, pages: int, layout: str = "mixed", seed: int = 0) -> List[Dict[str, Any]]:
+    """合成マニュアルを複数生成（ファイルごとに seed をずらす）"""
+    return [
+        write_manual_pdf(str(Path(output_dir) / f"synthetic_{layout}_{index + 1:02d}.pdf"), pages, layout, seed + index)
+        for index in range(files)
+    ]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ネットワークマニュアル風の合成PDFを生成")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--pages", type=int, default=50, help="1ファイルあたりのページ数")
+    parser.add_argument("--layout", choices=LAYOUTS, default="mixed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for manual in generate_manuals(args.output_dir, args.files, args.pages, args.layout, args.seed):
+        print(f"{manual['path']}: {manual['pages']}ページ, {manual['size_bytes'] / 1024:.0f}KB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
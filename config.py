@@ -1,6 +1,6 @@
 import os
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 @dataclass
 class Config:
@@ -9,20 +9,84 @@ class Config:
     # API設定
     GROQ_API_KEY: str = os.getenv("GROQ_API_KEY", "")
     MODEL_NAME: str = os.getenv("MODEL_NAME", "llama3-70b-8192")
+    # Groq APIの接続先（空ならGroqの既定。負荷試験では benchmarks/fake_groq_server.py を指定）
+    GROQ_BASE_URL: str = os.getenv("GROQ_BASE_URL", "")
     
     # ベクトルストア設定
     PERSIST_DIRECTORY: str = os.getenv("PERSIST_DIRECTORY", "./data/vectorstore")
     
+    # インデックスのバージョン管理（PERSIST_DIRECTORY/versions に保持する世代数）
+    INDEX_KEEP_VERSIONS: int = int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
+    # 状態を保持するインジェストジョブの件数
+    INGEST_JOB_HISTORY: int = int(os.getenv("INGEST_JOB_HISTORY", "50"))
+    # 埋め込み・書き込みとチェックポイント記録の単位（チャンク数）
+    INGEST_CHECKPOINT_BATCH: int = int(os.getenv("INGEST_CHECKPOINT_BATCH", "256"))
+    
+    # マニュアル保存先（内容ハッシュ単位で保存）
+    MANUAL_DIR: str = os.getenv("MANUAL_DIR", "./data/manuals")
+    
+    # PDF抽出設定（ページ単位で primary が失敗・文字化けした場合のみ fallback を使う）
+    PDF_PRIMARY_EXTRACTOR: str = os.getenv("PDF_PRIMARY_EXTRACTOR", "pypdf")  # pypdf / pdfplumber
+    PDF_FALLBACK_EXTRACTOR: str = os.getenv("PDF_FALLBACK_EXTRACTOR", "pdfplumber")  # pypdf / pdfplumber / none
+    PDF_PAGE_TIMEOUT_SEC: float = float(os.getenv("PDF_PAGE_TIMEOUT_SEC", "10"))
+    
+    # 埋め込み設定
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "torch")  # torch / onnx / onnx-int8
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_NUM_THREADS: int = int(os.getenv("EMBEDDING_NUM_THREADS", "0"))  # 0: ライブラリ既定値
+    EMBEDDING_ONNX_FILE: str = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+    EMBEDDING_VERIFY: bool = os.getenv("EMBEDDING_VERIFY", "true").lower() == "true"
+    EMBEDDING_MIN_SIMILARITY: float = float(os.getenv("EMBEDDING_MIN_SIMILARITY", "0.99"))
+    
+    # 質問埋め込み設定
+    QUERY_EMBED_CACHE_SIZE: int = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))
+    QUERY_EMBED_WORKER: bool = os.getenv("QUERY_EMBED_WORKER", "true").lower() == "true"
+    QUERY_EMBED_BATCH_WINDOW_MS: float = float(os.getenv("QUERY_EMBED_BATCH_WINDOW_MS", "5"))
+    QUERY_EMBED_MAX_BATCH: int = int(os.getenv("QUERY_EMBED_MAX_BATCH", "32"))
+    
     # チャンク設定
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
     
     # 検索設定
     SEARCH_K: int = int(os.getenv("SEARCH_K", "4"))
+    # シャード検索（インデックスをN個のワーカープロセスに分割して並列に検索、0で無効）
+    RETRIEVAL_SHARDS: int = int(os.getenv("RETRIEVAL_SHARDS", "0"))
+    RETRIEVAL_SHARD_PARTITION: str = os.getenv("RETRIEVAL_SHARD_PARTITION", "file")  # file / product / hash
+    # シャードの応答を待つ最大秒数（超えたシャードは結果に含めない、0で無制限）
+    RETRIEVAL_SHARD_TIMEOUT_SEC: float = float(os.getenv("RETRIEVAL_SHARD_TIMEOUT_SEC", "2.0"))
+    # シャード検索に使う既存のスナップショット（読み取り専用。空ならインデックスのディレクトリ内に書き出す）
+    RETRIEVAL_SNAPSHOT_PATH: str = os.getenv("RETRIEVAL_SNAPSHOT_PATH", "")
+    # 製品による絞り込み（インジェスト時にファイル名と先頭 PRODUCT_DETECT_PAGES ページから製品を判定）
+    PRODUCT_DETECT_PAGES: int = int(os.getenv("PRODUCT_DETECT_PAGES", "5"))
+    # 製品ごとのコレクションにも書き込み、製品を指定した検索はそのコレクションのみを対象にする
+    PRODUCT_COLLECTIONS: bool = os.getenv("PRODUCT_COLLECTIONS", "true").lower() == "true"
+    # 質問に製品名が1つだけ含まれる場合は自動で絞り込む
+    PRODUCT_INFERENCE: bool = os.getenv("PRODUCT_INFERENCE", "true").lower() == "true"
     
     # LLM設定
     TEMPERATURE: float = float(os.getenv("TEMPERATURE", "0.3"))
     MAX_TOKENS: int = int(os.getenv("MAX_TOKENS", "2048"))
+    # モデルの振り分け（簡単な質問は小さいモデル、レート制限・タイムアウト時は次のモデル）
+    MODEL_ROUTING: bool = os.getenv("MODEL_ROUTING", "true").lower() == "true"
+    ROUTER_SMALL_MODEL: str = os.getenv("ROUTER_SMALL_MODEL", "llama3-8b-8192")
+    ROUTER_SIMPLE_MAX_CHARS: int = int(os.getenv("ROUTER_SIMPLE_MAX_CHARS", "60"))
+    MODEL_FALLBACKS: List[str] = field(default_factory=lambda: [
+        m.strip() for m in os.getenv("MODEL_FALLBACKS", "llama3-70b-8192,mixtral-8x7b-32768,llama3-8b-8192").split(",")
+        if m.strip()
+    ])
+    # 1回のLLM呼び出しのタイムアウト（超えたら次のモデルに切り替え。期限内に切り替えられるよう ASK_DEADLINE_SEC より短くする）
+    MODEL_TIMEOUT_SEC: float = float(os.getenv("MODEL_TIMEOUT_SEC", "6"))
+    # 質問1件あたりの期限（秒、0で無効）。生成が収まらない場合はマニュアルの抜粋のみで回答
+    ASK_DEADLINE_SEC: float = float(os.getenv("ASK_DEADLINE_SEC", "10"))
+    # 回答の生成に最低限必要とみなす時間（残り時間がこれ未満なら生成しない）
+    ASK_MIN_GENERATION_SEC: float = float(os.getenv("ASK_MIN_GENERATION_SEC", "2.5"))
+    # 簡易回答に含める抜粋の件数
+    DEGRADED_EXCERPTS: int = int(os.getenv("DEGRADED_EXCERPTS", "3"))
+    # Groqを呼ばずに固定回答を返すスタブ（負荷試験用）
+    LLM_STUB: bool = os.getenv("LLM_STUB", "false").lower() == "true"
+    LLM_STUB_DELAY_SEC: float = float(os.getenv("LLM_STUB_DELAY_SEC", "0.01"))
     
     # アプリケーション設定
     DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
@@ -34,6 +98,69 @@ class Config:
     
     # ログ設定
     LOG_DIR: str = os.getenv("LOG_DIR", "./logs")
+    # 非同期出力（キュー経由で別スレッドが書き込む）
+    LOG_ASYNC: bool = os.getenv("LOG_ASYNC", "true").lower() == "true"
+    # 出力形式（text / json）
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text").lower()
+    # ローテーション（time: 日付ごと / size: LOG_MAX_BYTES ごと）
+    LOG_ROTATION: str = os.getenv("LOG_ROTATION", "time").lower()
+    LOG_MAX_BYTES: int = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT: int = int(os.getenv("LOG_BACKUP_COUNT", "14"))
+    # 同じ箇所からのログを LOG_RATE_LIMIT_WINDOW_SEC 秒あたりこの件数までに制限（0: 無効）
+    LOG_RATE_LIMIT_BURST: int = int(os.getenv("LOG_RATE_LIMIT_BURST", "100"))
+    LOG_RATE_LIMIT_WINDOW_SEC: float = float(os.getenv("LOG_RATE_LIMIT_WINDOW_SEC", "60"))
+    
+    # パフォーマンス計測設定
+    PERF_SAMPLE_RATE: float = float(os.getenv("PERF_SAMPLE_RATE", "1.0"))
+    PERF_RESOURCE_INTERVAL_SEC: float = float(os.getenv("PERF_RESOURCE_INTERVAL_SEC", "1.0"))
+    
+    # トレース設定（リクエストIDごとのスパンを LOG_DIR/traces にJSONLで出力）
+    TRACE_ENABLED: bool = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+    TRACE_BUFFER_SIZE: int = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+    TRACE_FLUSH_INTERVAL_SEC: float = float(os.getenv("TRACE_FLUSH_INTERVAL_SEC", "5.0"))
+    
+    # プロファイル取得設定（遅いリクエスト・インジェストを自動記録）
+    PROFILE_ENABLED: bool = os.getenv("PROFILE_ENABLED", "false").lower() == "true"
+    PROFILE_THRESHOLD_SEC: float = float(os.getenv("PROFILE_THRESHOLD_SEC", "5.0"))
+    PROFILE_INGEST_THRESHOLD_SEC: float = float(os.getenv("PROFILE_INGEST_THRESHOLD_SEC", "300.0"))
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+    PROFILE_MAX_PER_HOUR: int = int(os.getenv("PROFILE_MAX_PER_HOUR", "6"))
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+    PROFILE_MAX_FILES: int = int(os.getenv("PROFILE_MAX_FILES", "50"))
+    
+    # メモリ計測設定（ピークRSS・Pythonヒープ）
+    MEMORY_TRACKING: bool = os.getenv("MEMORY_TRACKING", "false").lower() == "true"
+    MEMORY_SAMPLE_INTERVAL_MS: float = float(os.getenv("MEMORY_SAMPLE_INTERVAL_MS", "50"))
+    MEMORY_TRACEMALLOC: bool = os.getenv("MEMORY_TRACEMALLOC", "false").lower() == "true"
+    MEMORY_TRACEMALLOC_FRAMES: int = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "5"))
+    
+    # メトリクス配信設定（0: 無効）
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    
+    # APIサーバー設定（server.py）
+    API_HOST: str = os.getenv("API_HOST", "127.0.0.1")
+    API_PORT: int = int(os.getenv("API_PORT", "8080"))
+    # 同時に処理する質問数と、空きを待つ最大秒数（超えると503）
+    API_MAX_CONCURRENCY: int = int(os.getenv("API_MAX_CONCURRENCY", "4"))
+    API_QUEUE_TIMEOUT_SEC: float = float(os.getenv("API_QUEUE_TIMEOUT_SEC", "30"))
+    # 会話履歴を保持するセッション数の上限（古い順に破棄）
+    API_MAX_SESSIONS: int = int(os.getenv("API_MAX_SESSIONS", "1000"))
+    
+    # セッションのメモリ上限
+    # チャットボットの会話メモリ（質問の言い換えに使う）に残す往復数
+    CHAT_MEMORY_MAX_TURNS: int = int(os.getenv("CHAT_MEMORY_MAX_TURNS", "10"))
+    # 画面のセッションが保持する表示用の履歴のメッセージ数（古い順に破棄）と、一度に表示する件数
+    CHAT_HISTORY_MAX_MESSAGES: int = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "200"))
+    CHAT_HISTORY_PAGE_SIZE: int = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "20"))
+    # 画面のセッションのチャットボットを破棄するまでの無操作時間（秒）と、保持するセッション数の上限
+    # 破棄したセッションは次の質問時に表示用の履歴から作り直す
+    SESSION_IDLE_TTL_SEC: float = float(os.getenv("SESSION_IDLE_TTL_SEC", "1800"))
+    SESSION_MAX_ACTIVE: int = int(os.getenv("SESSION_MAX_ACTIVE", "200"))
+    
+    # ウォームアップ設定
+    ENABLE_WARMUP: bool = os.getenv("ENABLE_WARMUP", "true").lower() == "true"
+    READY_FILE: str = os.getenv("READY_FILE", "./data/.ready")
     
     def validate(self) -> Optional[str]:
         """設定の妥当性をチェック"""
@@ -49,6 +176,39 @@ class Config:
         if self.SEARCH_K <= 0:
             return "SEARCH_K は正の値である必要があります"
             
+        if self.RETRIEVAL_SHARDS < 0:
+            return "RETRIEVAL_SHARDS は0以上である必要があります"
+            
+        if self.RETRIEVAL_SHARD_PARTITION not in ("file", "product", "hash"):
+            return "RETRIEVAL_SHARD_PARTITION は file / product / hash のいずれかである必要があります"
+            
+        if self.CHAT_MEMORY_MAX_TURNS <= 0 or self.CHAT_HISTORY_MAX_MESSAGES <= 0 or self.CHAT_HISTORY_PAGE_SIZE <= 0:
+            return "CHAT_MEMORY_MAX_TURNS・CHAT_HISTORY_MAX_MESSAGES・CHAT_HISTORY_PAGE_SIZE は正の値である必要があります"
+            
+        if self.SESSION_IDLE_TTL_SEC <= 0 or self.SESSION_MAX_ACTIVE <= 0:
+            return "SESSION_IDLE_TTL_SEC・SESSION_MAX_ACTIVE は正の値である必要があります"
+            
+        if self.EMBEDDING_BACKEND not in ("torch", "onnx", "onnx-int8"):
+            return "EMBEDDING_BACKEND は torch / onnx / onnx-int8 のいずれかである必要があります"
+            
+        if self.PDF_PRIMARY_EXTRACTOR not in ("pypdf", "pdfplumber"):
+            return "PDF_PRIMARY_EXTRACTOR は pypdf / pdfplumber のいずれかである必要があります"
+        
+        if self.PDF_FALLBACK_EXTRACTOR not in ("pypdf", "pdfplumber", "none"):
+            return "PDF_FALLBACK_EXTRACTOR は pypdf / pdfplumber / none のいずれかである必要があります"
+        
+        if self.EMBEDDING_BATCH_SIZE <= 0:
+            return "EMBEDDING_BATCH_SIZE は正の値である必要があります"
+            
+        if self.LOG_FORMAT not in ("text", "json"):
+            return "LOG_FORMAT は text / json のいずれかである必要があります"
+        
+        if self.LOG_ROTATION not in ("time", "size"):
+            return "LOG_ROTATION は time / size のいずれかである必要があります"
+        
+        if not (0.0 <= self.PERF_SAMPLE_RATE <= 1.0):
+            return "PERF_SAMPLE_RATE は 0.0 から 1.0 の間である必要があります"
+            
         if not (0.0 <= self.TEMPERATURE <= 1.0):
             return "TEMPERATURE は 0.0 から 1.0 の間である必要があります"
             
@@ -0,0 +1,300 @@
+"""ヘッドレスHTTP/JSON APIサーバー
+
+Streamlit画面を経由せずに、社内ツール（Slackボット・チケットシステムなど）から
+質問応答・マニュアル取り込みを行うためのエントリーポイント。
+
+使い方:
+    python server.py                    # API_HOST:API_PORT で起動
+    python server.py --port 9000
+    LLM_STUB=true python server.py      # Groqを呼ばずに負荷試験
+
+エンドポイント:
+    POST   /api/ask                {"question": "...", "session_id": "...", "stream": false, "deadline_sec": 10, "product": "nx-os"}
+    POST   /api/ingest             multipart/form-data（PDFファイル）→ 202 とジョブID
+    GET    /api/jobs               インジェストジョブの一覧
+    GET    /api/jobs/{job_id}      ジョブの進捗（段階別・ファイル別）
+    DELETE /api/jobs/{job_id}      ジョブのキャンセル
+    GET    /api/status
+    DELETE /api/sessions/{session_id}
+    GET    /metrics                Prometheusテキスト形式
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, AsyncIterator, Callable, Dict
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from aiohttp import web
+
+from config import config
+from src.engine import ChatEngine
+from src.ingestion_jobs import get_job_queue
+from src.logger import setup_logger
+from src.metrics import CONTENT_TYPE, get_metrics_registry
+from src.tracing import new_request_id, request_context
+from src.warmup import get_warmup_status, start_background_warmup
+
+logger = setup_logger(log_dir=config.LOG_DIR, log_level=config.LOG_LEVEL)
+
+# アップロードをメモリに保持する上限（超えた分は一時ファイルに書き出す）
+UPLOAD_SPOOL_SIZE = 8 * 1024 * 1024
+
+_metrics = get_metrics_registry()
+_api_requests = _metrics.counter("api_requests_total", "APIリクエスト数", ("endpoint", "status"))
+_api_inflight = _metrics.gauge("api_inflight_requests", "処理中の質問リクエスト数")
+_api_rejected = _metrics.counter("api_rejected_total", "同時実行数の上限により拒否したリクエスト数")
+
+class ChatServer:
+    """ChatEngine をHTTPで公開するサーバー
+
+    LangChain・Chroma の呼び出しは同期処理のため、スレッドプールで実行する。
+    同時に処理する質問数はセマフォで API_MAX_CONCURRENCY に制限する。
+    """
+
+    def __init__(self, engine: ChatEngine, max_concurrency: int = None):
+        self.engine = engine
+        self.max_concurrency = max_concurrency or config.API_MAX_CONCURRENCY
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="api-worker")
+        # アップロードの保存は質問応答のスレッドを占有しないよう別スレッドで実行
+        self.ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-ingest")
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._count_requests], client_max_size=1024 ** 3)
+        app.router.add_post("/api/ask", self.handle_ask)
+        app.router.add_post("/api/ingest", self.handle_ingest)
+        app.router.add_get("/api/status", self.handle_status)
+        app.router.add_get("/api/jobs", self.handle_list_jobs)
+        app.router.add_get("/api/jobs/{job_id}", self.handle_get_job)
+        app.router.add_delete("/api/jobs/{job_id}", self.handle_cancel_job)
+        app.router.add_delete("/api/sessions/{session_id}", self.handle_delete_session)
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.on_cleanup.append(self._shutdown)
+        return app
+
+    @web.middleware
+    async def _count_requests(self, request: web.Request, handler):
+        endpoint = request.match_info.route.resource.canonical if request.match_info.route.resource else "unknown"
+        try:
+            response = await handler(request)
+        except web.HTTPException as e:
+            _api_requests.inc(endpoint=endpoint, status=str(e.status))
+            raise
+        _api_requests.inc(endpoint=endpoint, status=str(response.status))
+        return response
+
+    async def _shutdown(self, app: web.Application):
+        self.executor.shutdown(wait=False)
+        self.ingest_executor.shutdown(wait=False)
+
+    async def _run_in_thread(self, executor: ThreadPoolExecutor, request_id: str, func: Callable, *args) -> Any:
+        """リクエストIDを引き継いでスレッドプールで実行"""
+        def call():
+            with request_context(request_id):
+                return func(*args)
+        context = copy_context()
+        return await asyncio.get_running_loop().run_in_executor(executor, context.run, call)
+
+    async def _stream_in_thread(self, request_id: str, func: Callable, *args) -> AsyncIterator[Dict[str, Any]]:
+        """同期ジェネレーターをスレッドプールで実行し、イベントを順に受け取る"""
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        def produce():
+            with request_context(request_id):
+                try:
+                    for event in func(*args):
+                        loop.call_soon_threadsafe(events.put_nowait, event)
+                except Exception as e:
+                    loop.call_soon_threadsafe(events.put_nowait, {"type": "error", "error": str(e)})
+                finally:
+                    loop.call_soon_threadsafe(events.put_nowait, finished)
+
+        future = loop.run_in_executor(self.executor, copy_context().run, produce)
+        while True:
+            event = await events.get()
+            if event is finished:
+                break
+            yield event
+        await future
+
+    async def _acquire_slot(self) -> bool:
+        """処理枠を確保（API_QUEUE_TIMEOUT_SEC 以内に空かなければ False）"""
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=config.API_QUEUE_TIMEOUT_SEC)
+            return True
+        except asyncio.TimeoutError:
+            _api_rejected.inc()
+            return False
+
+    async def handle_ask(self, request: web.Request) -> web.StreamResponse:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            body = None
+        if not isinstance(body, dict):
+            return web.json_response({"error": "JSON形式のリクエストが必要です"}, status=400)
+
+        question = str(body.get("question", "")).strip()
+        if len(question) < 3:
+            return web.json_response({"error": "質問は3文字以上入力してください"}, status=400)
+        session_id = str(body.get("session_id") or uuid.uuid4().hex)
+        try:
+            deadline_sec = float(body["deadline_sec"]) if body.get("deadline_sec") is not None else None
+        except (TypeError, ValueError):
+            return web.json_response({"error": "deadline_sec は数値で指定してください"}, status=400)
+        # 検索対象の製品（未指定: 質問から推定 / "all": 絞り込まない）
+        product = body.get("product")
+        if product is not None and not isinstance(product, str):
+            return web.json_response({"error": "product は文字列で指定してください"}, status=400)
+        product = product.strip().lower() if product else None
+        request_id = request.headers.get("X-Request-ID") or new_request_id()
+
+        if not await self._acquire_slot():
+            return web.json_response({"error": "混雑しています。しばらく待ってから再度お試しください"}, status=503)
+
+        _api_inflight.inc()
+        start_time = time.perf_counter()
+        try:
+            if body.get("stream"):
+                return await self._stream_answer(request, request_id, session_id, question, deadline_sec, product)
+
+            answer, sources = await self._run_in_thread(
+                self.executor, request_id, self.engine.ask, session_id, question, deadline_sec, product
+            )
+            return web.json_response({
+                "answer": answer,
+                "sources": sources,
+                "session_id": session_id,
+                "request_id": request_id,
+                "processing_time": time.perf_counter() - start_time
+            }, headers={"X-Request-ID": request_id})
+        finally:
+            _api_inflight.dec()
+            self.semaphore.release()
+
+    async def _stream_answer(
+        self,
+        request: web.Request,
+        request_id: str,
+        session_id: str,
+        question: str,
+        deadline_sec: float = None,
+        product: str = None
+    ) -> web.StreamResponse:
+        """回答をNDJSON（1行1イベント）で逐次返す"""
+        response = web.StreamResponse(headers={
+            "Content-Type": "application/x-ndjson; charset=utf-8",
+            "X-Request-ID": request_id
+        })
+        await response.prepare(request)
+        await response.write((json.dumps(
+            {"type": "start", "session_id": session_id, "request_id": request_id}, ensure_ascii=False
+        ) + "\n").encode("utf-8"))
+
+        async for event in self._stream_in_thread(
+            request_id, self.engine.ask_stream, session_id, question, deadline_sec, product
+        ):
+            await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def handle_ingest(self, request: web.Request) -> web.Response:
+        reader = await request.multipart()
+        uploads = []
+        try:
+            async for part in reader:
+                if not part.filename:
+                    continue
+                if not part.filename.lower().endswith(".pdf"):
+                    return web.json_response({"error": f"PDF以外のファイルは取り込めません: {part.filename}"}, status=400)
+                spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+                while True:
+                    chunk = await part.read_chunk()
+                    if not chunk:
+                        break
+                    spooled.write(chunk)
+                spooled.seek(0)
+                uploads.append((part.filename, spooled))
+
+            if not uploads:
+                return web.json_response({"error": "PDFファイルが含まれていません"}, status=400)
+
+            request_id = request.headers.get("X-Request-ID") or new_request_id()
+            # ファイルの保存までを行い、取り込み自体はジョブとしてバックグラウンドで実行
+            summary = await self._run_in_thread(self.ingest_executor, request_id, self.engine.ingest, uploads)
+            return web.json_response({**summary, "request_id": request_id}, status=202 if summary["job"] else 200)
+        except Exception as e:
+            logger.error(f"APIの取り込みエラー: {str(e)}")
+            return web.json_response({"error": str(e)}, status=500)
+        finally:
+            for _, spooled in uploads:
+                spooled.close()
+
+    async def handle_status(self, request: web.Request) -> web.Response:
+        status = await asyncio.get_running_loop().run_in_executor(None, self.engine.get_status)
+        status.update({
+            "warmup": get_warmup_status(),
+            "max_concurrency": self.max_concurrency,
+            "inflight": _api_inflight.get()
+        })
+        return web.json_response(status, dumps=lambda obj: json.dumps(obj, ensure_ascii=False, default=str))
+
+    async def handle_list_jobs(self, request: web.Request) -> web.Response:
+        return web.json_response({"jobs": get_job_queue().list_jobs()})
+
+    async def handle_get_job(self, request: web.Request) -> web.Response:
+        job = get_job_queue().get(request.match_info["job_id"])
+        if job is None:
+            return web.json_response({"error": "ジョブが見つかりません"}, status=404)
+        return web.json_response(job.to_dict())
+
+    async def handle_cancel_job(self, request: web.Request) -> web.Response:
+        job_id = request.match_info["job_id"]
+        if get_job_queue().get(job_id) is None:
+            return web.json_response({"error": "ジョブが見つかりません"}, status=404)
+        cancelled = get_job_queue().cancel(job_id)
+        return web.json_response({"cancelled": cancelled}, status=202 if cancelled else 409)
+
+    async def handle_delete_session(self, request: web.Request) -> web.Response:
+        removed = self.engine.clear_session(request.match_info["session_id"])
+        return web.json_response({"removed": removed}, status=200 if removed else 404)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        body = await asyncio.get_running_loop().run_in_executor(None, get_metrics_registry().render)
+        return web.Response(body=body.encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+def main() -> int:
+    """APIサーバーを起動"""
+    parser = argparse.ArgumentParser(description="ネットワークマニュアルチャットボットのAPIサーバー")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    args = parser.parse_args()
+
+    if not config.LLM_STUB:
+        error = config.validate()
+        if error:
+            logger.error(f"設定エラー: {error}")
+            return 1
+
+    if config.ENABLE_WARMUP:
+        start_background_warmup()
+
+    async def create_app() -> web.Application:
+        # セマフォはイベントループ内で作成する
+        return ChatServer(ChatEngine()).create_app()
+
+    logger.info(f"APIサーバー起動 - http://{args.host}:{args.port}")
+    web.run_app(create_app(), host=args.host, port=args.port, print=None)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
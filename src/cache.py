@@ -1,13 +1,24 @@
 import hashlib
 import json
 import os
+import threading
 import time
 from pathlib import Path
 from typing import Optional, Tuple, List, Dict, Any
 from src.logger import get_logger
+from src.metrics import get_metrics_registry
+
+# 回答キャッシュの参照結果（全セッション合計）
+_cache_requests = get_metrics_registry().counter(
+    "chatbot_cache_requests_total", "回答キャッシュの参照回数", ("result",)
+)
 
 class SimpleCache:
-    """質問応答結果のキャッシュ管理クラス"""
+    """質問応答結果のキャッシュ管理クラス
+    
+    APIサーバーでは複数のスレッドから共有されるため、ファイルは一時ファイル経由で置き換え、
+    統計はロックを取って更新する。
+    """
     
     def __init__(self, cache_dir: str = "./data/cache", max_cache_size: int = 1000):
         self.cache_dir = Path(cache_dir)
@@ -18,6 +29,7 @@ class SimpleCache:
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         
         # キャッシュ統計
+        self._stats_lock = threading.Lock()
         self.cache_stats = {
             "hits": 0,
             "misses": 0,
@@ -36,15 +48,22 @@ class SimpleCache:
         """キャッシュファイルのパスを取得"""
         return self.cache_dir / f"{cache_key}.json"
     
+    def _count(self, *keys: str):
+        """統計を加算"""
+        with self._stats_lock:
+            for key in keys:
+                self.cache_stats[key] += 1
+    
     def get(self, question: str) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
         """キャッシュから回答を取得"""
-        self.cache_stats["total_requests"] += 1
+        self._count("total_requests")
         
         cache_key = self._get_cache_key(question)
         cache_file = self._get_cache_file_path(cache_key)
         
         if not cache_file.exists():
-            self.cache_stats["misses"] += 1
+            self._count("misses")
+            _cache_requests.inc(result="miss")
             self.logger.debug(f"キャッシュミス - 質問: {question[:50]}...")
             return None
         
@@ -56,11 +75,13 @@ class SimpleCache:
             cache_age = time.time() - cached_data.get('timestamp', 0)
             if cache_age > 86400:  # 24時間
                 self.logger.debug(f"キャッシュ期限切れ - 質問: {question[:50]}...")
-                cache_file.unlink()  # 期限切れキャッシュを削除
-                self.cache_stats["misses"] += 1
+                cache_file.unlink(missing_ok=True)  # 期限切れキャッシュを削除
+                self._count("misses")
+                _cache_requests.inc(result="expired")
                 return None
             
-            self.cache_stats["hits"] += 1
+            self._count("hits")
+            _cache_requests.inc(result="hit")
             self.logger.debug(f"キャッシュヒット - 質問: {question[:50]}...")
             
             return cached_data['answer'], cached_data['sources']
@@ -68,9 +89,9 @@ class SimpleCache:
         except (json.JSONDecodeError, KeyError, FileNotFoundError) as e:
             self.logger.error(f"キャッシュ読み込みエラー: {str(e)}")
             # 破損したキャッシュファイルを削除
-            if cache_file.exists():
-                cache_file.unlink()
-            self.cache_stats["misses"] += 1
+            cache_file.unlink(missing_ok=True)
+            self._count("misses")
+            _cache_requests.inc(result="error")
             return None
     
     def set(self, question: str, answer: str, sources: List[Dict[str, Any]]):
@@ -86,9 +107,12 @@ class SimpleCache:
             'cache_key': cache_key
         }
         
+        # 同じ質問の get が書き込み途中のファイルを読まないよう、一時ファイルに書いてから置き換える
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
         try:
-            with open(cache_file, 'w', encoding='utf-8') as f:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(cache_data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, cache_file)
             
             self.logger.debug(f"キャッシュ保存 - 質問: {question[:50]}...")
             
@@ -96,6 +120,7 @@ class SimpleCache:
             self._cleanup_old_cache()
             
         except Exception as e:
+            tmp_file.unlink(missing_ok=True)
             self.logger.error(f"キャッシュ保存エラー: {str(e)}")
     
     def _cleanup_old_cache(self):
@@ -112,7 +137,8 @@ class SimpleCache:
             # 古いファイルを削除
             files_to_delete = len(cache_files) - self.max_cache_size
             for i in range(files_to_delete):
-                cache_files[i].unlink()
+                # 他のスレッドが先に削除している場合がある
+                cache_files[i].unlink(missing_ok=True)
                 self.logger.debug(f"古いキャッシュファイルを削除: {cache_files[i].name}")
                 
         except Exception as e:
@@ -120,14 +146,16 @@ class SimpleCache:
     
     def get_stats(self) -> Dict[str, Any]:
         """キャッシュ統計を取得"""
+        with self._stats_lock:
+            stats = dict(self.cache_stats)
         hit_rate = 0.0
-        if self.cache_stats["total_requests"] > 0:
-            hit_rate = (self.cache_stats["hits"] / self.cache_stats["total_requests"]) * 100
+        if stats["total_requests"] > 0:
+            hit_rate = (stats["hits"] / stats["total_requests"]) * 100
         
         return {
-            "total_requests": self.cache_stats["total_requests"],
-            "hits": self.cache_stats["hits"],
-            "misses": self.cache_stats["misses"],
+            "total_requests": stats["total_requests"],
+            "hits": stats["hits"],
+            "misses": stats["misses"],
             "hit_rate": hit_rate,
             "cache_files": len(list(self.cache_dir.glob("*.json")))
         }
@@ -136,14 +164,15 @@ class SimpleCache:
         """すべてのキャッシュを削除"""
         try:
             for cache_file in self.cache_dir.glob("*.json"):
-                cache_file.unlink()
+                cache_file.unlink(missing_ok=True)
             
             # 統計をリセット
-            self.cache_stats = {
-                "hits": 0,
-                "misses": 0,
-                "total_requests": 0
-            }
+            with self._stats_lock:
+                self.cache_stats = {
+                    "hits": 0,
+                    "misses": 0,
+                    "total_requests": 0
+                }
             
             self.logger.info("キャッシュをクリアしました")
             
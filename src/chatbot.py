@@ -1,33 +1,116 @@
 import time
-from typing import List, Tuple
-from groq import RateLimitError, APIError
-from langchain_groq import ChatGroq
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.retrievers import BaseRetriever
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
 
 from config import config
+from src.lazy_imports import lazy_import
 from src.logger import get_logger
 from src.cache import SimpleCache
-from src.performance import measure_time
+from src.deadline import Deadline, DeadlineExceeded, deadline_context, get_deadline, remaining_time
+from src.metrics import get_metrics_registry
+from src.memory_tracking import track_memory
+from src.model_router import ModelRouter, get_llm
+from src.performance import measure_time, span
+from src.products import ALL_PRODUCTS, infer_product, product_label
+from src.profiling import profiled
+from src.tracing import request_context
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.retrievers import BaseRetriever
+
+# 全セッション合計のリクエスト指標
+_metrics = get_metrics_registry()
+_requests_total = _metrics.counter("chatbot_requests_total", "質問リクエスト数", ("outcome",))
+_request_duration = _metrics.histogram(
+    "chatbot_request_duration_seconds", "質問リクエストの処理時間", ("outcome",)
+)
+_llm_retries = _metrics.counter("chatbot_llm_retries_total", "LLM呼び出しの再試行回数", ("reason",))
+_rate_limit_wait = _metrics.counter(
+    "chatbot_rate_limit_wait_seconds_total", "レート制限による待機時間の合計（秒）"
+)
+_time_to_first_token = _metrics.histogram(
+    "chatbot_time_to_first_token_seconds", "ストリーミング応答で最初のトークンを返すまでの時間"
+)
+_degraded_responses = _metrics.counter(
+    "chatbot_degraded_responses_total", "期限内に生成できず抜粋のみで回答した件数", ("reason",)
+)
+_product_filters = _metrics.counter(
+    "chatbot_product_filter_total", "検索の製品の絞り込み（selected: 指定 / inferred: 質問から推定 / none: なし）", ("mode",)
+)
+
+# 簡易回答に含めるマニュアル抜粋の1件あたりの最大文字数
+DEGRADED_EXCERPT_CHARS = 400
+
+# LLM_STUB 有効時に返す固定の回答（負荷試験用）
+STUB_ANSWER = (
+    "【スタブ応答】これは負荷試験用の固定回答です。\n"
+    "1. 設定モードに入ります: configure terminal\n"
+    "2. 設定を保存します: write memory"
+)
+
+def create_llm(model_name: str = None, max_retries: int = None) -> "BaseChatModel":
+    """LLMクライアントを作成（LLM_STUB 有効時はGroqを呼ばないスタブ）
+    
+    max_retries を指定するとGroqクライアント内部の自動再試行回数を変更する。
+    """
+    if config.LLM_STUB:
+        FakeListChatModel = lazy_import("langchain_core.language_models.fake_chat_models").FakeListChatModel
+        # sleep は invoke では1回、stream では1文字ごとに待機する
+        return FakeListChatModel(responses=[STUB_ANSWER], sleep=config.LLM_STUB_DELAY_SEC or None)
+    
+    ChatGroq = lazy_import("langchain_groq").ChatGroq
+    options = {} if max_retries is None else {"max_retries": max_retries}
+    if config.GROQ_BASE_URL:
+        options["base_url"] = config.GROQ_BASE_URL
+    return ChatGroq(
+        model_name=model_name or config.MODEL_NAME,
+        temperature=config.TEMPERATURE,
+        max_tokens=config.MAX_TOKENS,
+        **options
+    )
+
+def _record_request(outcome: str, start_time: float):
+    """リクエストの結果と処理時間を記録"""
+    _requests_total.inc(outcome=outcome)
+    _request_duration.observe(time.time() - start_time, outcome=outcome)
 
 class NetworkManualChatbot:
     """ネットワークマニュアル対応チャットボット"""
     
-    def __init__(self, retriever: BaseRetriever, model_name: str = None):
+    def __init__(
+        self,
+        retriever: "BaseRetriever",
+        model_name: str = None,
+        llm: Optional["BaseChatModel"] = None,
+        cache: Optional[SimpleCache] = None,
+        router: Optional[ModelRouter] = None
+    ):
+        """llm・cache・router を渡すと複数の会話で共有する（APIサーバーでセッションごとに生成する場合など）
+        
+        MODEL_ROUTING 有効時は質問ごとにモデルを選ぶ（llm のみを渡した場合は常にそのモデルで回答）。
+        """
         self.retriever = retriever
         self.logger = get_logger()
         
         # 設定から値を取得
         model_name = model_name or config.MODEL_NAME
+        self.model_name = model_name
         
-        # Groq APIを使用
-        self.llm = ChatGroq(
-            model_name=model_name,
-            temperature=config.TEMPERATURE,
-            max_tokens=config.MAX_TOKENS
-        )
+        # 重量級ライブラリはチャットボット生成時に読み込む
+        ChatPromptTemplate = lazy_import("langchain.prompts").ChatPromptTemplate
+        ConversationBufferMemory = lazy_import("langchain.memory").ConversationBufferMemory
+        
+        # 質問に応じたモデルの振り分けと、レート制限・タイムアウト時の切り替え
+        if router is None and llm is None and config.MODEL_ROUTING:
+            router = ModelRouter(model_name)
+        self.router = router
+        # 直近の回答で使ったモデル（DEBUG表示用）
+        self.last_route: Optional[dict] = None
+        # 直近の検索で絞り込んだ製品（絞り込みなしはNone）
+        self.last_product: Optional[str] = None
+        
+        # Groq APIを使用（再試行は期限を考慮する ask のループで行うため、クライアント内部では再試行しない）
+        self.llm = llm or (get_llm(model_name) if router else create_llm(model_name, max_retries=0))
         
         # 改善されたプロンプトテンプレート
         self.system_template = """あなたはCISCOなどのネットワーク機器の技術サポート専門家です。
@@ -54,6 +137,11 @@ class NetworkManualChatbot:
         
         self.prompt = ChatPromptTemplate.from_template(self.system_template)
         
+        # 会話履歴を踏まえて質問を単独で意味が通じる形に言い換えるプロンプト
+        self.condense_prompt = lazy_import(
+            "langchain.chains.conversational_retrieval.prompts"
+        ).CONDENSE_QUESTION_PROMPT
+        
         # メモリの初期化
         self.memory = ConversationBufferMemory(
             memory_key="chat_history",
@@ -61,18 +149,16 @@ class NetworkManualChatbot:
             output_key="answer"
         )
         
-        # 会話型検索チェーンの構築
-        self.qa_chain = ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.retriever,
-            memory=self.memory,
-            combine_docs_chain_kwargs={"prompt": self.prompt},
-            return_source_documents=True,
-            verbose=config.DEBUG
-        )
+        # 会話型検索の各段階（言い換え・検索・生成）を個別に計測するため、
+        # ConversationalRetrievalChain と同じ処理を段階ごとに実行する
+        self.condense_chain = self.condense_prompt | self.llm
+        self.answer_chain = self.prompt | self.llm
         
         # キャッシュの初期化
-        if config.ENABLE_CACHE:
+        if cache is not None:
+            self.cache = cache
+            self.logger.info("キャッシュ機能が有効です（共有）")
+        elif config.ENABLE_CACHE:
             self.cache = SimpleCache(cache_dir=config.CACHE_DIR)
             self.logger.info("キャッシュ機能が有効です")
         else:
@@ -81,94 +167,426 @@ class NetworkManualChatbot:
         
         self.logger.info(f"チャットボット初期化完了 - モデル: {model_name}")
     
+    @staticmethod
+    def _format_chat_history(messages: list) -> str:
+        """会話履歴を言い換えプロンプト用の文字列に変換"""
+        lines = []
+        for message in messages:
+            role = "Human" if message.type == "human" else "Assistant"
+            lines.append(f"{role}: {message.content}")
+        return "\n".join(lines)
+    
+    @staticmethod
+    def _format_sources(source_documents: list) -> List[dict]:
+        """参照文書を表示用のソース情報に変換"""
+        sources = []
+        for doc in source_documents:
+            source_info = {
+                "file": doc.metadata.get("file_name", "Unknown"),
+                "page": doc.metadata.get("page", "Unknown"),
+                "content": doc.page_content[:200] + "..."
+            }
+            sources.append(source_info)
+        return sources
+    
+    def _resolve_product(self, question: str, product: Optional[str]) -> Optional[str]:
+        """検索を絞り込む製品（None: 質問から推定 / ALL_PRODUCTS: 絞り込まない / それ以外: 指定の製品）
+        
+        検索器が製品の一覧（products()）を持たない場合は絞り込まない。
+        """
+        products = self.retriever.products() if hasattr(self.retriever, "products") else {}
+        if not products or product == ALL_PRODUCTS:
+            mode, resolved = "none", None
+        elif product:
+            if product in products:
+                mode, resolved = "selected", product
+            else:
+                self.logger.warning(f"インデックスにない製品が指定されたため絞り込みません: {product}")
+                mode, resolved = "none", None
+        else:
+            resolved = infer_product(question, products) if config.PRODUCT_INFERENCE else None
+            mode = "inferred" if resolved else "none"
+            if resolved:
+                self.logger.info(f"質問から製品を推定: {product_label(resolved)}")
+        _product_filters.inc(mode=mode)
+        return resolved
+    
+    @staticmethod
+    def _cache_question(question: str, product: Optional[str]) -> str:
+        """回答キャッシュのキーにする質問（製品を指定した場合は検索結果が変わるため区別する）"""
+        return f"[{product}] {question}" if product else question
+    
+    def _retrieve(self, question: str, product: Optional[str] = None) -> Tuple[str, list]:
+        """言い換え → 検索 を実行して単独の質問と参照文書を返す（product は _resolve_product を参照）"""
+        chat_history = self.memory.load_memory_variables({})["chat_history"]
+        
+        # 期限が近い場合は言い換えを省略し、残り時間を回答の生成に回す
+        deadline = get_deadline()
+        if chat_history and deadline is not None and not deadline.fits(2 * config.ASK_MIN_GENERATION_SEC):
+            self.logger.warning("期限が近いため質問の言い換えを省略します")
+            chat_history = []
+        
+        # 会話履歴がある場合は質問を言い換え（単純な書き換えのため小さいモデルに振り分ける）
+        if chat_history:
+            with span("condense") as condense_span:
+                standalone_question, route = self._invoke_llm(
+                    self.condense_prompt,
+                    {"chat_history": self._format_chat_history(chat_history), "question": question},
+                    question,
+                    route="simple"
+                )
+                condense_span.set_attribute("model", route["model"])
+        else:
+            standalone_question = question
+        
+        product = self._resolve_product(standalone_question, product)
+        self.last_product = product
+        with span("retrieval", product=product or "") as retrieval_span:
+            if product:
+                source_documents = self.retriever.invoke(standalone_question, product=product)
+            else:
+                source_documents = self.retriever.invoke(standalone_question)
+            retrieval_span.set_attribute("documents", len(source_documents))
+        
+        return standalone_question, source_documents
+    
+    def _invoke_llm(self, prompt, inputs: dict, question: str, route: str = None) -> Tuple[str, dict]:
+        """プロンプトをLLMで実行して (テキスト, 振り分け情報) を返す"""
+        if self.router is None:
+            # 期限がある場合は残り時間をLLMクライアントのタイムアウトにする
+            timeout = remaining_time()
+            if timeout is not None:
+                chain = prompt | self.llm.bind(timeout=timeout)
+            else:
+                chain = self.condense_chain if prompt is self.condense_prompt else self.answer_chain
+            return chain.invoke(inputs).content, {"route": None, "model": self.model_name, "fallbacks": []}
+        
+        result, route_info = self.router.invoke(question, lambda llm: (prompt | llm).invoke(inputs), route)
+        return result.content, route_info
+    
+    @staticmethod
+    def _record_route(generation_span, route_info: dict):
+        """使ったモデルと切り替えの経過をスパンに記録"""
+        generation_span.set_attribute("model", route_info["model"])
+        if route_info.get("route"):
+            generation_span.set_attribute("route", route_info["route"])
+        for attempt in route_info.get("fallbacks", []):
+            generation_span.add_event("model_fallback", **attempt)
+    
+    def _generate(self, question: str, standalone_question: str, source_documents: list) -> str:
+        """参照文書から回答を生成して会話履歴に保存"""
+        with span("generation") as generation_span:
+            context = "\n\n".join(doc.page_content for doc in source_documents)
+            answer, route_info = self._invoke_llm(
+                self.prompt,
+                {"context": context, "question": standalone_question},
+                standalone_question
+            )
+            self.last_route = route_info
+            self._record_route(generation_span, route_info)
+            generation_span.set_attribute("context_chars", len(context))
+            generation_span.set_attribute("answer_chars", len(answer))
+        
+        self._remember(question, answer)
+        return answer
+    
+    @staticmethod
+    def _make_deadline(deadline_sec: Optional[float]) -> Optional[Deadline]:
+        """リクエストの期限（deadline_sec 未指定時は ASK_DEADLINE_SEC、0以下で期限なし）"""
+        seconds = config.ASK_DEADLINE_SEC if deadline_sec is None else deadline_sec
+        return Deadline(seconds) if seconds and seconds > 0 else None
+    
+    @staticmethod
+    def _out_of_time(deadline: Optional[Deadline], wait_sec: float = 0.0) -> bool:
+        """wait_sec 秒待った後に回答の生成が期限内に収まらないか"""
+        return deadline is not None and not deadline.fits(wait_sec + config.ASK_MIN_GENERATION_SEC)
+    
+    def _degraded_answer(self, source_documents: list) -> Tuple[str, List[dict]]:
+        """生成が期限内に収まらない場合の簡易回答（検索したマニュアルの抜粋とページ）"""
+        excerpts = source_documents[:config.DEGRADED_EXCERPTS]
+        if not excerpts:
+            return (
+                "⚠️ **簡易回答** 時間内に回答を生成できず、関連するマニュアルの記載も見つかりませんでした。"
+                "少し待ってから再度お試しください。",
+                []
+            )
+        
+        lines = [
+            "⚠️ **簡易回答（マニュアルの抜粋のみ）**",
+            "時間内に回答を生成できなかったため、関連するマニュアルの記載をそのまま表示します。",
+            ""
+        ]
+        for i, doc in enumerate(excerpts, 1):
+            excerpt = doc.page_content[:DEGRADED_EXCERPT_CHARS].strip()
+            if len(doc.page_content) > DEGRADED_EXCERPT_CHARS:
+                excerpt += "..."
+            lines.append(
+                f"**{i}. {doc.metadata.get('file_name', 'Unknown')}（p.{doc.metadata.get('page', '?')}）**"
+            )
+            lines.append("> " + excerpt.replace("\n", "\n> "))
+            lines.append("")
+        return "\n".join(lines).rstrip(), self._format_sources(excerpts)
+    
+    def _degraded_response(self, source_documents: list, reason: str, start_time: float, ask_span) -> Tuple[str, List[dict]]:
+        """簡易回答を返して記録（キャッシュ・会話履歴には保存しない）"""
+        answer, sources = self._degraded_answer(source_documents)
+        _degraded_responses.inc(reason=reason)
+        _record_request("degraded", start_time)
+        ask_span.set_attribute("outcome", "degraded")
+        ask_span.set_attribute("degraded_reason", reason)
+        self.last_route = None
+        self.logger.warning(
+            f"簡易回答を返却 - 理由: {reason}, 処理時間: {time.time() - start_time:.3f}秒, 抜粋数: {len(sources)}"
+        )
+        return answer, sources
+    
     @measure_time(log_result=True)
-    def ask(self, question: str) -> Tuple[str, List[dict]]:
-        """質問に対する回答を生成"""
+    @profiled("ask")
+    @track_memory("ask")
+    def ask(self, question: str, deadline_sec: float = None, product: str = None) -> Tuple[str, List[dict]]:
+        """質問に対する回答を生成
+        
+        deadline_sec（既定: ASK_DEADLINE_SEC、0で無効）はリクエスト全体の期限で、質問の埋め込み・
+        LLM呼び出しのタイムアウトと再試行の待機に反映される。残り時間で回答の生成が収まらない場合は、
+        検索したマニュアルの抜粋のみの簡易回答を返す。
+        product は検索対象の製品（未指定: 質問から推定 / "all": 絞り込まない）。
+        """
         start_time = time.time()
+        groq = lazy_import("groq")
+        deadline = self._make_deadline(deadline_sec)
+        self.last_product = None
         
-        try:
-            # キャッシュから確認
-            if self.cache:
-                cached_result = self.cache.get(question)
-                if cached_result:
-                    processing_time = time.time() - start_time
-                    self.logger.info(f"キャッシュから回答取得 - 処理時間: {processing_time:.3f}秒")
-                    return cached_result
+        # 各段階は "ask.<段階名>" のスパンとして記録され、同じリクエストIDでトレースに出力される
+        with request_context(), deadline_context(deadline), span("ask", question_chars=len(question)) as ask_span:
+            try:
+                # キャッシュから確認
+                if self.cache:
+                    with span("cache_lookup") as lookup_span:
+                        cached_result = self.cache.get(self._cache_question(question, product))
+                        lookup_span.set_attribute("hit", bool(cached_result))
+                    if cached_result:
+                        processing_time = time.time() - start_time
+                        self.logger.info(f"キャッシュから回答取得 - 処理時間: {processing_time:.3f}秒")
+                        _record_request("cache_hit", start_time)
+                        ask_span.set_attribute("outcome", "cache_hit")
+                        return cached_result
             
-            # 通常の処理（リトライ機能付き）
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    result = self.qa_chain({"question": question})
-                    
-                    # ソース情報を整理
-                    sources = []
-                    for doc in result.get("source_documents", []):
-                        source_info = {
-                            "file": doc.metadata.get("file_name", "Unknown"),
-                            "page": doc.metadata.get("page", "Unknown"),
-                            "content": doc.page_content[:200] + "..."
-                        }
-                        sources.append(source_info)
+                # 通常の処理（リトライ機能付き。検索結果は再試行時にも使い回す）
+                retrieved = None
+                max_retries = 3
+                for attempt in range(max_retries):
+                    try:
+                        if retrieved is None:
+                            retrieved = self._retrieve(question, product)
+                        standalone_question, source_documents = retrieved
+                        
+                        # 残り時間で生成が収まらない場合は抜粋のみで回答
+                        if self._out_of_time(deadline):
+                            return self._degraded_response(source_documents, "deadline", start_time, ask_span)
+                        
+                        answer = self._generate(question, standalone_question, source_documents)
                     
-                    answer = result["answer"]
+                        # ソース情報を整理
+                        sources = self._format_sources(source_documents)
                     
-                    # キャッシュに保存
-                    if self.cache:
-                        self.cache.set(question, answer, sources)
+                        # キャッシュに保存
+                        if self.cache:
+                            with span("cache_write"):
+                                self.cache.set(self._cache_question(question, product), answer, sources)
                     
-                    # ログ記録
-                    processing_time = time.time() - start_time
-                    self.logger.info(
-                        f"質問応答完了 - 処理時間: {processing_time:.3f}秒, "
-                        f"参照元数: {len(sources)}"
-                    )
+                        # ログ記録
+                        processing_time = time.time() - start_time
+                        self.logger.info(
+                            f"質問応答完了 - 処理時間: {processing_time:.3f}秒, "
+                            f"参照元数: {len(sources)}"
+                        )
+                        _record_request("success", start_time)
+                        ask_span.set_attribute("outcome", "success")
+                        ask_span.set_attribute("attempts", attempt + 1)
                     
-                    return answer, sources
+                        return answer, sources
+                
+                    except DeadlineExceeded as e:
+                        if retrieved is not None:
+                            return self._degraded_response(retrieved[1], "deadline", start_time, ask_span)
+                        self.logger.error(f"期限超過: {str(e)}")
+                        _record_request("deadline_exceeded", start_time)
+                        ask_span.set_attribute("outcome", "deadline_exceeded")
+                        return "時間内に関連するマニュアルを検索できませんでした。少し待ってから再度お試しください。", []
                 
-                except RateLimitError as e:
-                    if attempt < max_retries - 1:
+                    except groq.RateLimitError as e:
                         wait_time = 2 ** attempt  # 指数バックオフ
-                        self.logger.warning(
-                            f"レート制限発生 - {wait_time}秒待機後に再試行 "
-                            f"(試行回数: {attempt + 1}/{max_retries})"
-                        )
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        error_message = (
-                            "レート制限に達しました。少し待ってから再度お試しください。\n\n"
-                            "Groqの無料プランでは1分間に30リクエストの制限があります。"
-                        )
-                        self.logger.error(f"レート制限エラー: {str(e)}")
-                        return error_message, []
+                        if attempt < max_retries - 1 and not self._out_of_time(deadline, wait_time):
+                            self.logger.warning(
+                                f"レート制限発生 - {wait_time}秒待機後に再試行 "
+                                f"(試行回数: {attempt + 1}/{max_retries})"
+                            )
+                            _llm_retries.inc(reason="rate_limit")
+                            _rate_limit_wait.inc(wait_time)
+                            ask_span.add_event("retry", reason="rate_limit", attempt=attempt + 1, wait_sec=wait_time)
+                            time.sleep(wait_time)
+                            continue
+                        elif retrieved is not None and deadline is not None:
+                            # 待機すると期限を過ぎるため、検索済みの抜粋で回答
+                            return self._degraded_response(retrieved[1], "rate_limit", start_time, ask_span)
+                        else:
+                            error_message = (
+                                "レート制限に達しました。少し待ってから再度お試しください。\n\n"
+                                "Groqの無料プランでは1分間に30リクエストの制限があります。"
+                            )
+                            self.logger.error(f"レート制限エラー: {str(e)}")
+                            _record_request("rate_limited", start_time)
+                            ask_span.set_attribute("outcome", "rate_limited")
+                            return error_message, []
                 
-                except APIError as e:
-                    error_message = f"API エラーが発生しました: {str(e)}"
-                    self.logger.error(f"Groq API エラー: {str(e)}")
-                    return error_message, []
+                    except groq.APIError as e:
+                        if isinstance(e, groq.APITimeoutError) and retrieved is not None and deadline is not None:
+                            return self._degraded_response(retrieved[1], "timeout", start_time, ask_span)
+                        error_message = f"API エラーが発生しました: {str(e)}"
+                        self.logger.error(f"Groq API エラー: {str(e)}")
+                        _record_request("api_error", start_time)
+                        ask_span.set_attribute("outcome", "api_error")
+                        ask_span.set_attribute("error", str(e))
+                        return error_message, []
                 
-                except Exception as e:
-                    if attempt < max_retries - 1:
+                    except Exception as e:
                         wait_time = 1
-                        self.logger.warning(
-                            f"予期しないエラー - {wait_time}秒待機後に再試行: {str(e)} "
-                            f"(試行回数: {attempt + 1}/{max_retries})"
-                        )
-                        time.sleep(wait_time)
-                        continue
+                        if attempt < max_retries - 1 and not self._out_of_time(deadline, wait_time):
+                            self.logger.warning(
+                                f"予期しないエラー - {wait_time}秒待機後に再試行: {str(e)} "
+                                f"(試行回数: {attempt + 1}/{max_retries})"
+                            )
+                            _llm_retries.inc(reason="error")
+                            ask_span.add_event("retry", reason="error", attempt=attempt + 1, wait_sec=wait_time, error=str(e))
+                            time.sleep(wait_time)
+                            continue
+                        else:
+                            error_message = (
+                                f"エラーが発生しました: {str(e)}\n\n"
+                                "TROUBLESHOOTING.mdを確認するか、しばらく待ってから再度お試しください。"
+                            )
+                            self.logger.error(f"予期しないエラー: {str(e)}")
+                            _record_request("error", start_time)
+                            ask_span.set_attribute("outcome", "error")
+                            ask_span.set_attribute("error", str(e))
+                            return error_message, []
+            
+            except Exception as e:
+                error_message = f"システムエラーが発生しました: {str(e)}"
+                self.logger.error(f"システムエラー: {str(e)}")
+                _record_request("error", start_time)
+                ask_span.set_attribute("outcome", "error")
+                ask_span.set_attribute("error", str(e))
+                return error_message, []
+    
+    def ask_stream(self, question: str, deadline_sec: float = None, product: str = None) -> Iterator[Dict[str, Any]]:
+        """質問に対する回答を逐次生成
+        
+        {"type": "sources"} → {"type": "token"} の繰り返し → {"type": "done"} の順にイベントを返し、
+        失敗時は {"type": "error"} を返す。トークンを返し始めた後は再試行できないため、
+        ask と異なりリトライは行わない。期限の扱いは ask と同じで、簡易回答の場合は
+        done イベントに "degraded": true が付く。
+        """
+        start_time = time.time()
+        groq = lazy_import("groq")
+        deadline = self._make_deadline(deadline_sec)
+        self.last_product = None
+        
+        with request_context(), deadline_context(deadline), span("ask_stream", question_chars=len(question)) as ask_span:
+            try:
+                if self.cache:
+                    with span("cache_lookup") as lookup_span:
+                        cached_result = self.cache.get(self._cache_question(question, product))
+                        lookup_span.set_attribute("hit", bool(cached_result))
+                    if cached_result:
+                        answer, sources = cached_result
+                        _record_request("cache_hit", start_time)
+                        ask_span.set_attribute("outcome", "cache_hit")
+                        yield {"type": "sources", "sources": sources}
+                        yield {"type": "token", "text": answer}
+                        yield {"type": "done", "answer": answer, "sources": sources}
+                        return
+                
+                standalone_question, source_documents = self._retrieve(question, product)
+                
+                # 残り時間で生成が収まらない場合は抜粋のみで回答
+                if self._out_of_time(deadline):
+                    answer, sources = self._degraded_response(source_documents, "deadline", start_time, ask_span)
+                    yield {"type": "sources", "sources": sources}
+                    yield {"type": "token", "text": answer}
+                    yield {"type": "done", "answer": answer, "sources": sources, "degraded": True}
+                    return
+                
+                sources = self._format_sources(source_documents)
+                yield {"type": "sources", "sources": sources}
+                
+                chunks = []
+                with span("generation", streaming=True) as generation_span:
+                    context = "\n\n".join(doc.page_content for doc in source_documents)
+                    inputs = {"context": context, "question": standalone_question}
+                    if self.router is None:
+                        route_info = {"route": None, "model": self.model_name, "fallbacks": []}
+                        timeout = remaining_time()
+                        chain = self.answer_chain if timeout is None else self.prompt | self.llm.bind(timeout=timeout)
+                        stream = ((chunk, route_info) for chunk in chain.stream(inputs))
                     else:
-                        error_message = (
-                            f"エラーが発生しました: {str(e)}\n\n"
-                            "TROUBLESHOOTING.mdを確認するか、しばらく待ってから再度お試しください。"
-                        )
-                        self.logger.error(f"予期しないエラー: {str(e)}")
-                        return error_message, []
+                        stream = self.router.stream(standalone_question, lambda llm: (self.prompt | llm).stream(inputs))
+                    for chunk, route_info in stream:
+                        if not chunks:
+                            self.last_route = route_info
+                            self._record_route(generation_span, route_info)
+                        if not chunk.content:
+                            continue
+                        if not chunks:
+                            first_token_sec = time.time() - start_time
+                            _time_to_first_token.observe(first_token_sec)
+                            generation_span.set_attribute("time_to_first_token_ms", first_token_sec * 1000)
+                        chunks.append(chunk.content)
+                        yield {"type": "token", "text": chunk.content}
+                    answer = "".join(chunks)
+                    generation_span.set_attribute("answer_chars", len(answer))
+                
+                self._remember(question, answer)
+                if self.cache:
+                    with span("cache_write"):
+                        self.cache.set(self._cache_question(question, product), answer, sources)
+                
+                _record_request("success", start_time)
+                ask_span.set_attribute("outcome", "success")
+                yield {"type": "done", "answer": answer, "sources": sources}
             
-        except Exception as e:
-            error_message = f"システムエラーが発生しました: {str(e)}"
-            self.logger.error(f"システムエラー: {str(e)}")
-            return error_message, []
+            except DeadlineExceeded as e:
+                self.logger.error(f"期限超過（ストリーミング）: {str(e)}")
+                _record_request("deadline_exceeded", start_time)
+                ask_span.set_attribute("outcome", "deadline_exceeded")
+                yield {"type": "error", "error": "時間内に回答を生成できませんでした。少し待ってから再度お試しください。"}
+            
+            except groq.RateLimitError as e:
+                self.logger.error(f"レート制限エラー（ストリーミング）: {str(e)}")
+                _record_request("rate_limited", start_time)
+                ask_span.set_attribute("outcome", "rate_limited")
+                yield {"type": "error", "error": "レート制限に達しました。少し待ってから再度お試しください。"}
+            
+            except Exception as e:
+                self.logger.error(f"ストリーミング応答エラー: {str(e)}")
+                _record_request("error", start_time)
+                ask_span.set_attribute("outcome", "error")
+                ask_span.set_attribute("error", str(e))
+                yield {"type": "error", "error": f"エラーが発生しました: {str(e)}"}
+    
+    def _remember(self, question: str, answer: str):
+        """会話メモリに1往復を追加（CHAT_MEMORY_MAX_TURNS を超えた古い往復は破棄）"""
+        self.memory.save_context({"question": question}, {"answer": answer})
+        messages = self.memory.chat_memory.messages
+        max_messages = 2 * config.CHAT_MEMORY_MAX_TURNS
+        if len(messages) > max_messages:
+            del messages[:len(messages) - max_messages]
+    
+    def restore_memory(self, turns: List[Tuple[str, str]]):
+        """(質問, 回答) の一覧から会話メモリを復元（破棄したセッションの作り直し用）"""
+        self.memory.clear()
+        for question, answer in turns[-config.CHAT_MEMORY_MAX_TURNS:]:
+            self._remember(question, answer)
     
     def clear_memory(self):
         """会話履歴をクリア"""
@@ -210,7 +628,10 @@ class NetworkManualChatbot:
     def get_model_info(self) -> dict:
         """モデル情報を取得"""
         return {
-            "model_name": config.MODEL_NAME,
+            "model_name": self.model_name,
+            "routing": self.router is not None,
+            "small_model": self.router.small_model if self.router else None,
+            "fallback_models": self.router.fallbacks if self.router else [],
             "temperature": config.TEMPERATURE,
             "max_tokens": config.MAX_TOKENS,
             "cache_enabled": config.ENABLE_CACHE
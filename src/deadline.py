@@ -0,0 +1,50 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+class DeadlineExceeded(Exception):
+    """リクエスト全体の期限を過ぎた"""
+
+class Deadline:
+    """リクエスト全体の期限（開始からの秒数）"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.perf_counter() + seconds
+
+    def remaining(self) -> float:
+        """残り時間（秒、期限後は0）"""
+        return max(0.0, self.expires_at - time.perf_counter())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def fits(self, seconds: float) -> bool:
+        """残り時間内に seconds 秒の処理が収まるか"""
+        return self.remaining() >= seconds
+
+# 実行中のリクエストの期限（検索・LLM呼び出しから参照する）
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+def get_deadline() -> Optional[Deadline]:
+    """実行中のリクエストの期限（なければNone）"""
+    return _current_deadline.get()
+
+def remaining_time(limit: float = None) -> Optional[float]:
+    """期限までの残り時間と limit の小さい方（どちらもなければNone）"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return limit
+    if limit is None:
+        return deadline.remaining()
+    return min(limit, deadline.remaining())
+
+@contextmanager
+def deadline_context(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """ブロック内の処理に期限を設定（None の場合は期限なし）"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
@@ -1,22 +1,145 @@
+import json
 import os
+import threading
 import time
-from typing import List
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
 from pathlib import Path
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
 
 from config import config
+from src.embeddings import get_embeddings
+from src.index_versions import active_index_directory
+from src.ingestion_checkpoint import IngestionCheckpoint, chunk_id, file_content_hash
+from src.lazy_imports import lazy_import
 from src.logger import get_logger
-from src.performance import measure_time
+from src.memory_tracking import track_memory
+from src.metrics import get_metrics_registry
+from src.pdf_extraction import get_extraction_engine
+from src.performance import measure_time, span
+from src.products import UNKNOWN_PRODUCT, detect_product, product_collection_name, product_label
+from src.profiling import profiled
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_community.vectorstores import Chroma
+
+MANIFEST_FILENAME = "manifest.json"
+
+# Chromaへの1回あたりの追加件数の上限（Chromaの最大バッチサイズより小さくする）
+INSERT_BATCH_SIZE = 1000
+
+# 進捗通知（段階名, 詳細）。例外を送出するとインジェストを中断できる
+ProgressCallback = Callable[..., None]
+
+class IngestionCancelled(Exception):
+    """インジェストがキャンセルされた"""
+
+# ベクトルストアはプロセス内で1度だけ開く（保存先ディレクトリ -> Chroma）
+_vectorstores: Dict[str, "Chroma"] = {}
+_vectorstores_lock = threading.Lock()
+
+# インジェストとベクトルストアの指標
+_metrics = get_metrics_registry()
+_ingestion_runs = _metrics.counter("ingestion_runs_total", "インジェスト実行回数", ("status",))
+_ingestion_pages = _metrics.counter("ingestion_pages_total", "インジェストしたページ数")
+_ingestion_chunks = _metrics.counter("ingestion_chunks_total", "インジェストしたチャンク数")
+_ingestion_duration = _metrics.histogram(
+    "ingestion_duration_seconds", "インジェスト1回の処理時間",
+    buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+)
+_ingestion_throughput = _metrics.gauge(
+    "ingestion_last_chunks_per_second", "直近のインジェストのスループット（チャンク/秒）"
+)
+_vectorstore_chunks = _metrics.gauge("vectorstore_chunks", "ベクトルストアのチャンク数")
+_vectorstore_size = _metrics.gauge("vectorstore_size_bytes", "ベクトルストアのサイズ（バイト）")
+
+def _collect_vectorstore_stats():
+    """スクレイプ時にマニフェストからベクトルストアの状態を読み込み"""
+    manifest = read_manifest(active_index_directory())
+    if manifest is None:
+        return
+    _vectorstore_chunks.set(manifest.get("chunk_count", 0))
+    _vectorstore_size.set(manifest.get("size_bytes", 0))
+
+_metrics.add_collector(_collect_vectorstore_stats)
+
+def _directory_size(directory: Path) -> int:
+    """ディレクトリ配下のファイルサイズ合計（バイト）"""
+    total_size = 0
+    for file_path in directory.rglob("*"):
+        if file_path.is_file():
+            total_size += file_path.stat().st_size
+    return total_size
+
+def read_manifest(persist_directory: str) -> Optional[dict]:
+    """マニフェストを読み込み（存在しない・破損している場合はNone）"""
+    try:
+        with open(Path(persist_directory) / MANIFEST_FILENAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        get_logger().warning(f"マニフェスト読み込みエラー: {str(e)}")
+        return None
+
+def release_vectorstore(persist_directory: str):
+    """キャッシュしたベクトルストアを破棄（削除したバージョンのディレクトリなど。製品ごとのコレクションも含む）"""
+    cache_key = str(Path(persist_directory).resolve())
+    with _vectorstores_lock:
+        for key in [key for key in _vectorstores if key == cache_key or key.startswith(cache_key + "#")]:
+            del _vectorstores[key]
+
+def upsert_product_chunks(client, ids: List[str], embeddings, metadatas: List[dict], documents: List[str]):
+    """チャンクを製品ごとのコレクションにも書き込む（全体のコレクションと同じID）"""
+    by_product: Dict[str, List[int]] = {}
+    for index, metadata in enumerate(metadatas):
+        by_product.setdefault((metadata or {}).get("product", UNKNOWN_PRODUCT), []).append(index)
+    for product, indexes in by_product.items():
+        collection = client.get_or_create_collection(product_collection_name(product))
+        collection.upsert(
+            ids=[ids[i] for i in indexes],
+            embeddings=[embeddings[i] for i in indexes],
+            metadatas=[metadatas[i] for i in indexes],
+            documents=[documents[i] for i in indexes]
+        )
+
+def product_collections(client) -> Dict[str, Any]:
+    """製品キー -> 製品ごとのコレクション（作成済みのもののみ）"""
+    prefix = product_collection_name("")
+    collections = {}
+    for item in client.list_collections():
+        # chromadb 0.6以降は名前のみを返す
+        name = getattr(item, "name", item)
+        if name.startswith(prefix):
+            collections[name[len(prefix):]] = client.get_collection(name)
+    return collections
+
+def count_products(vectorstore: "Chroma") -> Dict[str, int]:
+    """製品ごとのチャンク数（マニフェストの products に記録し、UI・検索の絞り込みに使う）"""
+    if config.PRODUCT_COLLECTIONS:
+        counts = {product: collection.count() for product, collection in product_collections(vectorstore._client).items()}
+    else:
+        result = vectorstore._collection.get(include=["metadatas"])
+        counts = Counter((metadata or {}).get("product", UNKNOWN_PRODUCT) for metadata in result.get("metadatas") or [])
+    return {product: count for product, count in sorted(counts.items()) if count}
+
+def create_text_splitter(chunk_size: int, chunk_overlap: int):
+    """インジェストと同じ区切り文字でテキスト分割器を作成"""
+    text_splitter_module = lazy_import("langchain.text_splitter")
+    return text_splitter_module.RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", "。", ".", " ", ""]
+    )
 
 class DocumentProcessor:
     """ドキュメント処理クラス"""
     
     def __init__(self, persist_directory: str = None):
-        self.persist_directory = persist_directory or config.PERSIST_DIRECTORY
+        # 指定がなければ現在有効なバージョンのディレクトリを使う
+        self.persist_directory = persist_directory or active_index_directory()
         self.logger = get_logger()
         
         # 設定から値を取得
@@ -25,22 +148,13 @@ class DocumentProcessor:
         
         # 埋め込みモデルの初期化
         try:
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={'device': 'cpu'}
-            )
-            self.logger.info("埋め込みモデルの初期化完了")
+            self.embeddings = get_embeddings()
         except Exception as e:
             self.logger.error(f"埋め込みモデル初期化エラー: {str(e)}")
             raise
         
         # テキスト分割器の初期化
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", "。", ".", " ", ""]
-        )
+        self.text_splitter = create_text_splitter(self.chunk_size, self.chunk_overlap)
         
         self.logger.info(
             f"ドキュメント処理初期化完了 - "
@@ -48,9 +162,19 @@ class DocumentProcessor:
             f"オーバーラップ: {self.chunk_overlap}"
         )
     
-    @measure_time(log_result=True)
-    def load_pdf(self, pdf_path: str) -> List[Document]:
+    def load_pdf(self, pdf_path: str) -> List["Document"]:
         """PDFファイルを読み込み、テキストを抽出"""
+        documents, _ = self.load_pdf_with_stats(pdf_path)
+        return documents
+    
+    @measure_time(log_result=True)
+    @track_memory("load_pdf")
+    def load_pdf_with_stats(self, pdf_path: str) -> Tuple[List["Document"], Dict[str, Any]]:
+        """PDFファイルを読み込み、テキストと抽出の統計（ページ/秒・フォールバック率など）を返す
+        
+        ページ単位で抽出器を切り替えるため、一部のページの抽出に失敗しても
+        ファイル全体は失われない。ファイルを開けない場合のみ空のリストを返す。
+        """
         try:
             self.logger.info(f"PDF読み込み開始: {pdf_path}")
             
@@ -65,41 +189,55 @@ class DocumentProcessor:
             if file_size_mb > 100:  # 100MB以上の場合は警告
                 self.logger.warning(f"大きなファイルです ({file_size_mb:.2f}MB) - 処理に時間がかかる可能性があります")
             
-            # PyPDFLoaderを使用してPDFを読み込み
-            loader = PyPDFLoader(pdf_path)
-            documents = loader.load()
+            # ページ単位で抽出器を切り替えて抽出
+            with span("parse") as parse_span:
+                pages, stats = get_extraction_engine().extract(pdf_path)
+                parse_span.set_attribute("pages", stats["pages"])
+                parse_span.set_attribute("fallback_pages", stats["fallback_pages"])
             
-            self.logger.info(f"PDF読み込み完了 - ページ数: {len(documents)}")
+            self.logger.info(
+                f"PDF読み込み完了 - ページ数: {stats['pages']}, "
+                f"速度: {stats['pages_per_sec']:.1f}ページ/秒, "
+                f"フォールバック率: {stats['fallback_rate']:.1%} {stats['fallback_reasons'] or ''}, "
+                f"タイムアウト: {stats['timeouts']}"
+            )
             
             # テキストのクリーニング
-            cleaned_documents = []
-            for i, doc in enumerate(documents):
-                content = doc.page_content
+            Document = lazy_import("langchain_core.documents").Document
+            with span("clean"):
+                cleaned_documents = []
+                for page in pages:
+                    content = page["text"]
                 
-                # 空のページをスキップ
-                if not content.strip():
-                    self.logger.debug(f"空のページをスキップ: ページ {i + 1}")
-                    continue
+                    # 空のページをスキップ
+                    if not content.strip():
+                        self.logger.debug(f"空のページをスキップ: ページ {page['index'] + 1}")
+                        continue
                 
-                # テキストクリーニング
-                content = self._clean_text(content)
+                    # テキストクリーニング
+                    content = self._clean_text(content)
                 
-                if content.strip():
-                    doc.page_content = content
-                    # メタデータにページ番号を追加
-                    doc.metadata['page'] = i + 1
-                    cleaned_documents.append(doc)
+                    if content.strip():
+                        # メタデータにページ番号と採用した抽出器を追加
+                        cleaned_documents.append(Document(
+                            page_content=content,
+                            metadata={
+                                "source": pdf_path,
+                                "page": page["index"] + 1,
+                                "extractor": page["extractor"]
+                            }
+                        ))
             
             self.logger.info(
                 f"テキストクリーニング完了 - "
-                f"有効ページ数: {len(cleaned_documents)}/{len(documents)}"
+                f"有効ページ数: {len(cleaned_documents)}/{len(pages)}"
             )
             
-            return cleaned_documents
+            return cleaned_documents, stats
             
         except Exception as e:
             self.logger.error(f"PDF読み込みエラー {pdf_path}: {str(e)}")
-            return []
+            return [], {}
     
     def _clean_text(self, text: str) -> str:
         """テキストをクリーニング"""
@@ -153,90 +291,391 @@ class DocumentProcessor:
             return text  # エラー時は元のテキストを返す
     
     @measure_time(log_result=True)
-    def process_documents(self, pdf_directory: str) -> Chroma:
+    @profiled("process_documents", threshold_sec=config.PROFILE_INGEST_THRESHOLD_SEC)
+    @track_memory("process_documents")
+    def process_documents(self, pdf_directory: str) -> "Chroma":
         """ディレクトリ内のすべてのPDFを処理してベクトルストアに保存"""
+        self.logger.info(f"ドキュメント処理開始 - ディレクトリ: {pdf_directory}")
+        
+        # PDFファイルを検索
+        pdf_files = list(Path(pdf_directory).glob("*.pdf"))
+        if not pdf_files:
+            raise ValueError(f"PDFファイルが見つかりません: {pdf_directory}")
+        
+        return self._ingest([(pdf_file, pdf_file.name, None) for pdf_file in pdf_files], append=False)
+    
+    @measure_time(log_result=True)
+    @profiled("process_files", threshold_sec=config.PROFILE_INGEST_THRESHOLD_SEC)
+    @track_memory("process_files")
+    def process_files(
+        self,
+        files: List[Tuple[str, str, Optional[str]]],
+        progress: Optional[ProgressCallback] = None
+    ) -> "Chroma":
+        """指定したPDFファイルのみを処理して既存のベクトルストアに追加
+        
+        files は (PDFパス, 表示用ファイル名, コンテンツハッシュ) のリスト。
+        progress には段階ごとの進捗が progress(段階名, **詳細) の形で通知される。
+        """
+        if not files:
+            raise ValueError("処理対象のPDFファイルがありません")
+        
+        self.logger.info(f"追加ドキュメント処理開始 - ファイル数: {len(files)}")
+        return self._ingest(
+            [(Path(path), name, content_hash) for path, name, content_hash in files],
+            append=True,
+            progress=progress
+        )
+    
+    def _ingest(
+        self,
+        pdf_files: List[Tuple[Path, str, Optional[str]]],
+        append: bool,
+        progress: Optional[ProgressCallback] = None
+    ) -> "Chroma":
+        """PDFを読み込み・分割・埋め込みしてベクトルストアに保存
+        
+        各段階は "process_documents.<段階名>"（parse / clean / split / embed / persist）のスパンとして記録される。
+        """
+        with span("process_documents"):
+            return self._ingest_documents(pdf_files, append, progress or (lambda stage, **info: None))
+    
+    def _ingest_settings(self) -> dict:
+        """チャンクの内容と埋め込みを左右する設定（チェックポイントの実行キーに含める）"""
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "embedding_model": getattr(self.embeddings, "model_name", config.EMBEDDING_MODEL),
+            "embedding_backend": getattr(self.embeddings, "backend", config.EMBEDDING_BACKEND),
+            "product_collections": config.PRODUCT_COLLECTIONS
+        }
+    
+    def _embed_and_persist(
+        self,
+        vectorstore: "Chroma",
+        file_chunks: List[Tuple[str, str, Optional[str], int, List["Document"]]],
+        checkpoint: IngestionCheckpoint,
+        progress: ProgressCallback
+    ) -> int:
+        """未書き込みのチャンクを一定件数ごとに埋め込み・書き込みし、チェックポイントに記録
+        
+        file_chunks は (ファイルキー, ファイル名, コンテンツハッシュ, ページ数, チャンク) のリスト。
+        チャンクIDはファイルキーと位置から決まるため、記録前に中断したバッチを再度書き込んでも
+        upsert で置き換わるだけで重複しない。戻り値は今回書き込んだチャンク数。
+        """
+        collection = vectorstore._collection
+        batch_size = max(1, min(config.INGEST_CHECKPOINT_BATCH, INSERT_BATCH_SIZE))
+        
+        # 書き込み対象: (ファイルキー, ファイル内の位置, チャンク)
+        pending = []
+        chunk_counts = {}
+        total_chunks = 0
+        for file_key, file_name, content_hash, pages, chunks in file_chunks:
+            chunk_counts[file_key] = (file_name, content_hash, pages, len(chunks))
+            total_chunks += len(chunks)
+            done = checkpoint.chunks_done.get(file_key, 0)
+            if done >= len(chunks):
+                # 書き込み済みでファイル完了の記録前に中断した場合
+                checkpoint.record_file(file_key, file_name, pages, len(chunks), content_hash)
+                continue
+            pending.extend((file_key, index, chunks[index]) for index in range(done, len(chunks)))
+        
+        written = total_chunks - len(pending)
+        if written:
+            self.logger.info(f"書き込み済みのチャンクをスキップ: {written}/{total_chunks}")
+        progress("embed", done=written, total=total_chunks)
+        progress("persist", done=written, total=total_chunks)
+        
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            texts = [doc.page_content for _, _, doc in batch]
+            ids = [chunk_id(file_key, index) for file_key, index, _ in batch]
+            metadatas = [doc.metadata for _, _, doc in batch]
+            with span("embed", chunks=len(batch)):
+                vectors = self.embeddings.embed_documents(texts)
+            with span("persist", chunks=len(batch)):
+                collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+                # 製品を指定した検索が対象製品のチャンクだけを比較するよう、製品ごとのコレクションにも書き込む
+                if config.PRODUCT_COLLECTIONS:
+                    upsert_product_chunks(vectorstore._client, ids, vectors, metadatas, texts)
+            
+            # 書き込み後に記録する（記録前に中断しても再開時に同じIDで上書きされる）
+            done_by_file = {}
+            for file_key, index, _ in batch:
+                done_by_file[file_key] = index + 1
+            checkpoint.record_chunks(done_by_file)
+            for file_key, done in done_by_file.items():
+                file_name, content_hash, pages, chunk_count = chunk_counts[file_key]
+                if done == chunk_count:
+                    checkpoint.record_file(file_key, file_name, pages, chunk_count, content_hash)
+            
+            written += len(batch)
+            progress("embed", done=written, total=total_chunks)
+            progress("persist", done=written, total=total_chunks)
+        
+        return len(pending)
+    
+    def _ingest_documents(
+        self,
+        pdf_files: List[Tuple[Path, str, Optional[str]]],
+        append: bool,
+        progress: ProgressCallback
+    ) -> "Chroma":
+        """ファイル読み込みからマニフェスト更新までを実行（_ingest のスパン内で呼ばれる）
+        
+        埋め込みとベクトルストアへの書き込みは INGEST_CHECKPOINT_BATCH 件ごとに行い、進捗を
+        チェックポイントに記録する。中断後に同じファイルで再実行すると、完了済みのファイルは
+        読み込まず、途中のファイルは書き込み済みのチャンクの次から再開する。
+        """
         start_time = time.time()
-        all_documents = []
-        processed_files = []
+        loaded_files = []
         
         try:
-            self.logger.info(f"ドキュメント処理開始 - ディレクトリ: {pdf_directory}")
-            
-            # PDFファイルを検索
-            pdf_files = list(Path(pdf_directory).glob("*.pdf"))
-            if not pdf_files:
-                raise ValueError(f"PDFファイルが見つかりません: {pdf_directory}")
-            
             self.logger.info(f"見つかったPDFファイル数: {len(pdf_files)}")
             
+            # ベクトルストアディレクトリの作成
+            Path(self.persist_directory).mkdir(parents=True, exist_ok=True)
+            previous_manifest = self.read_manifest() if append else None
+            
+            # ファイルの識別キー（コンテンツハッシュがなければ内容から計算）とチェックポイント
+            # 内容が同じファイルは同じチャンクIDになるため、最初の1件だけを取り込む
+            unique_files = {}
+            for pdf_file, file_name, content_hash in pdf_files:
+                file_key = content_hash or file_content_hash(str(pdf_file))
+                if file_key in unique_files:
+                    self.logger.warning(
+                        f"内容が同じファイルのためスキップ: {file_name}（{unique_files[file_key][1]} と同一）"
+                    )
+                    continue
+                unique_files[file_key] = (pdf_file, file_name, content_hash)
+            file_keys = list(unique_files)
+            pdf_files = list(unique_files.values())
+            checkpoint = IngestionCheckpoint(self.persist_directory)
+            checkpoint.begin(IngestionCheckpoint.make_run_key(file_keys, self._ingest_settings()))
+            
             # 各PDFファイルを処理
-            for pdf_file in pdf_files:
+            for file_index, ((pdf_file, file_name, content_hash), file_key) in enumerate(zip(pdf_files, file_keys)):
+                completed = checkpoint.completed_files.get(file_key)
+                if completed:
+                    self.logger.info(f"チェックポイントで完了済みのためスキップ: {file_name}")
+                    progress(
+                        "parse", file=file_name, file_status="done", pages=completed["pages"],
+                        done=file_index + 1, total=len(pdf_files)
+                    )
+                    continue
+                
                 file_start_time = time.time()
-                self.logger.info(f"処理中: {pdf_file.name}")
+                self.logger.info(f"処理中: {file_name}")
+                progress("parse", file=file_name, file_status="running", done=file_index, total=len(pdf_files))
                 
-                documents = self.load_pdf(str(pdf_file))
+                documents, extraction_stats = self.load_pdf_with_stats(str(pdf_file))
                 
                 if documents:
-                    # メタデータにファイル名を追加
+                    # ファイル名と先頭ページからベンダー・製品・OSバージョンを判定
+                    product_info = detect_product(
+                        file_name, [doc.page_content for doc in documents[:config.PRODUCT_DETECT_PAGES]]
+                    )
+                    self.logger.info(
+                        f"製品判定: {file_name} - {product_label(product_info['product'])} "
+                        f"{product_info['os_version'] or '(バージョン不明)'}"
+                    )
+                    
+                    # メタデータにファイル名と製品情報を追加
                     for doc in documents:
-                        doc.metadata['source'] = pdf_file.name
-                        doc.metadata['file_name'] = pdf_file.name
+                        doc.metadata['source'] = file_name
+                        doc.metadata['file_name'] = file_name
+                        if content_hash:
+                            doc.metadata['content_hash'] = content_hash
+                        doc.metadata.update(product_info)
                     
-                    all_documents.extend(documents)
-                    processed_files.append(pdf_file.name)
+                    loaded_files.append((file_key, file_name, content_hash, documents))
                     
                     file_processing_time = time.time() - file_start_time
                     self.logger.info(
-                        f"ファイル処理完了: {pdf_file.name} - "
+                        f"ファイル処理完了: {file_name} - "
                         f"ページ数: {len(documents)}, "
                         f"処理時間: {file_processing_time:.2f}秒"
                     )
+                    progress(
+                        "parse", file=file_name, file_status="done", pages=len(documents),
+                        file_stats={
+                            "pages_per_sec": round(extraction_stats["pages_per_sec"], 1),
+                            "fallback_rate": round(extraction_stats["fallback_rate"], 4)
+                        },
+                        done=file_index + 1, total=len(pdf_files)
+                    )
                 else:
-                    self.logger.warning(f"ファイル処理失敗: {pdf_file.name}")
+                    self.logger.warning(f"ファイル処理失敗: {file_name}")
+                    progress("parse", file=file_name, file_status="failed", done=file_index + 1, total=len(pdf_files))
             
-            if not all_documents:
+            if not loaded_files and not checkpoint.completed_files:
                 raise ValueError("処理可能なドキュメントがありません")
             
-            self.logger.info(f"全ドキュメント読み込み完了 - 総ページ数: {len(all_documents)}")
+            page_count = sum(len(documents) for _, _, _, documents in loaded_files)
+            self.logger.info(f"全ドキュメント読み込み完了 - 総ページ数: {page_count}")
             
-            # テキストを適切なサイズに分割
+            # テキストを適切なサイズに分割（ページ単位で分割されるため、ファイルごとに分割しても結果は同じ）
             self.logger.info("テキスト分割開始")
-            split_docs = self.text_splitter.split_documents(all_documents)
-            
-            self.logger.info(f"テキスト分割完了 - 総チャンク数: {len(split_docs)}")
-            
-            # ベクトルストアディレクトリの作成
-            Path(self.persist_directory).mkdir(parents=True, exist_ok=True)
+            progress("split", done=0, total=page_count)
+            with span("split", pages=page_count) as split_span:
+                file_chunks = [
+                    (file_key, file_name, content_hash, len(documents), self.text_splitter.split_documents(documents))
+                    for file_key, file_name, content_hash, documents in loaded_files
+                ]
+                chunk_count = sum(len(chunks) for _, _, _, _, chunks in file_chunks)
+                split_span.set_attribute("chunks", chunk_count)
+            progress("split", done=page_count, total=page_count, chunks=chunk_count)
+            
+            self.logger.info(f"テキスト分割完了 - 総チャンク数: {chunk_count}")
+            
+            # 埋め込みの計算とベクトルストアへの書き込み（既存ストアには追加される）
+            self.logger.info("埋め込み計算・ベクトルストア書き込み開始")
+            vectorstore = self.load_vectorstore()
+            written_count = self._embed_and_persist(vectorstore, file_chunks, checkpoint, progress)
+            # chromadb 0.4以降は書き込みごとに永続化されるため、旧バージョン向けの処理
+            vectorstore.persist()
             
-            # ベクトルストアを作成
-            self.logger.info("ベクトルストア作成開始")
-            vectorstore = Chroma.from_documents(
-                documents=split_docs,
-                embedding=self.embeddings,
-                persist_directory=self.persist_directory
+            # マニフェストの書き込み（状態確認をO(1)で行うため）
+            # 以前の実行で完了したファイルも含め、チェックポイントの記録から集計する
+            completed_files = [
+                checkpoint.completed_files[file_key]
+                for file_key in dict.fromkeys(file_keys) if file_key in checkpoint.completed_files
+            ]
+            document_count = sum(record["pages"] for record in completed_files)
+            manifest_files = [record["name"] for record in completed_files]
+            content_hashes = [record["content_hash"] for record in completed_files if record["content_hash"]]
+            if previous_manifest:
+                document_count += previous_manifest.get("document_count", 0)
+                manifest_files = list(set(manifest_files) | set(previous_manifest.get("files", [])))
+                content_hashes = list(set(content_hashes) | set(previous_manifest.get("content_hashes", [])))
+            self._write_manifest(
+                document_count=document_count,
+                chunk_count=vectorstore._collection.count(),
+                files=manifest_files,
+                build_time=time.time() - start_time,
+                content_hashes=content_hashes,
+                products=count_products(vectorstore)
             )
-            
-            # 永続化
-            vectorstore.persist()
+            checkpoint.finish()
             
             total_processing_time = time.time() - start_time
+            _ingestion_runs.inc(status="success")
+            _ingestion_pages.inc(page_count)
+            _ingestion_chunks.inc(written_count)
+            _ingestion_duration.observe(total_processing_time)
+            if total_processing_time > 0:
+                _ingestion_throughput.set(written_count / total_processing_time)
+            
             self.logger.info(
                 f"ドキュメント処理完了 - "
-                f"処理ファイル数: {len(processed_files)}, "
-                f"総チャンク数: {len(split_docs)}, "
+                f"処理ファイル数: {len(completed_files)}, "
+                f"総チャンク数: {chunk_count}（今回の書き込み: {written_count}）, "
                 f"総処理時間: {total_processing_time:.2f}秒, "
                 f"保存先: {self.persist_directory}"
             )
             
             return vectorstore
             
+        except IngestionCancelled:
+            _ingestion_runs.inc(status="cancelled")
+            self.logger.warning("ドキュメント処理がキャンセルされました")
+            raise
         except Exception as e:
+            _ingestion_runs.inc(status="error")
             self.logger.error(f"ドキュメント処理エラー: {str(e)}")
             raise
     
+    def remove_content(self, content_hashes: List[str]):
+        """指定したコンテンツハッシュのチャンクをベクトルストアから削除"""
+        if not content_hashes or not Path(self.persist_directory).exists():
+            return
+        
+        vectorstore = self.load_vectorstore()
+        collection = vectorstore._collection
+        collections = [collection] + list(product_collections(vectorstore._client).values())
+        # マニフェストのページ数から差し引くため、削除するチャンクのページを先に集計
+        removed_pages = set()
+        for content_hash in content_hashes:
+            result = collection.get(where={"content_hash": content_hash}, include=["metadatas"])
+            for metadata in result.get("metadatas") or []:
+                if metadata:
+                    removed_pages.add((content_hash, metadata.get("page")))
+            for target in collections:
+                target.delete(where={"content_hash": content_hash})
+        
+        manifest = self.read_manifest()
+        if manifest:
+            remaining_hashes = set(manifest.get("content_hashes", [])) - set(content_hashes)
+            self._write_manifest(
+                document_count=max(0, manifest.get("document_count", 0) - len(removed_pages)),
+                chunk_count=collection.count(),
+                files=manifest.get("files", []),
+                build_time=manifest.get("build_time_sec", 0.0),
+                content_hashes=list(remaining_hashes),
+                products=count_products(vectorstore)
+            )
+        
+        self.logger.info(f"古いコンテンツを削除 - ハッシュ数: {len(content_hashes)}")
+    
+    @property
+    def manifest_path(self) -> Path:
+        """マニフェストファイルのパス"""
+        return Path(self.persist_directory) / MANIFEST_FILENAME
+    
+    def _write_manifest(
+        self,
+        document_count: int,
+        chunk_count: int,
+        files: List[str],
+        build_time: float,
+        content_hashes: List[str] = None,
+        products: Dict[str, int] = None
+    ):
+        """ベクトルストアのマニフェストを書き込み（products は製品ごとのチャンク数）"""
+        manifest = {
+            "document_count": document_count,
+            "chunk_count": chunk_count,
+            "size_bytes": _directory_size(Path(self.persist_directory)),
+            "embedding_model": getattr(self.embeddings, "model_name", config.EMBEDDING_MODEL),
+            "embedding_backend": getattr(self.embeddings, "backend", config.EMBEDDING_BACKEND),
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "built_at": datetime.now().isoformat(timespec="seconds"),
+            "build_time_sec": round(build_time, 3),
+            "files": sorted(files),
+            "content_hashes": sorted(content_hashes or []),
+            "products": products or {}
+        }
+        
+        # 書き込み途中のファイルを読まないよう一時ファイル経由で置き換え
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        
+        self.logger.info(
+            f"マニフェスト保存 - チャンク数: {chunk_count}, "
+            f"サイズ: {manifest['size_bytes'] / 1024 / 1024:.1f}MB"
+        )
+        return manifest
+    
+    def read_manifest(self) -> Optional[dict]:
+        """マニフェストを読み込み（存在しない・破損している場合はNone）"""
+        return read_manifest(self.persist_directory)
+    
+    def _cache_key(self) -> str:
+        """ベクトルストアのキャッシュキー"""
+        return str(Path(self.persist_directory).resolve())
+    
     @measure_time(log_result=False)
-    def load_vectorstore(self) -> Chroma:
-        """保存されたベクトルストアを読み込み"""
+    def load_vectorstore(self) -> "Chroma":
+        """保存されたベクトルストアを読み込み（プロセス内で1度だけ開く）"""
+        cache_key = self._cache_key()
+        with _vectorstores_lock:
+            vectorstore = _vectorstores.get(cache_key)
+        if vectorstore is not None:
+            return vectorstore
+        
         try:
             self.logger.info(f"ベクトルストア読み込み開始: {self.persist_directory}")
             
@@ -244,10 +683,18 @@ class DocumentProcessor:
             if not Path(self.persist_directory).exists():
                 raise FileNotFoundError(f"ベクトルストアが見つかりません: {self.persist_directory}")
             
-            vectorstore = Chroma(
-                persist_directory=self.persist_directory,
-                embedding_function=self.embeddings
-            )
+            with _vectorstores_lock:
+                # 他スレッドが先に開いている可能性がある
+                vectorstore = _vectorstores.get(cache_key)
+                if vectorstore is not None:
+                    return vectorstore
+                
+                Chroma = lazy_import("langchain_community.vectorstores").Chroma
+                vectorstore = Chroma(
+                    persist_directory=self.persist_directory,
+                    embedding_function=self.embeddings
+                )
+                _vectorstores[cache_key] = vectorstore
             
             # 簡単な動作確認
             collection = vectorstore._collection
@@ -261,32 +708,76 @@ class DocumentProcessor:
             self.logger.error(f"ベクトルストア読み込みエラー: {str(e)}")
             raise
     
+    def load_product_vectorstore(self, product: str) -> "Chroma":
+        """製品ごとのコレクションを開く（マニフェストの products にある製品のみ指定すること）"""
+        cache_key = f"{self._cache_key()}#{product}"
+        with _vectorstores_lock:
+            vectorstore = _vectorstores.get(cache_key)
+        if vectorstore is not None:
+            return vectorstore
+        
+        # 全体のコレクションと同じクライアントを使う（同じディレクトリを複数のクライアントで開かない）
+        client = self.load_vectorstore()._client
+        Chroma = lazy_import("langchain_community.vectorstores").Chroma
+        with _vectorstores_lock:
+            vectorstore = _vectorstores.get(cache_key)
+            if vectorstore is None:
+                vectorstore = Chroma(
+                    client=client,
+                    collection_name=product_collection_name(product),
+                    embedding_function=self.embeddings
+                )
+                _vectorstores[cache_key] = vectorstore
+        return vectorstore
+    
     def get_vectorstore_info(self) -> dict:
-        """ベクトルストアの情報を取得"""
+        """ベクトルストアの情報を取得（マニフェストから読むためストアは開かない）"""
         try:
             if not Path(self.persist_directory).exists():
                 return {"status": "not_found", "document_count": 0}
             
-            vectorstore = self.load_vectorstore()
-            collection = vectorstore._collection
-            document_count = collection.count()
-            
-            # ディレクトリサイズを計算
-            total_size = 0
-            for file_path in Path(self.persist_directory).rglob("*"):
-                if file_path.is_file():
-                    total_size += file_path.stat().st_size
-            
-            size_mb = total_size / 1024 / 1024
+            manifest = self.read_manifest()
+            if manifest is None:
+                manifest = self._rebuild_manifest()
             
             return {
                 "status": "loaded",
-                "document_count": document_count,
-                "size_mb": size_mb,
+                "document_count": manifest["chunk_count"],
+                "page_count": manifest.get("document_count", 0),
+                "file_count": len(manifest.get("files", [])),
+                "size_mb": manifest["size_bytes"] / 1024 / 1024,
+                "embedding_model": manifest.get("embedding_model"),
+                "built_at": manifest.get("built_at"),
+                "products": manifest.get("products", {}),
                 "directory": str(self.persist_directory)
             }
             
         except Exception as e:
             self.logger.error(f"ベクトルストア情報取得エラー: {str(e)}")
             return {"status": "error", "error": str(e)}
-
+    
+    def _rebuild_manifest(self) -> dict:
+        """マニフェストのない既存ストアから情報を集めてマニフェストを作成（初回のみ）"""
+        self.logger.info("マニフェストが存在しないため既存ストアから作成します")
+        vectorstore = self.load_vectorstore()
+        collection = vectorstore._collection
+        chunk_count = collection.count()
+        
+        # 登録済みのファイル名をメタデータから収集
+        files = set()
+        pages = set()
+        result = collection.get(include=["metadatas"])
+        for metadata in result.get("metadatas") or []:
+            if metadata:
+                file_name = metadata.get("file_name")
+                if file_name:
+                    files.add(file_name)
+                    pages.add((file_name, metadata.get("page")))
+        
+        return self._write_manifest(
+            document_count=len(pages),
+            chunk_count=chunk_count,
+            files=list(files),
+            build_time=0.0,
+            products=count_products(vectorstore)
+        )
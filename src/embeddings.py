@@ -0,0 +1,329 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+
+from config import config
+from src.deadline import DeadlineExceeded, remaining_time
+from src.lazy_imports import lazy_import
+from src.logger import get_logger
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+
+# 互換性チェックに使うサンプル文（既存ベクトルとの差分確認用）
+COMPATIBILITY_SAMPLES = [
+    "VRRPの設定手順を教えてください",
+    "BGPネイバーの状態を確認するコマンドは？",
+    "interface GigabitEthernet0/1\n ip address 192.168.1.1 255.255.255.0\n no shutdown",
+    "show running-config | include hostname",
+    "Configure OSPF area 0 on all backbone interfaces.",
+    "スパニングツリーのルートブリッジを固定する方法",
+]
+
+SUPPORTED_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def _cosine_similarity(a: List[float], b: List[float]) -> float:
+    """2つのベクトルのコサイン類似度"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = sum(x * x for x in a) ** 0.5
+    norm_b = sum(y * y for y in b) ** 0.5
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+class SentenceTransformerEmbeddings:
+    """バックエンド（PyTorch / ONNX Runtime / int8量子化ONNX）を切り替え可能な埋め込みクラス
+
+    LangChainの Embeddings インターフェース（embed_documents / embed_query）を実装する。
+    同一モデルを使うため、既存のベクトルストアとそのまま互換性がある。
+    """
+
+    def __init__(
+        self,
+        model_name: str = None,
+        backend: str = None,
+        batch_size: int = None,
+        num_threads: int = None,
+        onnx_file_name: str = None
+    ):
+        self.model_name = model_name or config.EMBEDDING_MODEL
+        self.backend = backend or config.EMBEDDING_BACKEND
+        self.batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        self.num_threads = num_threads if num_threads is not None else config.EMBEDDING_NUM_THREADS
+        self.onnx_file_name = onnx_file_name or config.EMBEDDING_ONNX_FILE
+        self.logger = get_logger()
+
+        if self.backend not in SUPPORTED_BACKENDS:
+            raise ValueError(
+                f"未対応の埋め込みバックエンドです: {self.backend} "
+                f"(対応: {', '.join(SUPPORTED_BACKENDS)})"
+            )
+
+        self.model = self._load_model()
+        self.logger.info(
+            f"埋め込みモデル読み込み完了 - モデル: {self.model_name}, "
+            f"バックエンド: {self.backend}, バッチサイズ: {self.batch_size}, "
+            f"スレッド数: {self.num_threads or '既定'}"
+        )
+
+    def _load_model(self):
+        """バックエンドに応じてSentenceTransformerモデルを読み込み"""
+        SentenceTransformer = lazy_import("sentence_transformers").SentenceTransformer
+
+        if self.backend == "torch":
+            if self.num_threads:
+                lazy_import("torch").set_num_threads(self.num_threads)
+            return SentenceTransformer(self.model_name, device="cpu")
+
+        # ONNX Runtime（sentence-transformers>=3.2 と optimum[onnxruntime] が必要）
+        onnxruntime = lazy_import("onnxruntime")
+        session_options = onnxruntime.SessionOptions()
+        if self.num_threads:
+            session_options.intra_op_num_threads = self.num_threads
+        model_kwargs: Dict[str, Any] = {
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options
+        }
+        if self.backend == "onnx-int8":
+            model_kwargs["file_name"] = self.onnx_file_name
+
+        return SentenceTransformer(
+            self.model_name,
+            device="cpu",
+            backend="onnx",
+            model_kwargs=model_kwargs
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """複数テキストを埋め込み"""
+        texts = [text.replace("\n", " ") for text in texts]
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """質問文を埋め込み"""
+        return self.embed_documents([text])[0]
+
+def check_compatibility(
+    candidate: "Embeddings",
+    reference: "Embeddings",
+    texts: List[str] = None,
+    min_similarity: float = None
+) -> Dict[str, Any]:
+    """候補バックエンドの出力が基準ベクトルと十分近いかを確認"""
+    texts = texts or COMPATIBILITY_SAMPLES
+    min_similarity = min_similarity if min_similarity is not None else config.EMBEDDING_MIN_SIMILARITY
+
+    candidate_vectors = candidate.embed_documents(texts)
+    reference_vectors = reference.embed_documents(texts)
+    similarities = [
+        _cosine_similarity(c, r) for c, r in zip(candidate_vectors, reference_vectors)
+    ]
+
+    result = {
+        "min_similarity": min(similarities),
+        "mean_similarity": sum(similarities) / len(similarities),
+        "threshold": min_similarity,
+        "compatible": min(similarities) >= min_similarity,
+        "sample_count": len(texts)
+    }
+    return result
+
+def create_embeddings(
+    backend: str = None,
+    batch_size: int = None,
+    num_threads: int = None,
+    verify: bool = None
+) -> "Embeddings":
+    """設定に応じた埋め込みモデルを作成
+
+    PyTorch以外のバックエンドでは、既存ストアとの互換性を保つため
+    PyTorch版の出力と比較し、基準を満たさない場合はPyTorch版にフォールバックする。
+    """
+    logger = get_logger()
+    backend = backend or config.EMBEDDING_BACKEND
+    verify = config.EMBEDDING_VERIFY if verify is None else verify
+
+    embeddings = SentenceTransformerEmbeddings(
+        backend=backend,
+        batch_size=batch_size,
+        num_threads=num_threads
+    )
+    if backend == "torch" or not verify:
+        return embeddings
+
+    reference = SentenceTransformerEmbeddings(
+        backend="torch",
+        batch_size=batch_size,
+        num_threads=num_threads
+    )
+    result = check_compatibility(embeddings, reference)
+    if result["compatible"]:
+        logger.info(
+            f"埋め込み互換性チェック成功 [{backend}] - "
+            f"最小類似度: {result['min_similarity']:.4f}, 平均類似度: {result['mean_similarity']:.4f}"
+        )
+        return embeddings
+
+    logger.error(
+        f"埋め込み互換性チェック失敗 [{backend}] - "
+        f"最小類似度: {result['min_similarity']:.4f} (基準: {result['threshold']}) - "
+        f"PyTorchバックエンドを使用します"
+    )
+    return reference
+
+class QueryEmbeddingWorker:
+    """質問文の埋め込みを専用スレッドでまとめて実行するワーカー
+
+    同時に届いた質問を数ミリ秒のウィンドウで集めて1回のバッチ推論にすることで、
+    多数のセッションが個別にモデルを呼び出してGILを奪い合うのを防ぐ。
+    """
+
+    def __init__(self, embeddings: "Embeddings", batch_window_ms: float = None, max_batch_size: int = None):
+        self.embeddings = embeddings
+        self.batch_window = (batch_window_ms if batch_window_ms is not None else config.QUERY_EMBED_BATCH_WINDOW_MS) / 1000
+        self.max_batch_size = max_batch_size or config.QUERY_EMBED_MAX_BATCH
+        self.logger = get_logger()
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="query-embedding-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """質問文の埋め込みを依頼"""
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        """質問文を埋め込み（結果が出るまで待機。リクエストに期限があればそこまで）"""
+        try:
+            return self.submit(text).result(timeout=remaining_time())
+        except FutureTimeoutError:
+            raise DeadlineExceeded("質問の埋め込みが期限内に完了しませんでした")
+
+    def _collect_batch(self) -> List[Tuple[str, Future]]:
+        """最初の依頼からバッチウィンドウ内に届いた依頼をまとめる"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """ワーカースレッドのメインループ"""
+        while True:
+            batch = self._collect_batch()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+                if len(batch) > 1:
+                    self.logger.debug(f"質問埋め込みをバッチ実行 - 件数: {len(batch)}")
+            except Exception as e:
+                self.logger.error(f"質問埋め込みエラー: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+
+class CachedQueryEmbeddings:
+    """質問文 → 埋め込みベクトルの上限付きLRUキャッシュを持つ埋め込みラッパー
+
+    検索のたびに同じ質問（や言い換え後の質問）を埋め込み直すのを避ける。
+    文書の埋め込み（embed_documents）はそのまま下位のモデルに委譲する。
+    """
+
+    def __init__(self, embeddings: "Embeddings", max_size: int = None, use_worker: bool = None):
+        self.embeddings = embeddings
+        self.max_size = max_size if max_size is not None else config.QUERY_EMBED_CACHE_SIZE
+        use_worker = config.QUERY_EMBED_WORKER if use_worker is None else use_worker
+        self.worker = QueryEmbeddingWorker(embeddings) if use_worker else None
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def __getattr__(self, name: str):
+        # model_name・backend などは下位のモデルの属性を参照する
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """複数テキストを埋め込み（キャッシュ対象外）"""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """質問文を埋め込み（キャッシュ優先）"""
+        key = text.strip()
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return vector
+            self.stats["misses"] += 1
+
+        if self.worker:
+            vector = self.worker.embed_query(key)
+        else:
+            vector = self.embeddings.embed_query(key)
+
+        if self.max_size > 0:
+            with self._lock:
+                self._cache[key] = vector
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return vector
+
+    def get_stats(self) -> Dict[str, Any]:
+        """キャッシュ統計を取得"""
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {
+                "hits": self.stats["hits"],
+                "misses": self.stats["misses"],
+                "hit_rate": (self.stats["hits"] / total * 100) if total else 0.0,
+                "size": len(self._cache),
+                "max_size": self.max_size,
+                "worker_enabled": self.worker is not None
+            }
+
+    def clear(self):
+        """キャッシュを削除"""
+        with self._lock:
+            self._cache.clear()
+            self.stats = {"hits": 0, "misses": 0}
+
+# 埋め込みモデルはプロセス内で共有する（初回ロードが重いため）
+_embeddings_instance: Optional[CachedQueryEmbeddings] = None
+_embeddings_lock = threading.Lock()
+
+def get_embeddings() -> "Embeddings":
+    """共有の埋め込みモデルを取得（初回呼び出し時にロード）"""
+    global _embeddings_instance
+    if _embeddings_instance is None:
+        with _embeddings_lock:
+            if _embeddings_instance is None:
+                _embeddings_instance = CachedQueryEmbeddings(create_embeddings())
+                get_logger().info("埋め込みモデルの初期化完了")
+    return _embeddings_instance
+
+def get_query_embedding_stats() -> Dict[str, Any]:
+    """質問埋め込みキャッシュの統計を取得（未初期化の場合は空）"""
+    if isinstance(_embeddings_instance, CachedQueryEmbeddings):
+        return _embeddings_instance.get_stats()
+    return {}
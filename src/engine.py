@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Any, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+from config import config
+from src.cache import SimpleCache
+from src.chatbot import NetworkManualChatbot, create_llm
+from src.model_router import ModelRouter, get_llm
+from src.document_processor import DocumentProcessor
+from src.ingestion_jobs import IngestionJob, get_job_queue, submit_uploads
+from src.logger import get_logger
+from src.metrics import get_metrics_registry
+from src.retrieval import create_retriever
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+_active_sessions = get_metrics_registry().gauge("chat_sessions_active", "会話履歴を保持しているセッション数")
+
+class _Session:
+    """1つの会話（会話履歴を持つチャットボットと、同時実行を防ぐロック）"""
+
+    def __init__(self, chatbot: NetworkManualChatbot):
+        self.chatbot = chatbot
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+class ChatEngine:
+    """複数の会話で検索・LLMクライアント・回答キャッシュを共有するエンジン
+
+    セッションごとに異なるのは会話履歴のみ。ベクトルストア・埋め込みモデルは
+    プロセス内で1つだけ読み込まれる。
+    """
+
+    def __init__(
+        self,
+        model_name: str = None,
+        llm: Optional["BaseChatModel"] = None,
+        max_sessions: int = None
+    ):
+        self.logger = get_logger()
+        self.model_name = model_name or config.MODEL_NAME
+        # モデルの振り分けは全セッションで共有（llm を渡した場合は常にそのモデルで回答）
+        self.router = ModelRouter(self.model_name) if llm is None and config.MODEL_ROUTING else None
+        self.llm = llm or (get_llm(self.model_name) if self.router else create_llm(self.model_name, max_retries=0))
+        self.cache = SimpleCache(cache_dir=config.CACHE_DIR) if config.ENABLE_CACHE else None
+        self.processor = DocumentProcessor()
+        self.max_sessions = max_sessions or config.API_MAX_SESSIONS
+        self._retriever = None
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # インジェスト完了時に新しいバージョンの検索器へ切り替える
+        get_job_queue().add_listener(self._on_ingestion_finished)
+        # 前回のプロセスで中断したインジェストを再開
+        get_job_queue().resume_interrupted()
+
+        self.logger.info(
+            f"チャットエンジン初期化 - モデル: {self.model_name}, "
+            f"振り分け: {self.router is not None}, スタブ: {config.LLM_STUB}, セッション上限: {self.max_sessions}"
+        )
+
+    def _get_retriever(self):
+        """検索器を取得（初回のみベクトルストアを読み込む）"""
+        if self._retriever is None:
+            with self._lock:
+                if self._retriever is None:
+                    self._retriever = create_retriever(self.processor)
+        return self._retriever
+
+    def _get_session(self, session_id: str) -> _Session:
+        """セッションを取得（なければ作成し、上限を超えたら最も古いものを破棄）"""
+        retriever = self._get_retriever()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                chatbot = NetworkManualChatbot(
+                    retriever, model_name=self.model_name, llm=self.llm, cache=self.cache, router=self.router
+                )
+                session = _Session(chatbot)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    evicted_id, _ = self._sessions.popitem(last=False)
+                    self.logger.info(f"セッション上限のため破棄: {evicted_id}")
+                _active_sessions.set(len(self._sessions))
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_used = time.time()
+            return session
+
+    def ask(
+        self, session_id: str, question: str, deadline_sec: float = None, product: str = None
+    ) -> Tuple[str, List[dict]]:
+        """セッションの会話履歴を使って回答を生成（product は検索対象の製品。未指定なら質問から推定）"""
+        session = self._get_session(session_id)
+        # 同じセッションへの同時リクエストは会話履歴が混ざらないよう順番に処理
+        with session.lock:
+            return session.chatbot.ask(question, deadline_sec=deadline_sec, product=product)
+
+    def ask_stream(
+        self, session_id: str, question: str, deadline_sec: float = None, product: str = None
+    ) -> Iterator[Dict[str, Any]]:
+        """セッションの会話履歴を使って回答を逐次生成"""
+        session = self._get_session(session_id)
+        with session.lock:
+            yield from session.chatbot.ask_stream(question, deadline_sec=deadline_sec, product=product)
+
+    def clear_session(self, session_id: str) -> bool:
+        """セッションを破棄"""
+        with self._lock:
+            removed = self._sessions.pop(session_id, None) is not None
+            _active_sessions.set(len(self._sessions))
+        return removed
+
+    def ingest(self, uploads: Iterable[Tuple[str, BinaryIO]]) -> Dict[str, Any]:
+        """マニュアルを保存し、取り込みをバックグラウンドジョブとして登録"""
+        job, skipped_count = submit_uploads(uploads)
+        if job is None:
+            return {"job": None, "skipped_count": skipped_count}
+        return {"job": job.to_dict(), "skipped_count": skipped_count}
+
+    def _on_ingestion_finished(self, job: IngestionJob):
+        """新しいバージョンのベクトルストアを開いてから検索器を切り替え"""
+        processor = DocumentProcessor()
+        retriever = create_retriever(processor)
+        with self._lock:
+            self.processor = processor
+            self._retriever = retriever
+            for session in self._sessions.values():
+                session.chatbot.retriever = retriever
+        self.logger.info(f"検索対象を新しいインデックスに切り替え: {job.version}")
+
+    def get_status(self) -> Dict[str, Any]:
+        """エンジンの状態"""
+        with self._lock:
+            session_count = len(self._sessions)
+        return {
+            "model_name": self.model_name,
+            "llm_stub": config.LLM_STUB,
+            "sessions": session_count,
+            "max_sessions": self.max_sessions,
+            "jobs": [job for job in get_job_queue().list_jobs() if job["status"] in ("queued", "running")],
+            "vectorstore": self.processor.get_vectorstore_info(),
+            "retrieval": self._retriever.get_stats() if hasattr(self._retriever, "get_stats") else {},
+            "cache": self.cache.get_stats() if self.cache else {}
+        }
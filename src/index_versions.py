@@ -0,0 +1,116 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from config import config
+from src.ingestion_checkpoint import CHECKPOINT_FILENAME
+from src.logger import get_logger
+
+VERSIONS_DIRNAME = "versions"
+CURRENT_FILENAME = "CURRENT"
+
+class IndexVersions:
+    """ベクトルストアをバージョンごとのディレクトリで管理するクラス
+
+    PERSIST_DIRECTORY/versions/<バージョンID>/ にChromaのデータとマニフェストを置き、
+    PERSIST_DIRECTORY/CURRENT に現在のバージョンIDを書く。新しいバージョンは
+    別ディレクトリで作成してから CURRENT を os.replace で置き換えるため、
+    作成中も以前のバージョンへの検索は影響を受けない。
+
+    CURRENT がない場合は、従来どおり PERSIST_DIRECTORY 直下をストアとして扱う。
+    """
+
+    def __init__(self, root_dir: str = None, keep_versions: int = None):
+        self.root_dir = Path(root_dir or config.PERSIST_DIRECTORY)
+        self.versions_dir = self.root_dir / VERSIONS_DIRNAME
+        self.current_path = self.root_dir / CURRENT_FILENAME
+        self.keep_versions = keep_versions or config.INDEX_KEEP_VERSIONS
+        self.logger = get_logger()
+        self._lock = threading.Lock()
+
+    def current_version(self) -> Optional[str]:
+        """現在のバージョンID（バージョン管理前のストアではNone）"""
+        try:
+            return self.current_path.read_text(encoding='utf-8').strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current_directory(self) -> Path:
+        """現在のバージョンのディレクトリ"""
+        version = self.current_version()
+        if version is None:
+            return self.root_dir
+        return self.versions_dir / version
+
+    def prepare(self, copy_current: bool = True) -> Dict[str, Any]:
+        """現在のバージョンを複製して新しいバージョンのディレクトリを作成
+
+        追加インジェストは複製に対して行うため、完了して切り替えるまで
+        現在のバージョンは変更されない。copy_current=False では空のディレクトリを作成する
+        （スナップショットからの復元など、内容をすべて置き換える場合）。
+        """
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        directory = self.versions_dir / version
+        source = self.current_directory()
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+
+        if copy_current and source.exists() and any(p.name not in (VERSIONS_DIRNAME, CURRENT_FILENAME) for p in source.iterdir()):
+            shutil.copytree(
+                source,
+                directory,
+                # シャード検索のスナップショット（*.vsnap）は複製後の内容と一致しなくなるため複製しない
+                ignore=shutil.ignore_patterns(VERSIONS_DIRNAME, f"{CURRENT_FILENAME}*", CHECKPOINT_FILENAME, "*.vsnap")
+            )
+            self.logger.info(f"インデックスの新バージョンを作成: {version}（{source} から複製）")
+        else:
+            directory.mkdir(parents=True)
+            self.logger.info(f"インデックスの新バージョンを作成: {version}")
+
+        return {"version": version, "directory": str(directory)}
+
+    def activate(self, version: str) -> List[str]:
+        """CURRENT を置き換えて新しいバージョンに切り替え（削除した古いディレクトリを返す）"""
+        with self._lock:
+            tmp_path = self.current_path.with_name(f"{CURRENT_FILENAME}.tmp")
+            tmp_path.write_text(version, encoding='utf-8')
+            os.replace(tmp_path, self.current_path)
+        self.logger.info(f"インデックスのバージョンを切り替え: {version}")
+        return self.cleanup()
+
+    def discard(self, version: str):
+        """作成途中で不要になったバージョンを削除"""
+        if version == self.current_version():
+            return
+        shutil.rmtree(self.versions_dir / version, ignore_errors=True)
+        self.logger.info(f"インデックスのバージョンを破棄: {version}")
+
+    def list_versions(self) -> List[str]:
+        """作成済みのバージョン（古い順）"""
+        if not self.versions_dir.exists():
+            return []
+        return sorted(p.name for p in self.versions_dir.iterdir() if p.is_dir())
+
+    def cleanup(self) -> List[str]:
+        """現在のバージョンを含めて新しい順に keep_versions 件を残し、それ以外を削除"""
+        current = self.current_version()
+        versions = [v for v in self.list_versions() if v != current]
+        removed = []
+        # 直前のバージョンは、切り替え前に開始した検索が使い終わるまで残す
+        for version in versions[:max(0, len(versions) - (self.keep_versions - 1))]:
+            directory = self.versions_dir / version
+            shutil.rmtree(directory, ignore_errors=True)
+            removed.append(str(directory))
+            self.logger.info(f"古いインデックスのバージョンを削除: {version}")
+        return removed
+
+def get_index_versions() -> IndexVersions:
+    """PERSIST_DIRECTORY のバージョン管理を取得"""
+    return IndexVersions()
+
+def active_index_directory() -> str:
+    """現在有効なベクトルストアのディレクトリ"""
+    return str(IndexVersions().current_directory())
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional
+
+from src.logger import get_logger
+
+CHECKPOINT_FILENAME = "ingest_checkpoint.jsonl"
+
+# ファイル内容のハッシュを計算する際の読み込み単位
+_HASH_READ_SIZE = 1024 * 1024
+
+def file_content_hash(path: str) -> str:
+    """ファイル内容のSHA-256（コンテンツハッシュのないファイルの識別に使う）"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(_HASH_READ_SIZE)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def chunk_id(file_key: str, chunk_index: int) -> str:
+    """チャンクのID（同じファイル・同じ分割設定なら常に同じ値になる）"""
+    return hashlib.sha256(f"{file_key}:{chunk_index}".encode('utf-8')).hexdigest()[:32]
+
+class IngestionCheckpoint:
+    """インジェストの進捗を記録するジャーナル
+
+    PERSIST_DIRECTORY/ingest_checkpoint.jsonl に1行1レコードで追記し、
+    書き込むたびに fsync する。先頭行は対象ファイルと分割・埋め込み設定から作る
+    実行キーで、同じ実行キーで再開した場合のみ記録済みの進捗を引き継ぐ。
+
+    - chunks: ファイルごとに書き込み済みのチャンク数（ベクトルストアへの追加後に記録）
+    - file: ファイル単位の完了（ページ数・チャンク数など、マニフェストの作成に必要な情報）
+    """
+
+    def __init__(self, persist_directory: str):
+        self.path = Path(persist_directory) / CHECKPOINT_FILENAME
+        self.logger = get_logger()
+        self.run_key: Optional[str] = None
+        self.chunks_done: Dict[str, int] = {}
+        self.completed_files: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def make_run_key(file_keys: Iterable[str], settings: Dict[str, Any]) -> str:
+        """対象ファイルと設定から実行キーを作成"""
+        payload = json.dumps({"files": list(file_keys), "settings": settings}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def _read_records(self) -> List[Dict[str, Any]]:
+        """記録済みのレコード（書き込み途中で途切れた最終行は無視）"""
+        records = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+        except FileNotFoundError:
+            pass
+        return records
+
+    def begin(self, run_key: str) -> bool:
+        """記録を開始（同じ実行キーの記録があれば引き継いでTrueを返す）"""
+        self.run_key = run_key
+        records = self._read_records()
+        if records and records[0].get("type") == "run" and records[0].get("run_key") == run_key:
+            for record in records[1:]:
+                if record.get("type") == "chunks":
+                    self.chunks_done.update(record["done"])
+                elif record.get("type") == "file":
+                    self.completed_files[record["file_key"]] = record
+            self.logger.info(
+                f"チェックポイントから再開 - 完了ファイル数: {len(self.completed_files)}, "
+                f"書き込み済みチャンク数: {sum(self.chunks_done.values())}"
+            )
+            return True
+
+        if records:
+            self.logger.warning("対象ファイルまたは設定が異なるため、以前のチェックポイントを破棄します")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            self._write(f, {"type": "run", "run_key": run_key, "started_at": time.time()})
+        return False
+
+    @staticmethod
+    def _write(f, record: Dict[str, Any]):
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _append(self, record: Dict[str, Any]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            self._write(f, record)
+
+    def record_chunks(self, done_by_file: Dict[str, int]):
+        """ベクトルストアに書き込んだチャンク数を記録（1バッチにつき1行）"""
+        self.chunks_done.update(done_by_file)
+        self._append({"type": "chunks", "done": done_by_file})
+
+    def record_file(self, file_key: str, name: str, pages: int, chunks: int, content_hash: Optional[str]):
+        """ファイルのすべてのチャンクを書き込んだことを記録"""
+        record = {
+            "type": "file",
+            "file_key": file_key,
+            "name": name,
+            "pages": pages,
+            "chunks": chunks,
+            "content_hash": content_hash
+        }
+        self.completed_files[file_key] = record
+        self._append(record)
+
+    def finish(self):
+        """マニフェストの書き込み後に記録を削除"""
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+def has_checkpoint(persist_directory: str) -> bool:
+    """中断したインジェストの記録が残っているか"""
+    return (Path(persist_directory) / CHECKPOINT_FILENAME).exists()
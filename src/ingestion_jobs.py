@@ -0,0 +1,468 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Any, Iterable, List, Optional, Tuple
+
+import psutil
+
+from config import config
+from src.document_processor import DocumentProcessor, IngestionCancelled, read_manifest, release_vectorstore
+from src.index_versions import get_index_versions
+from src.logger import get_logger
+from src.manual_store import ManualStore
+from src.metrics import get_metrics_registry
+from src.tracing import request_context
+
+# 全体の進捗率を計算する際の段階ごとの重み
+STAGE_WEIGHTS = {"parse": 0.3, "split": 0.05, "embed": 0.5, "persist": 0.1, "activate": 0.05}
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# 作成中のバージョンに置くジョブの記録（プロセスが中断した場合の再開に使う）
+JOB_FILENAME = "job.json"
+# 作成中のバージョンを実行しているプロセス（pid・ホスト・起動時刻）。Streamlit画面とAPIサーバーが
+# 同じバージョンを同時に再開しないよう、排他的に作成し、所有プロセスが終了している場合のみ奪う
+JOB_LOCK_FILENAME = "job.lock"
+# 読み込めないロック（書き込み途中でプロセスが終了したもの）を無効とみなすまでの秒数
+JOB_LOCK_UNREADABLE_GRACE_SEC = 60
+
+_jobs_total = get_metrics_registry().counter("ingestion_jobs_total", "インジェストジョブ数", ("status",))
+_jobs_queued = get_metrics_registry().gauge("ingestion_jobs_queued", "実行待ちのインジェストジョブ数")
+
+class IngestionJob:
+    """バックグラウンドで実行するインジェスト1件分の状態"""
+
+    def __init__(
+        self,
+        files: List[Dict[str, str]],
+        remove_hashes: List[str],
+        skipped_count: int = 0,
+        job_id: str = None,
+        resume_version: str = None
+    ):
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.files = files
+        self.remove_hashes = remove_hashes
+        self.skipped_count = skipped_count
+        # 中断したジョブの再開時は、作成途中のバージョンをそのまま使う
+        self.resume_version = resume_version
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.stage_progress: Dict[str, Dict[str, Any]] = {}
+        self.file_states: Dict[str, Dict[str, Any]] = {
+            item["name"]: {"status": "pending", "pages": 0} for item in files
+        }
+        self.version: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel_event = threading.Event()
+        # 新しいバージョンへの切り替えを開始した後はキャンセルを受け付けない
+        self._activating = False
+        self._lock = threading.Lock()
+
+    def report(
+        self,
+        stage: str,
+        file: str = None,
+        file_status: str = None,
+        pages: int = None,
+        file_stats: Dict[str, Any] = None,
+        **info
+    ):
+        """DocumentProcessor からの進捗通知（キャンセル済みなら中断する。切り替えの開始後は中断しない）"""
+        if self._cancel_event.is_set() and not self._activating:
+            raise IngestionCancelled(f"ジョブ {self.job_id} はキャンセルされました")
+        with self._lock:
+            self.stage = stage
+            self.stage_progress.setdefault(stage, {}).update(info)
+            if file and file in self.file_states:
+                if file_status:
+                    self.file_states[file]["status"] = file_status
+                if pages is not None:
+                    self.file_states[file]["pages"] = pages
+                if file_stats:
+                    self.file_states[file].update(file_stats)
+
+    def cancel(self) -> bool:
+        """キャンセルを要求（実行中の場合は次の進捗通知で中断）"""
+        with self._lock:
+            if self.status not in ACTIVE_STATUSES or self._activating:
+                return False
+            self._cancel_event.set()
+            return True
+
+    def begin_activation(self):
+        """新しいバージョンへの切り替えを開始（以降はキャンセルを受け付けず、進捗通知でも中断しない）"""
+        with self._lock:
+            self._activating = True
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def _progress_ratio(self) -> float:
+        """段階ごとの重みで計算した全体の進捗率（0.0〜1.0、ロック取得済みで呼ぶ）"""
+        if self.status == "succeeded":
+            return 1.0
+        ratio = 0.0
+        for stage, weight in STAGE_WEIGHTS.items():
+            progress = self.stage_progress.get(stage)
+            if progress and progress.get("total"):
+                ratio += weight * min(1.0, progress.get("done", 0) / progress["total"])
+        return ratio
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": round(self._progress_ratio(), 4),
+                "stages": {stage: dict(progress) for stage, progress in self.stage_progress.items()},
+                "files": [{"name": name, **state} for name, state in self.file_states.items()],
+                "removed_hashes": list(self.remove_hashes),
+                "skipped_count": self.skipped_count,
+                "version": self.version,
+                "resumed": self.resume_version is not None,
+                "error": self.error,
+                "cancel_requested": self.cancel_requested,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at
+            }
+
+class IngestionJobQueue:
+    """インジェストジョブを1件ずつ順番に実行するローカルキュー
+
+    ジョブは新しいインデックスのバージョンに対して実行され、完了時に
+    現在のバージョンを切り替える。実行中も以前のバージョンへの検索は継続できる。
+    ジョブはプロセス内のワーカースレッドで動くため、ブラウザを閉じても中断されない。
+    """
+
+    def __init__(self, history_size: int = None):
+        self.history_size = history_size or config.INGEST_JOB_HISTORY
+        self.logger = get_logger()
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._queue: "queue.Queue[IngestionJob]" = queue.Queue()
+        self._listeners: List[Callable[[IngestionJob], None]] = []
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._resume_checked = False
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run_worker, name="ingestion-worker", daemon=True)
+            self._worker.start()
+
+    def add_listener(self, listener: Callable[[IngestionJob], None]):
+        """ジョブ完了（新バージョンへの切り替え後）に呼ばれる関数を登録"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def submit(
+        self,
+        files: List[Dict[str, str]],
+        remove_hashes: List[str] = None,
+        skipped_count: int = 0,
+        job_id: str = None,
+        resume_version: str = None
+    ) -> IngestionJob:
+        """ジョブを登録"""
+        job = IngestionJob(files, remove_hashes or [], skipped_count, job_id, resume_version)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            # 古い完了済みジョブの記録を削除
+            finished = [job_id for job_id, j in self._jobs.items() if j.status not in ACTIVE_STATUSES]
+            for job_id in finished[:max(0, len(self._jobs) - self.history_size)]:
+                del self._jobs[job_id]
+            self._ensure_worker()
+        self._queue.put(job)
+        _jobs_queued.inc()
+        self.logger.info(
+            f"インジェストジョブ登録: {job.job_id} - ファイル数: {len(files)}, 削除ハッシュ数: {len(job.remove_hashes)}"
+        )
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """新しい順にジョブの状態を取得"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def active_hashes(self) -> set:
+        """実行待ち・実行中のジョブが処理する内容のハッシュ"""
+        with self._lock:
+            return {
+                item["sha256"]
+                for job in self._jobs.values() if job.status in ACTIVE_STATUSES
+                for item in job.files
+            }
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None:
+            return False
+        cancelled = job.cancel()
+        if cancelled:
+            self.logger.info(f"インジェストジョブのキャンセル要求: {job_id}")
+        return cancelled
+
+    def resume_interrupted(self) -> List[IngestionJob]:
+        """前回のプロセスで中断したジョブを再登録（プロセス内で1回のみ確認）
+
+        作成途中のバージョンにジョブの記録が残っていれば、同じバージョンで再実行する。
+        DocumentProcessor のチェックポイントにより、書き込み済みのチャンクの次から再開される。
+        """
+        with self._lock:
+            if self._resume_checked:
+                return []
+            self._resume_checked = True
+
+        versions = get_index_versions()
+        current = versions.current_version()
+        resumed = []
+        for version in versions.list_versions():
+            if version == current:
+                continue
+            descriptor = _read_job_descriptor(versions.versions_dir / version)
+            if descriptor is None:
+                continue
+            if not _acquire_job_lock(versions.versions_dir / version):
+                self.logger.info(f"他のプロセスが実行中のため再開しません: {descriptor.get('job_id')} ({version})")
+                continue
+            if descriptor.get("base_version") != current:
+                # 複製元のバージョンから切り替わっているため、再開すると他の変更が失われる
+                self.logger.warning(f"複製元が異なるため中断したジョブを破棄: {descriptor.get('job_id')} ({version})")
+                versions.discard(version)
+                continue
+            resumed.append(self.submit(
+                descriptor["files"],
+                descriptor.get("remove_hashes", []),
+                job_id=descriptor.get("job_id"),
+                resume_version=version
+            ))
+            self.logger.info(f"中断したインジェストジョブを再登録: {descriptor.get('job_id')} - バージョン: {version}")
+        return resumed
+
+    def _run_worker(self):
+        while True:
+            job = self._queue.get()
+            _jobs_queued.dec()
+            try:
+                with request_context(job.job_id):
+                    self._run_job(job)
+            except Exception as e:
+                self.logger.error(f"インジェストジョブの予期しないエラー: {str(e)}")
+
+    def _finish(self, job: IngestionJob, status: str, error: str = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        _jobs_total.inc(status=status)
+
+    def _run_job(self, job: IngestionJob):
+        if job.cancel_requested:
+            if job.resume_version:
+                # 作成途中のバージョンは残すため、次に起動したプロセスが再開できるようにする
+                _release_job_lock(get_index_versions().versions_dir / job.resume_version)
+            self._finish(job, "cancelled")
+            return
+
+        job.status = "running"
+        job.started_at = time.time()
+        versions = get_index_versions()
+        try:
+            if job.resume_version:
+                prepared = {
+                    "version": job.resume_version,
+                    "directory": str(versions.versions_dir / job.resume_version)
+                }
+            else:
+                base_version = versions.current_version()
+                prepared = versions.prepare()
+                _acquire_job_lock(prepared["directory"])
+                _write_job_descriptor(prepared["directory"], job, base_version)
+        except Exception as e:
+            self._finish(job, "failed", str(e))
+            self.logger.error(f"インデックスの新バージョン作成エラー: {str(e)}")
+            return
+        job.version = prepared["version"]
+        self.logger.info(
+            f"インジェストジョブ{'再開' if job.resume_version else '開始'}: {job.job_id} - バージョン: {job.version}"
+        )
+
+        try:
+            processor = DocumentProcessor(persist_directory=prepared["directory"])
+
+            # 内容が変わったファイルの古いチャンクを新バージョンから削除
+            if job.remove_hashes:
+                job.report("remove", done=0, total=len(job.remove_hashes))
+                processor.remove_content(job.remove_hashes)
+                job.report("remove", done=len(job.remove_hashes), total=len(job.remove_hashes))
+
+            if job.files:
+                processor.process_files(
+                    [(item["path"], item["name"], item["sha256"]) for item in job.files],
+                    progress=job.report
+                )
+
+            # 新しいバージョンに切り替え（切り替え後は再開の対象にならないよう記録を先に削除）
+            job.report("activate", done=0, total=1)
+            job.begin_activation()
+            (Path(prepared["directory"]) / JOB_FILENAME).unlink(missing_ok=True)
+            _release_job_lock(prepared["directory"])
+            for removed_directory in versions.activate(job.version):
+                release_vectorstore(removed_directory)
+            job.report("activate", done=1, total=1)
+
+            if job.remove_hashes:
+                ManualStore(config.MANUAL_DIR).remove_blobs(job.remove_hashes)
+
+            self._finish(job, "succeeded")
+            self.logger.info(
+                f"インジェストジョブ完了: {job.job_id} - 所要時間: {job.finished_at - job.started_at:.1f}秒"
+            )
+        except IngestionCancelled:
+            self._discard(versions, prepared)
+            self._finish(job, "cancelled")
+            self.logger.info(f"インジェストジョブをキャンセルしました: {job.job_id}")
+            return
+        except Exception as e:
+            self._discard(versions, prepared)
+            self._finish(job, "failed", str(e))
+            self.logger.error(f"インジェストジョブ失敗: {job.job_id} - {str(e)}")
+            return
+
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(job)
+            except Exception as e:
+                self.logger.error(f"インジェスト完了通知エラー: {str(e)}")
+
+    @staticmethod
+    def _discard(versions, prepared: Dict[str, Any]):
+        """作成途中のバージョンを破棄"""
+        release_vectorstore(prepared["directory"])
+        versions.discard(prepared["version"])
+
+def _write_job_descriptor(directory: str, job: IngestionJob, base_version: Optional[str]):
+    """作成中のバージョンにジョブの内容を記録"""
+    descriptor = {
+        "job_id": job.job_id,
+        "base_version": base_version,
+        "files": job.files,
+        "remove_hashes": job.remove_hashes,
+        "created_at": job.created_at
+    }
+    path = Path(directory) / JOB_FILENAME
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(descriptor, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def _process_identity() -> Dict[str, Any]:
+    return {"pid": os.getpid(), "host": socket.gethostname(), "started_at": psutil.Process().create_time()}
+
+def _owner_alive(owner: Dict[str, Any]) -> bool:
+    """ロックを作成したプロセスが実行中か（他のホストのプロセスは確認できないため実行中とみなす）"""
+    if owner.get("host") != socket.gethostname():
+        return True
+    try:
+        process = psutil.Process(int(owner["pid"]))
+        # pid が再利用された別のプロセスと区別するため起動時刻も比べる
+        return abs(process.create_time() - float(owner["started_at"])) < 1.0
+    except (psutil.NoSuchProcess, KeyError, TypeError, ValueError):
+        return False
+
+def _acquire_job_lock(directory) -> bool:
+    """作成中のバージョンの実行権を取得（他の実行中のプロセスが持っていれば False）"""
+    path = Path(directory) / JOB_LOCK_FILENAME
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    owner = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                owner = None
+            if owner is None:
+                # 作成直後で書き込み途中の可能性があるため、しばらくは実行中とみなす
+                try:
+                    if time.time() - path.stat().st_mtime < JOB_LOCK_UNREADABLE_GRACE_SEC:
+                        return False
+                except FileNotFoundError:
+                    continue
+                owner = {}
+            elif _owner_alive(owner):
+                return False
+            get_logger().info(f"終了したプロセスのロックを解除: {path} (pid: {owner.get('pid')})")
+            path.unlink(missing_ok=True)
+            continue
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(_process_identity(), f)
+        return True
+    return False
+
+def _release_job_lock(directory):
+    (Path(directory) / JOB_LOCK_FILENAME).unlink(missing_ok=True)
+
+def _read_job_descriptor(directory: Path) -> Optional[Dict[str, Any]]:
+    """作成中のバージョンに残ったジョブの記録（なければNone）"""
+    try:
+        with open(directory / JOB_FILENAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        get_logger().warning(f"ジョブの記録の読み込みエラー: {directory} - {str(e)}")
+        return None
+
+# グローバルジョブキュー
+_job_queue = IngestionJobQueue()
+
+def get_job_queue() -> IngestionJobQueue:
+    """インジェストジョブキューを取得"""
+    return _job_queue
+
+def submit_uploads(
+    uploads: Iterable[Tuple[str, BinaryIO]],
+    manual_store: ManualStore = None
+) -> Tuple[Optional[IngestionJob], int]:
+    """アップロードされたファイルを保存し、未インジェストの内容をジョブとして登録
+
+    Streamlit画面とAPIサーバーの両方から使う。処理が必要な内容がなければ
+    ジョブは登録せず None を返す。2つ目の戻り値は処理済みのためスキップした件数。
+    """
+    manual_store = manual_store or ManualStore(config.MANUAL_DIR)
+
+    # アップロードされたファイルを内容ハッシュ単位で保存（ここまでは呼び出し元で同期的に行う）
+    upload_results = [manual_store.add(name, file_obj) for name, file_obj in uploads]
+    manifest = read_manifest(str(get_index_versions().current_directory())) or {}
+
+    # 同名ファイルの内容が変わった場合は古いチャンクを削除
+    replaced_hashes = [r["replaced_hash"] for r in upload_results if r["replaced_hash"]]
+    remove_hashes = manual_store.orphaned(replaced_hashes)
+
+    # 登録済みのジョブが処理する内容は重複して登録しない
+    ingested_hashes = set(manifest.get("content_hashes", [])) | _job_queue.active_hashes()
+    pending = manual_store.pending(ingested_hashes)
+    skipped_count = len(upload_results) - len(pending)
+    if not pending and not remove_hashes:
+        return None, skipped_count
+
+    return _job_queue.submit(pending, remove_hashes, skipped_count), skipped_count
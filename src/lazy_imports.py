@@ -0,0 +1,41 @@
+import importlib
+import threading
+import time
+from types import ModuleType
+from typing import Dict
+
+from src.logger import get_logger
+
+# モジュール名 -> 初回インポートに要した時間（秒）
+_import_times: Dict[str, float] = {}
+_import_lock = threading.Lock()
+
+def lazy_import(module_name: str) -> ModuleType:
+    """重量級モジュールを必要になった時点でインポートする
+
+    langchain / chromadb / sentence-transformers / torch などは
+    インポートだけで数秒かかるため、モジュール読み込み時ではなく
+    実際に使うサブシステムの中から呼び出す。初回のインポート時間は記録される。
+    """
+    # sys.modules を直接参照すると、他スレッドが実行中（初期化途中）のモジュールを返してしまうため、
+    # 常に import_module を通してモジュールごとのインポートロックで完了を待つ（読み込み済みなら高速）
+    if module_name in _import_times:
+        return importlib.import_module(module_name)
+
+    with _import_lock:
+        # 他スレッドが先にインポートを終えている可能性がある
+        if module_name in _import_times:
+            return importlib.import_module(module_name)
+
+        start_time = time.perf_counter()
+        module = importlib.import_module(module_name)
+        elapsed = time.perf_counter() - start_time
+        _import_times[module_name] = elapsed
+
+    get_logger().info(f"モジュール読み込み [{module_name}] - 所要時間: {elapsed:.3f}秒")
+    return module
+
+def get_import_times() -> Dict[str, float]:
+    """遅延インポートしたモジュールごとの読み込み時間を取得（遅い順）"""
+    with _import_lock:
+        return dict(sorted(_import_times.items(), key=lambda item: item[1], reverse=True))
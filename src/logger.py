@@ -1,58 +1,180 @@
+import atexit
+import json
 import logging
-import os
+import logging.handlers
+import queue
 import sys
+import threading
+import time
+from contextvars import ContextVar
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
+
+from config import config
+
+# 処理中のリクエストID（src.tracing が設定し、ログ行に付与する）
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+class RequestIdFilter(logging.Filter):
+    """ログレコードに現在のリクエストIDを付与するフィルター
+    
+    コンテキスト変数は呼び出し元スレッドでしか読めないため、キューに入れる前に付与する。
+    """
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get() or "-"
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """同じ箇所から繰り返し出力されるログを間引くフィルター
+    
+    呼び出し箇所（ファイル・行・レベル）ごとに window 秒あたり burst 件まで通し、
+    それを超えた分は捨てる。次の期間の最初の1件に抑制件数を付記する。
+    """
+    
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        # 呼び出し箇所 -> (期間の開始時刻, 期間内の件数, 抑制件数)
+        self._counts: Dict[Tuple[str, int, int], Tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno, record.levelno)
+        now = time.monotonic()
+        with self._lock:
+            window_start, count, suppressed = self._counts.get(key, (now, 0, 0))
+            if now - window_start >= self.window:
+                window_start, count = now, 0
+            elif count >= self.burst:
+                self._counts[key] = (window_start, count, suppressed + 1)
+                return False
+            self._counts[key] = (window_start, count + 1, 0)
+        
+        if suppressed and count == 0:
+            record.msg = f"{record.getMessage()} （同種のログ {suppressed}件を抑制）"
+            record.args = None
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """1行1JSONのフォーマッター（ログ収集基盤での解析用）"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
 
 class AppLogger:
-    """アプリケーション用ログ管理クラス"""
+    """アプリケーション用ログ管理クラス
+    
+    LOG_ASYNC 有効時はリクエスト処理中のスレッドではキューに積むだけにし、
+    ファイル・標準出力への書き込みは QueueListener のスレッドで行う。
+    """
     
-    def __init__(self, log_dir: str = "./logs", log_level: str = "INFO"):
-        self.log_dir = Path(log_dir)
-        self.log_level = getattr(logging, log_level.upper(), logging.INFO)
+    def __init__(self, log_dir: str = None, log_level: str = None):
+        self.log_dir = Path(log_dir or config.LOG_DIR)
+        self.log_level = getattr(logging, (log_level or config.LOG_LEVEL).upper(), logging.INFO)
         self.logger: Optional[logging.Logger] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
         self._setup_logger()
     
+    def _create_file_handler(self, log_path: Path) -> logging.Handler:
+        """ローテーション付きのファイルハンドラーを作成"""
+        if config.LOG_ROTATION == "size":
+            return logging.handlers.RotatingFileHandler(
+                log_path,
+                maxBytes=config.LOG_MAX_BYTES,
+                backupCount=config.LOG_BACKUP_COUNT,
+                encoding='utf-8'
+            )
+        # 日付が変わったら切り替える（長時間稼働しても前日のファイルに書き続けない）
+        handler = logging.handlers.TimedRotatingFileHandler(
+            log_path,
+            when="midnight",
+            backupCount=config.LOG_BACKUP_COUNT,
+            encoding='utf-8'
+        )
+        handler.suffix = "%Y%m%d"
+        return handler
+    
     def _setup_logger(self):
         """ロガーのセットアップ"""
         # ログディレクトリの作成
-        self.log_dir.mkdir(exist_ok=True)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
         
-        # ログファイル名（日付付き）
-        log_filename = f"chatbot_{datetime.now().strftime('%Y%m%d')}.log"
-        log_path = self.log_dir / log_filename
+        # ログファイル名（ローテーション後は chatbot.log.YYYYMMDD / chatbot.log.1 など）
+        log_path = self.log_dir / "chatbot.log"
         
         # ロガーの作成
         self.logger = logging.getLogger("NetworkManualChatbot")
         self.logger.setLevel(self.log_level)
         
-        # 既存のハンドラーをクリア
+        # 既存のハンドラー・フィルターをクリア
         if self.logger.handlers:
             self.logger.handlers.clear()
+        self.logger.filters.clear()
         
         # フォーマッターの定義
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
+        if config.LOG_FORMAT == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter(
+                '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] - %(message)s',
+                datefmt='%Y-%m-%d %H:%M:%S'
+            )
         
         # ファイルハンドラー
-        file_handler = logging.FileHandler(log_path, encoding='utf-8')
+        file_handler = self._create_file_handler(log_path)
         file_handler.setLevel(self.log_level)
         file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
         
         # コンソールハンドラー
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setLevel(self.log_level)
         console_handler.setFormatter(formatter)
-        self.logger.addHandler(console_handler)
+        
+        # リクエストIDの付与と間引きは呼び出し元スレッドで行う
+        self.logger.addFilter(RequestIdFilter())
+        if config.LOG_RATE_LIMIT_BURST > 0:
+            self.logger.addFilter(RateLimitFilter(config.LOG_RATE_LIMIT_BURST, config.LOG_RATE_LIMIT_WINDOW_SEC))
+        
+        if config.LOG_ASYNC:
+            log_queue: queue.Queue = queue.Queue(-1)
+            self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+            self.listener = logging.handlers.QueueListener(
+                log_queue, file_handler, console_handler, respect_handler_level=True
+            )
+            self.listener.start()
+            # 終了時にキューに残ったログを書き出す
+            atexit.register(self.stop)
+        else:
+            self.logger.addHandler(file_handler)
+            self.logger.addHandler(console_handler)
         
         # 初期ログ
         self.logger.info("=== アプリケーション開始 ===")
         self.logger.info(f"ログレベル: {logging.getLevelName(self.log_level)}")
-        self.logger.info(f"ログファイル: {log_path}")
+        self.logger.info(f"ログファイル: {log_path} (ローテーション: {config.LOG_ROTATION}, 非同期: {config.LOG_ASYNC})")
+    
+    def stop(self):
+        """非同期ログのリスナーを停止（キューの残りを書き出す）"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
     
     def get_logger(self) -> logging.Logger:
         """ロガーインスタンスを取得"""
@@ -91,7 +213,7 @@ class AppLogger:
 # グローバルロガーインスタンス
 _logger_instance: Optional[AppLogger] = None
 
-def setup_logger(log_dir: str = "./logs", log_level: str = "INFO") -> logging.Logger:
+def setup_logger(log_dir: str = None, log_level: str = None) -> logging.Logger:
     """ロガーを初期化して返す"""
     global _logger_instance
     if _logger_instance is None:
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Any, List, Iterable
+
+from src.logger import get_logger
+
+# アップロードを読み込む単位（メモリに全体を載せないため）
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+class ManualStore:
+    """コンテンツアドレス方式のマニュアル保存クラス
+
+    PDF本体は内容のSHA-256をファイル名として blobs/ に1つだけ保存し、
+    ファイル名 -> ハッシュ の対応を catalog.json で管理する。
+    同じ内容を別名でアップロードしても保存・インジェストは1回で済む。
+    """
+
+    def __init__(self, root_dir: str = "./data/manuals"):
+        self.root_dir = Path(root_dir)
+        self.blob_dir = self.root_dir / "blobs"
+        self.catalog_path = self.root_dir / "catalog.json"
+        self.logger = get_logger()
+        self._lock = threading.Lock()
+
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+
+    def _load_catalog(self) -> Dict[str, Dict[str, Any]]:
+        """カタログ（ファイル名 -> ハッシュ情報）を読み込み"""
+        try:
+            with open(self.catalog_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            self.logger.error(f"カタログ読み込みエラー: {str(e)}")
+            return {}
+
+    def _save_catalog(self, catalog: Dict[str, Dict[str, Any]]):
+        """カタログを保存（一時ファイル経由で置き換え）"""
+        tmp_path = self.catalog_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.catalog_path)
+
+    def blob_path(self, content_hash: str) -> Path:
+        """ハッシュに対応するPDFのパス"""
+        return self.blob_dir / f"{content_hash}.pdf"
+
+    def add(self, name: str, file_obj: BinaryIO) -> Dict[str, Any]:
+        """アップロードされたファイルをストリーミングで保存
+
+        戻り値の new_blob は初めて見る内容かどうか、changed は同名ファイルの内容が
+        変わったかどうか、replaced_hash は置き換えられた以前のハッシュを表す。
+        """
+        if hasattr(file_obj, "seek"):
+            file_obj.seek(0)
+
+        # ハッシュを計算しながら一時ファイルに書き込む
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=self.blob_dir, suffix=".upload")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                while True:
+                    chunk = file_obj.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    tmp_file.write(chunk)
+                    size += len(chunk)
+
+            content_hash = hasher.hexdigest()
+            blob_path = self.blob_path(content_hash)
+            new_blob = not blob_path.exists()
+            if new_blob:
+                os.replace(tmp_name, blob_path)
+            else:
+                os.unlink(tmp_name)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+        with self._lock:
+            catalog = self._load_catalog()
+            previous = catalog.get(name)
+            previous_hash = previous["sha256"] if previous else None
+            catalog[name] = {
+                "sha256": content_hash,
+                "size": size,
+                "uploaded_at": time.time()
+            }
+            self._save_catalog(catalog)
+
+        changed = previous_hash is not None and previous_hash != content_hash
+        if new_blob:
+            self.logger.info(f"ファイル保存: {name} ({content_hash[:12]}, {size / 1024 / 1024:.2f}MB)")
+        else:
+            self.logger.info(f"同一内容のファイルが保存済みのためスキップ: {name} ({content_hash[:12]})")
+        if changed:
+            self.logger.info(f"ファイル内容の変更を検出: {name} ({previous_hash[:12]} -> {content_hash[:12]})")
+
+        return {
+            "name": name,
+            "sha256": content_hash,
+            "size": size,
+            "new_blob": new_blob,
+            "changed": changed,
+            "replaced_hash": previous_hash if changed else None
+        }
+
+    def names_by_hash(self) -> Dict[str, List[str]]:
+        """ハッシュ -> ファイル名一覧"""
+        result: Dict[str, List[str]] = {}
+        for name, entry in self._load_catalog().items():
+            result.setdefault(entry["sha256"], []).append(name)
+        return result
+
+    def pending(self, ingested_hashes: Iterable[str]) -> List[Dict[str, Any]]:
+        """まだインジェストされていない内容の一覧（ハッシュごとに1件）"""
+        ingested = set(ingested_hashes)
+        pending_items = []
+        for content_hash, names in sorted(self.names_by_hash().items()):
+            if content_hash in ingested:
+                continue
+            pending_items.append({
+                "sha256": content_hash,
+                "name": sorted(names)[0],
+                "path": str(self.blob_path(content_hash))
+            })
+        return pending_items
+
+    def orphaned(self, content_hashes: Iterable[str]) -> List[str]:
+        """どのファイル名からも参照されなくなったハッシュを抽出"""
+        referenced = set(self.names_by_hash().keys())
+        return [content_hash for content_hash in content_hashes if content_hash not in referenced]
+
+    def remove_blobs(self, content_hashes: Iterable[str]):
+        """参照されなくなったPDF本体を削除"""
+        for content_hash in content_hashes:
+            blob_path = self.blob_path(content_hash)
+            if blob_path.exists():
+                blob_path.unlink()
+                self.logger.info(f"未参照のファイルを削除: {content_hash[:12]}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """保存状況の統計"""
+        catalog = self._load_catalog()
+        blobs = list(self.blob_dir.glob("*.pdf"))
+        logical_size = sum(entry["size"] for entry in catalog.values())
+        stored_size = sum(blob.stat().st_size for blob in blobs)
+        return {
+            "file_count": len(catalog),
+            "blob_count": len(blobs),
+            "logical_size_mb": logical_size / 1024 / 1024,
+            "stored_size_mb": stored_size / 1024 / 1024
+        }
@@ -0,0 +1,187 @@
+import threading
+import time
+import tracemalloc
+from collections import deque
+from functools import wraps
+from typing import Callable, Deque, Dict, Any, List, Optional
+
+import psutil
+
+from config import config
+from src.logger import get_logger
+from src.metrics import get_metrics_registry
+
+_peak_rss_gauge = get_metrics_registry().gauge(
+    "stage_peak_rss_mb", "直近の実行におけるピークRSS（MB）", ("stage",)
+)
+_peak_heap_gauge = get_metrics_registry().gauge(
+    "stage_peak_python_heap_mb", "直近の実行におけるPythonヒープのピーク（MB、tracemalloc有効時）", ("stage",)
+)
+
+class MemorySampler:
+    """バックグラウンドでRSSを一定間隔で読み取り、ピーク値を記録するクラス
+
+    関数終了後にRSSを1回読むだけでは、Chroma.from_documents やPDF解析中の
+    一時的なピークが見えないため、実行中も定期的に読み取る。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._process = psutil.Process()
+        self.start_rss = self._process.memory_info().rss
+        self.peak_rss = self.start_rss
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+        self._read()
+
+    def _read(self):
+        rss = self._process.memory_info().rss
+        if rss > self.peak_rss:
+            self.peak_rss = rss
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._read()
+
+class MemoryTracker:
+    """処理段階ごとのメモリ使用状況（ピークRSS・ピークヒープ・主な確保箇所）を記録するクラス"""
+
+    def __init__(self, history_size: int = 50):
+        self.logger = get_logger()
+        self._reports: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        # tracemalloc はプロセス全体で1つのため、同時に1段階のみ計測する
+        self._tracemalloc_lock = threading.Lock()
+
+    def track(self, stage: str):
+        """段階のメモリを計測するデコレータ（MEMORY_TRACKING 有効時のみ）"""
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not config.MEMORY_TRACKING:
+                    return func(*args, **kwargs)
+                return self._run_tracked(stage, func, args, kwargs)
+            return wrapper
+        return decorator
+
+    def _run_tracked(self, stage: str, func: Callable, args, kwargs):
+        sampler = MemorySampler(config.MEMORY_SAMPLE_INTERVAL_MS / 1000)
+        sampler.start()
+
+        # 入れ子の段階（process_documents 内の load_pdf など）では tracemalloc を共有しない
+        use_tracemalloc = (
+            config.MEMORY_TRACEMALLOC
+            and not tracemalloc.is_tracing()
+            and self._tracemalloc_lock.acquire(blocking=False)
+        )
+        if use_tracemalloc:
+            tracemalloc.start(config.MEMORY_TRACEMALLOC_FRAMES)
+            before_snapshot = tracemalloc.take_snapshot()
+
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start_time
+            sampler.stop()
+
+            peak_heap_mb: Optional[float] = None
+            top_allocations: List[Dict[str, Any]] = []
+            if use_tracemalloc:
+                try:
+                    after_snapshot = tracemalloc.take_snapshot()
+                    _, peak_heap = tracemalloc.get_traced_memory()
+                    peak_heap_mb = peak_heap / 1024 / 1024
+                    top_allocations = self._top_allocations(before_snapshot, after_snapshot)
+                finally:
+                    tracemalloc.stop()
+                    self._tracemalloc_lock.release()
+
+            self._record(stage, duration, sampler, peak_heap_mb, top_allocations)
+
+    @staticmethod
+    def _top_allocations(before, after, limit: int = 10) -> List[Dict[str, Any]]:
+        """2つのスナップショットの差分から確保量の多い箇所を抽出"""
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+        stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "traceback")
+        allocations = []
+        for stat in stats[:limit]:
+            frame = stat.traceback[-1]
+            allocations.append({
+                "location": f"{frame.filename}:{frame.lineno}",
+                "traceback": [f"{f.filename}:{f.lineno}" for f in stat.traceback],
+                "size_diff_mb": stat.size_diff / 1024 / 1024,
+                "count_diff": stat.count_diff
+            })
+        return allocations
+
+    def _record(self, stage: str, duration: float, sampler: MemorySampler,
+                peak_heap_mb: Optional[float], top_allocations: List[Dict[str, Any]]):
+        """計測結果を保存・出力"""
+        report = {
+            "stage": stage,
+            "timestamp": time.time(),
+            "duration_sec": duration,
+            "start_rss_mb": sampler.start_rss / 1024 / 1024,
+            "peak_rss_mb": sampler.peak_rss / 1024 / 1024,
+            "rss_growth_mb": (sampler.peak_rss - sampler.start_rss) / 1024 / 1024,
+            "peak_heap_mb": peak_heap_mb,
+            "top_allocations": top_allocations
+        }
+        with self._lock:
+            self._reports.append(report)
+
+        _peak_rss_gauge.set(report["peak_rss_mb"], stage=stage)
+        if peak_heap_mb is not None:
+            _peak_heap_gauge.set(peak_heap_mb, stage=stage)
+
+        message = (
+            f"メモリ計測 [{stage}] - "
+            f"ピークRSS: {report['peak_rss_mb']:.1f}MB (+{report['rss_growth_mb']:.1f}MB)"
+        )
+        if peak_heap_mb is not None:
+            message += f", ピークヒープ: {peak_heap_mb:.1f}MB"
+        if top_allocations:
+            top = top_allocations[0]
+            message += f", 最大確保箇所: {top['location']} ({top['size_diff_mb']:+.1f}MB)"
+        self.logger.info(message)
+
+    def get_reports(self, stage: str = None) -> List[Dict[str, Any]]:
+        """計測結果を新しい順に取得"""
+        with self._lock:
+            reports = list(self._reports)
+        if stage:
+            reports = [r for r in reports if r["stage"] == stage]
+        return list(reversed(reports))
+
+    def get_peak_summary(self) -> Dict[str, Dict[str, float]]:
+        """段階ごとのピークRSS・ピークヒープの最大値"""
+        summary: Dict[str, Dict[str, float]] = {}
+        for report in self.get_reports():
+            entry = summary.setdefault(report["stage"], {"runs": 0, "max_peak_rss_mb": 0.0, "max_peak_heap_mb": 0.0})
+            entry["runs"] += 1
+            entry["max_peak_rss_mb"] = max(entry["max_peak_rss_mb"], report["peak_rss_mb"])
+            if report["peak_heap_mb"] is not None:
+                entry["max_peak_heap_mb"] = max(entry["max_peak_heap_mb"], report["peak_heap_mb"])
+        return summary
+
+# グローバルメモリトラッカー
+_memory_tracker = MemoryTracker()
+
+def get_memory_tracker() -> MemoryTracker:
+    """メモリトラッカーを取得"""
+    return _memory_tracker
+
+def track_memory(stage: str):
+    """グローバルトラッカーで段階のメモリを計測するデコレータ"""
+    return _memory_tracker.track(stage)
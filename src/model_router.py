@@ -0,0 +1,217 @@
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+from config import config
+from src.deadline import DeadlineExceeded, remaining_time
+from src.lazy_imports import lazy_import
+from src.logger import get_logger
+from src.metrics import get_metrics_registry
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+# 手順・設計・原因調査など、大きいモデルで回答する質問の手がかり
+COMPLEX_PATTERNS = re.compile(
+    r"手順|方法|やり方|設定例|構成|設計|移行|比較|違い|なぜ|原因|トラブル|障害|切り分け|冗長|"
+    r"how to|how do|configure|step|troubleshoot|why|difference|compare|migrat|design",
+    re.IGNORECASE
+)
+# 用語・既定値・コマンド名など、小さいモデルで十分な調べものの手がかり
+SIMPLE_PATTERNS = re.compile(
+    r"とは|意味|略|デフォルト|既定|初期値|コマンド(は|名)|何番|どれ|"
+    r"what is|what does|default|which command|stand for",
+    re.IGNORECASE
+)
+
+_metrics = get_metrics_registry()
+_route_decisions = _metrics.counter("chatbot_route_decisions_total", "質問の振り分け結果", ("route", "model"))
+_model_latency = _metrics.histogram(
+    "chatbot_model_latency_seconds", "モデル別のLLM呼び出し時間", ("model", "outcome")
+)
+_model_fallbacks = _metrics.counter(
+    "chatbot_model_fallbacks_total", "次のモデルへの切り替え回数", ("model", "reason")
+)
+
+# LLMクライアントはモデルごとにプロセス内で1つだけ作成する
+_llms: Dict[str, "BaseChatModel"] = {}
+_llms_lock = threading.Lock()
+
+def classify_question(question: str) -> str:
+    """質問を simple（用語・コマンドの調べもの）/ complex（手順・設計など）に分類
+
+    正規表現と文字数のみで判定するため、LLM呼び出しの前に追加の待ち時間は生じない。
+    判断できない質問は complex として大きいモデルに送る。
+    """
+    text = question.strip()
+    if len(text) > config.ROUTER_SIMPLE_MAX_CHARS or "\n" in text:
+        return "complex"
+    if text.count("?") + text.count("？") > 1:
+        return "complex"
+    if COMPLEX_PATTERNS.search(text):
+        return "complex"
+    if SIMPLE_PATTERNS.search(text):
+        return "simple"
+    return "complex"
+
+def get_llm(model_name: str) -> "BaseChatModel":
+    """モデルのLLMクライアントを取得（プロセス内で共有）"""
+    llm = _llms.get(model_name)
+    if llm is None:
+        with _llms_lock:
+            llm = _llms.get(model_name)
+            if llm is None:
+                # 循環インポートを避けるためここで読み込む
+                from src.chatbot import create_llm
+                # 再試行・切り替えはルーター側で行うため、クライアントの自動再試行は無効にする
+                llm = _llms[model_name] = create_llm(model_name, max_retries=0)
+    return llm
+
+def _fallback_reason(error: Exception) -> Optional[str]:
+    """次のモデルに切り替えるべきエラーなら理由を返す"""
+    groq = lazy_import("groq")
+    if isinstance(error, groq.RateLimitError):
+        return "rate_limit"
+    if isinstance(error, groq.APITimeoutError):
+        return "timeout"
+    return None
+
+class ModelRouter:
+    """質問の内容でモデルを選び、レート制限・タイムアウト時は次のモデルに切り替えるルーター
+
+    complex な質問は primary_model（画面で選択したモデル）、simple な質問は small_model で回答し、
+    失敗した場合は MODEL_FALLBACKS の順に残りのモデルを試す。リクエストに期限がある場合、
+    1回の呼び出しのタイムアウトは残り時間までに短縮され、最後のモデル以外は次のモデルが生成する時間
+    （ASK_MIN_GENERATION_SEC、残り時間が短い場合は半分）を残す。期限を過ぎると切り替えをやめる。
+    """
+
+    def __init__(
+        self,
+        primary_model: str = None,
+        small_model: str = None,
+        fallbacks: List[str] = None,
+        timeout: float = None
+    ):
+        self.primary_model = primary_model or config.MODEL_NAME
+        self.small_model = small_model or config.ROUTER_SMALL_MODEL
+        self.fallbacks = fallbacks if fallbacks is not None else config.MODEL_FALLBACKS
+        self.timeout = timeout or config.MODEL_TIMEOUT_SEC
+        self.logger = get_logger()
+
+    def route(self, question: str, route: str = None) -> Tuple[str, List[str]]:
+        """(分類, 試す順のモデル) を返す"""
+        route = route or classify_question(question)
+        first = self.small_model if route == "simple" else self.primary_model
+        models = [first]
+        for model in [self.primary_model, *self.fallbacks, self.small_model]:
+            if model and model not in models:
+                models.append(model)
+        return route, models
+
+    def _attempt_timeout(self, is_last: bool) -> float:
+        """1回の呼び出しのタイムアウト（MODEL_TIMEOUT_SEC と、期限がある場合は残り時間の一部の小さい方）
+
+        最後のモデル以外は、遅いモデルで期限を使い切らず次のモデルに切り替えられるよう
+        ASK_MIN_GENERATION_SEC を残す（残り時間が短い場合は半分を残す）。
+        """
+        remaining = remaining_time()
+        if remaining is None:
+            return self.timeout
+        if not is_last:
+            remaining = max(remaining - config.ASK_MIN_GENERATION_SEC, remaining / 2)
+        return min(self.timeout, remaining)
+
+    def _bind(self, model: str, timeout: float) -> "BaseChatModel":
+        """呼び出し1回あたりのタイムアウトを設定したクライアント"""
+        return get_llm(model).bind(timeout=timeout)
+
+    def invoke(
+        self,
+        question: str,
+        call: Callable[["BaseChatModel"], Any],
+        route: str = None
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """振り分けたモデルで call(llm) を実行し、(結果, 振り分け情報) を返す
+
+        すべてのモデルが失敗した場合は最後のエラーを送出する。
+        """
+        route, models = self.route(question, route)
+        attempts = []
+        last_error: Optional[Exception] = None
+        for index, model in enumerate(models):
+            timeout = self._attempt_timeout(is_last=index == len(models) - 1)
+            if timeout <= 0:
+                break
+            start_time = time.perf_counter()
+            try:
+                result = call(self._bind(model, timeout))
+            except Exception as e:
+                elapsed = time.perf_counter() - start_time
+                reason = _fallback_reason(e)
+                if reason is None:
+                    _model_latency.observe(elapsed, model=model, outcome="error")
+                    raise
+                _model_latency.observe(elapsed, model=model, outcome=reason)
+                _model_fallbacks.inc(model=model, reason=reason)
+                attempts.append({
+                    "model": model, "reason": reason, "latency_sec": round(elapsed, 3), "timeout_sec": round(timeout, 3)
+                })
+                self.logger.warning(f"モデル切り替え - {model}: {reason} ({elapsed:.2f}秒)")
+                last_error = e
+                continue
+
+            elapsed = time.perf_counter() - start_time
+            _model_latency.observe(elapsed, model=model, outcome="success")
+            _route_decisions.inc(route=route, model=model)
+            self.logger.info(f"モデル振り分け - 分類: {route}, モデル: {model}, 応答時間: {elapsed:.2f}秒")
+            return result, {"route": route, "model": model, "latency_sec": elapsed, "fallbacks": attempts}
+
+        raise last_error or DeadlineExceeded("LLM呼び出しの前に期限を過ぎました")
+
+    def stream(
+        self,
+        question: str,
+        start_stream: Callable[["BaseChatModel"], Iterator[Any]],
+        route: str = None
+    ) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """振り分けたモデルでストリーミングし、(チャンク, 振り分け情報) を返す
+
+        最初のチャンクを受け取る前のエラーのみ次のモデルに切り替える
+        （返し始めた後に切り替えると回答が混ざるため）。
+        """
+        route, models = self.route(question, route)
+        attempts = []
+        last_error: Optional[Exception] = None
+        for index, model in enumerate(models):
+            timeout = self._attempt_timeout(is_last=index == len(models) - 1)
+            if timeout <= 0:
+                break
+            start_time = time.perf_counter()
+            info = {"route": route, "model": model, "fallbacks": attempts}
+            started = False
+            try:
+                for chunk in start_stream(self._bind(model, timeout)):
+                    if not started:
+                        started = True
+                        _route_decisions.inc(route=route, model=model)
+                    yield chunk, info
+            except Exception as e:
+                elapsed = time.perf_counter() - start_time
+                reason = None if started else _fallback_reason(e)
+                if reason is None:
+                    _model_latency.observe(elapsed, model=model, outcome="error")
+                    raise
+                _model_latency.observe(elapsed, model=model, outcome=reason)
+                _model_fallbacks.inc(model=model, reason=reason)
+                attempts.append({
+                    "model": model, "reason": reason, "latency_sec": round(elapsed, 3), "timeout_sec": round(timeout, 3)
+                })
+                self.logger.warning(f"モデル切り替え（ストリーミング） - {model}: {reason}")
+                last_error = e
+                continue
+
+            _model_latency.observe(time.perf_counter() - start_time, model=model, outcome="success")
+            return
+
+        raise last_error or DeadlineExceeded("LLM呼び出しの前に期限を過ぎました")
@@ -0,0 +1,260 @@
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from config import config
+from src.lazy_imports import lazy_import
+from src.logger import get_logger
+from src.metrics import get_metrics_registry
+
+# (cid:123) のような、フォントの対応表がなく文字に変換できなかった箇所
+_CID_PATTERN = re.compile(r"\(cid:\d+\)")
+
+# 1行あたり2文字以下の行がこの割合以上なら、文字が1文字ずつ分離されたページとみなす
+GARBLED_SHORT_LINE_RATIO = 0.5
+# 判定に必要な最小行数（短いページは誤判定しやすいため）
+GARBLED_MIN_LINES = 8
+# 変換できなかった文字（置換文字・CID）の割合の上限
+GARBLED_BAD_CHAR_RATIO = 0.05
+
+# 1ファイル内でこの回数タイムアウトした抽出器は、以降のページで使わない
+MAX_TIMEOUTS_PER_FILE = 2
+
+_metrics = get_metrics_registry()
+_pages_extracted = _metrics.counter("pdf_pages_extracted_total", "抽出したページ数（採用した抽出器別）", ("extractor",))
+_page_fallbacks = _metrics.counter("pdf_page_fallbacks_total", "代替の抽出器を使ったページ数（理由別）", ("reason",))
+_pages_per_second = _metrics.gauge("pdf_last_pages_per_second", "直近のPDFの抽出速度（ページ/秒）")
+
+def is_garbled(text: str) -> bool:
+    """文字化け・文字の分離が起きたページかどうか"""
+    lines = [line.strip() for line in text.split("\n") if line.strip()]
+    if len(lines) >= GARBLED_MIN_LINES:
+        short_lines = sum(1 for line in lines if len(line) <= 2)
+        if short_lines / len(lines) >= GARBLED_SHORT_LINE_RATIO:
+            return True
+
+    length = len(text.strip())
+    if length == 0:
+        return False
+    bad_chars = text.count("\ufffd") + sum(len(match) for match in _CID_PATTERN.findall(text))
+    return bad_chars / length > GARBLED_BAD_CHAR_RATIO
+
+class PdfDocument:
+    """抽出器で開いたPDF（ページ単位でテキストを取り出す）"""
+
+    def page_count(self) -> int:
+        raise NotImplementedError
+
+    def extract_page(self, index: int) -> str:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class PypdfDocument(PdfDocument):
+    """pypdf による抽出（高速。文字が分離される・化けるページがある）"""
+
+    def __init__(self, path: str):
+        self.reader = lazy_import("pypdf").PdfReader(path)
+
+    def page_count(self) -> int:
+        return len(self.reader.pages)
+
+    def extract_page(self, index: int) -> str:
+        return self.reader.pages[index].extract_text() or ""
+
+class PdfplumberDocument(PdfDocument):
+    """pdfplumber による抽出（低速だが、文字の配置からテキストを組み立てるため崩れにくい）"""
+
+    def __init__(self, path: str):
+        self.pdf = lazy_import("pdfplumber").open(path)
+
+    def page_count(self) -> int:
+        return len(self.pdf.pages)
+
+    def extract_page(self, index: int) -> str:
+        page = self.pdf.pages[index]
+        try:
+            return page.extract_text() or ""
+        finally:
+            # ページごとの解析結果を破棄してメモリの増加を防ぐ
+            close = getattr(page, "close", None) or getattr(page, "flush_cache", None)
+            if close:
+                close()
+
+    def close(self):
+        self.pdf.close()
+
+# 抽出器名 -> PDFを開くクラス
+EXTRACTORS: Dict[str, Callable[[str], PdfDocument]] = {
+    "pypdf": PypdfDocument,
+    "pdfplumber": PdfplumberDocument,
+}
+
+class _ExtractionWorker:
+    """1つの抽出器でPDFを開き、ページの抽出を順に実行するデーモンスレッド
+
+    タイムアウトしたページの処理は中断できないため、呼び出し側はワーカーごと破棄し、
+    残りのページは新しいワーカー（PDFを開き直す）で処理する。
+    """
+
+    def __init__(self, extractor: str, path: str):
+        self.extractor = extractor
+        self.path = path
+        self._requests: "queue.Queue[Optional[Tuple[Callable[[PdfDocument], Any], Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"pdf-extract-{extractor}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        document = None
+        open_error = None
+        try:
+            document = EXTRACTORS[self.extractor](self.path)
+        except Exception as e:
+            open_error = e
+
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+            func, future = request
+            if open_error is not None:
+                future.set_exception(open_error)
+                continue
+            try:
+                future.set_result(func(document))
+            except Exception as e:
+                future.set_exception(e)
+
+        if document is not None:
+            try:
+                document.close()
+            except Exception:
+                pass
+
+    def call(self, func: Callable[[PdfDocument], Any], timeout: float) -> Any:
+        """ワーカーで func(document) を実行（timeout 秒を超えると FutureTimeoutError）"""
+        future: Future = Future()
+        self._requests.put((func, future))
+        return future.result(timeout=timeout)
+
+    def close(self):
+        self._requests.put(None)
+
+class PdfExtractionEngine:
+    """ページ単位で抽出器を切り替えるPDFテキスト抽出
+
+    通常は primary で抽出し、失敗・タイムアウト・空・文字化けのページのみ fallback で
+    抽出し直す。fallback の結果も使えない場合は primary の結果を採用する
+    （文字の分離は DocumentProcessor._clean_text で修復される）。
+    """
+
+    def __init__(self, primary: str = None, fallback: Optional[str] = None, page_timeout: float = None):
+        self.primary = primary or config.PDF_PRIMARY_EXTRACTOR
+        fallback = fallback if fallback is not None else config.PDF_FALLBACK_EXTRACTOR
+        self.fallback = None if fallback in ("", "none", self.primary) else fallback
+        self.page_timeout = page_timeout or config.PDF_PAGE_TIMEOUT_SEC
+        self.logger = get_logger()
+
+        for name in filter(None, (self.primary, self.fallback)):
+            if name not in EXTRACTORS:
+                raise ValueError(f"未対応のPDF抽出器です: {name} (対応: {', '.join(EXTRACTORS)})")
+
+    def extract(self, path: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """PDFの全ページを抽出
+
+        戻り値は (ページのリスト, 統計)。ページは {"index", "text", "extractor"} で、
+        どの抽出器でも取り出せなかったページはテキストが空になる。
+        """
+        start_time = time.perf_counter()
+        workers: Dict[str, Optional[_ExtractionWorker]] = {}
+        timeouts = {self.primary: 0, self.fallback: 0}
+        fallback_reasons: Dict[str, int] = {}
+        pages = []
+
+        def get_worker(name: str) -> _ExtractionWorker:
+            worker = workers.get(name)
+            if worker is None:
+                worker = workers[name] = _ExtractionWorker(name, path)
+            return worker
+
+        def run(name: str, func: Callable[[PdfDocument], Any], timeout: float) -> Tuple[str, Any]:
+            """抽出器で実行して (状態, 結果) を返す。状態は ok / timeout / error"""
+            if name is None or timeouts[name] >= MAX_TIMEOUTS_PER_FILE:
+                return "error", None
+            try:
+                return "ok", get_worker(name).call(func, timeout)
+            except FutureTimeoutError:
+                timeouts[name] += 1
+                # 処理中のスレッドは止められないため、以降のページは開き直したワーカーで処理
+                workers.pop(name).close()
+                return "timeout", None
+            except Exception as e:
+                self.logger.debug(f"PDF抽出エラー ({name}): {str(e)}")
+                return "error", None
+
+        try:
+            # ページ数（開くのに失敗した場合は fallback で開く）
+            status, page_count = run(self.primary, lambda doc: doc.page_count(), self.page_timeout)
+            if status != "ok":
+                status, page_count = run(self.fallback, lambda doc: doc.page_count(), self.page_timeout)
+                if status != "ok":
+                    raise ValueError(f"PDFを開けません: {path}")
+
+            for index in range(page_count):
+                status, text = run(self.primary, lambda doc, i=index: doc.extract_page(i), self.page_timeout)
+                extractor = self.primary
+                if status == "ok":
+                    reason = "empty" if not text.strip() else ("garbled" if is_garbled(text) else None)
+                else:
+                    reason = status
+                    text = ""
+
+                if reason and self.fallback:
+                    fallback_status, fallback_text = run(
+                        self.fallback, lambda doc, i=index: doc.extract_page(i), self.page_timeout
+                    )
+                    if fallback_status == "ok" and fallback_text.strip() and not is_garbled(fallback_text):
+                        text = fallback_text
+                        extractor = self.fallback
+                        fallback_reasons[reason] = fallback_reasons.get(reason, 0) + 1
+                        _page_fallbacks.inc(reason=reason)
+
+                if text.strip():
+                    _pages_extracted.inc(extractor=extractor)
+                pages.append({"index": index, "text": text, "extractor": extractor})
+        finally:
+            for worker in workers.values():
+                if worker is not None:
+                    worker.close()
+
+        elapsed = time.perf_counter() - start_time
+        fallback_pages = sum(fallback_reasons.values())
+        stats = {
+            "pages": len(pages),
+            "empty_pages": sum(1 for page in pages if not page["text"].strip()),
+            "fallback_pages": fallback_pages,
+            "fallback_rate": fallback_pages / len(pages) if pages else 0.0,
+            "fallback_reasons": fallback_reasons,
+            "timeouts": sum(timeouts.values()),
+            "elapsed_sec": elapsed,
+            "pages_per_sec": len(pages) / elapsed if elapsed > 0 else 0.0
+        }
+        _pages_per_second.set(stats["pages_per_sec"])
+        return pages, stats
+
+# グローバル抽出エンジン
+_engine: Optional[PdfExtractionEngine] = None
+_engine_lock = threading.Lock()
+
+def get_extraction_engine() -> PdfExtractionEngine:
+    """設定に従ったPDF抽出エンジンを取得"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PdfExtractionEngine()
+    return _engine
@@ -1,10 +1,31 @@
+import inspect
+import math
+import random
 import time
 import psutil
 import threading
+from array import array
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import wraps
-from typing import Dict, Any, Callable
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from dataclasses import dataclass, field
+from config import config
 from src.logger import get_logger
+from src.metrics import get_metrics_registry
+from src.tracing import trace_span
+
+_metrics = get_metrics_registry()
+_function_duration = _metrics.histogram(
+    "chatbot_function_duration_seconds", "measure_time で計測した関数の実行時間", ("function",)
+)
+_stage_duration = _metrics.histogram(
+    "chatbot_stage_duration_seconds", "処理段階（スパン）ごとの実行時間", ("stage",)
+)
+_process_memory = _metrics.gauge("process_resident_memory_mb", "プロセスのRSS（MB）")
+
+# 現在のスパン名（入れ子のスパン名を組み立てるため）
+_current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
 
 @dataclass
 class PerformanceMetrics:
@@ -15,54 +36,155 @@ class PerformanceMetrics:
     cpu_percent: float
     timestamp: float = field(default_factory=time.time)
 
+class MetricSeries:
+    """固定長リングバッファで直近の値を保持し、パーセンタイルを計算するクラス"""
+    
+    __slots__ = ("values", "capacity", "next_index", "size", "total_count", "total_sum", "last_value")
+    
+    def __init__(self, capacity: int = 1000):
+        self.values = array('d', [0.0]) * capacity
+        self.capacity = capacity
+        self.next_index = 0
+        self.size = 0
+        self.total_count = 0
+        self.total_sum = 0.0
+        self.last_value = 0.0
+    
+    def add(self, value: float):
+        """値を追加（容量を超えた分は古い値から上書き）"""
+        self.values[self.next_index] = value
+        self.next_index = (self.next_index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total_count += 1
+        self.total_sum += value
+        self.last_value = value
+    
+    def snapshot(self) -> List[float]:
+        """保持している値を昇順で取得"""
+        return sorted(self.values[:self.size])
+    
+    def summary(self) -> Dict[str, float]:
+        """平均・最小・最大・パーセンタイルを計算"""
+        ordered = self.snapshot()
+        if not ordered:
+            return {}
+        return {
+            "count": self.total_count,
+            "avg": sum(ordered) / len(ordered),
+            "min": ordered[0],
+            "max": ordered[-1],
+            "p50": _percentile(ordered, 50),
+            "p95": _percentile(ordered, 95),
+            "p99": _percentile(ordered, 99),
+            "last": self.last_value
+        }
+
+def _percentile(ordered: List[float], percent: float) -> float:
+    """昇順に並んだ値のパーセンタイル（最近傍順位法）"""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
 class PerformanceMonitor:
     """パフォーマンス監視クラス"""
     
-    def __init__(self):
-        self.metrics: Dict[str, list] = {}
+    def __init__(self, window_size: int = 1000):
+        self.window_size = window_size
+        # 関数名 -> 指標名（execution_time / memory_usage_mb / cpu_percent） -> 系列
+        self.metrics: Dict[str, Dict[str, MetricSeries]] = {}
+        # スパン名（例: ask.retrieval） -> 実行時間の系列
+        self.spans: Dict[str, MetricSeries] = {}
         self.logger = get_logger()
         self._lock = threading.Lock()
     
     def record_metric(self, metric: PerformanceMetrics):
         """メトリクスを記録"""
         with self._lock:
-            if metric.function_name not in self.metrics:
-                self.metrics[metric.function_name] = []
-            
-            self.metrics[metric.function_name].append(metric)
+            series = self.metrics.get(metric.function_name)
+            if series is None:
+                series = {
+                    "execution_time": MetricSeries(self.window_size),
+                    "memory_usage_mb": MetricSeries(self.window_size),
+                    "cpu_percent": MetricSeries(self.window_size)
+                }
+                self.metrics[metric.function_name] = series
             
-            # 最新100件のみ保持
-            if len(self.metrics[metric.function_name]) > 100:
-                self.metrics[metric.function_name] = self.metrics[metric.function_name][-100:]
+            series["execution_time"].add(metric.execution_time)
+            series["memory_usage_mb"].add(metric.memory_usage_mb)
+            series["cpu_percent"].add(metric.cpu_percent)
+        _function_duration.observe(metric.execution_time, function=metric.function_name)
+    
+    def record_span(self, span_name: str, duration: float):
+        """スパンの実行時間を記録"""
+        with self._lock:
+            series = self.spans.get(span_name)
+            if series is None:
+                series = MetricSeries(self.window_size)
+                self.spans[span_name] = series
+            series.add(duration)
+        _stage_duration.observe(duration, stage=span_name)
+    
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """処理区間の実行時間を計測するコンテキストマネージャ
+        
+        スパンは入れ子にでき、親スパン名を先頭に付けた名前（例: ask.retrieval）で記録される。
+        同時にトレーススパンとしても出力され、属性の追加先として yield される。
+        """
+        parent = _current_span.get()
+        full_name = f"{parent}.{name}" if parent else name
+        token = _current_span.set(full_name)
+        start_time = time.perf_counter()
+        try:
+            with trace_span(full_name, **attributes) as current_trace_span:
+                yield current_trace_span
+        finally:
+            self.record_span(full_name, time.perf_counter() - start_time)
+            _current_span.reset(token)
     
     def get_stats(self, function_name: str) -> Dict[str, Any]:
         """指定した関数の統計を取得"""
         with self._lock:
-            if function_name not in self.metrics or not self.metrics[function_name]:
+            series = self.metrics.get(function_name)
+            if not series:
                 return {}
             
-            execution_times = [m.execution_time for m in self.metrics[function_name]]
-            memory_usages = [m.memory_usage_mb for m in self.metrics[function_name]]
-            cpu_percents = [m.cpu_percent for m in self.metrics[function_name]]
-            
-            return {
-                "call_count": len(execution_times),
-                "avg_execution_time": sum(execution_times) / len(execution_times),
-                "min_execution_time": min(execution_times),
-                "max_execution_time": max(execution_times),
-                "avg_memory_usage_mb": sum(memory_usages) / len(memory_usages),
-                "avg_cpu_percent": sum(cpu_percents) / len(cpu_percents),
-                "last_execution_time": execution_times[-1],
-                "last_memory_usage_mb": memory_usages[-1]
-            }
+            execution = series["execution_time"].summary()
+            memory = series["memory_usage_mb"].summary()
+            cpu = series["cpu_percent"].summary()
+        
+        if not execution:
+            return {}
+        
+        return {
+            "call_count": execution["count"],
+            "avg_execution_time": execution["avg"],
+            "min_execution_time": execution["min"],
+            "max_execution_time": execution["max"],
+            "p50_execution_time": execution["p50"],
+            "p95_execution_time": execution["p95"],
+            "p99_execution_time": execution["p99"],
+            "avg_memory_usage_mb": memory["avg"],
+            "avg_cpu_percent": cpu["avg"],
+            "last_execution_time": execution["last"],
+            "last_memory_usage_mb": memory["last"]
+        }
     
     def get_all_stats(self) -> Dict[str, Dict[str, Any]]:
         """すべての関数の統計を取得"""
+        with self._lock:
+            function_names = list(self.metrics.keys())
         stats = {}
-        for function_name in self.metrics.keys():
+        for function_name in function_names:
             stats[function_name] = self.get_stats(function_name)
         return stats
     
+    def get_span_stats(self) -> Dict[str, Dict[str, float]]:
+        """すべてのスパンの統計を取得（スパン名順）"""
+        with self._lock:
+            return {name: self.spans[name].summary() for name in sorted(self.spans)}
+    
     def log_stats(self, function_name: str):
         """統計をログに出力"""
         stats = self.get_stats(function_name)
@@ -71,67 +193,130 @@ class PerformanceMonitor:
                 f"パフォーマンス統計 [{function_name}] - "
                 f"実行回数: {stats['call_count']}, "
                 f"平均実行時間: {stats['avg_execution_time']:.3f}秒, "
+                f"p95: {stats['p95_execution_time']:.3f}秒, "
+                f"p99: {stats['p99_execution_time']:.3f}秒, "
                 f"平均メモリ使用量: {stats['avg_memory_usage_mb']:.1f}MB"
             )
 
 # グローバルパフォーマンスモニター
 _performance_monitor = PerformanceMonitor()
 
-def measure_time(log_result: bool = True):
-    """実行時間とシステムリソース使用量を測定するデコレータ"""
+class ResourceSampler:
+    """プロセスのメモリ・CPU使用率を一定間隔でキャッシュして返すクラス
+    
+    psutil.Process() の生成や RSS の取得を呼び出しごとに行わず、
+    interval 秒以内の呼び出しには前回の値を返す。cpu_percent() は前回の読み取り
+    からの平均となるため、短い関数の呼び出し前後で読むより意味のある値になる。
+    """
+    
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._process = psutil.Process()
+        self._lock = threading.Lock()
+        self._last_read_ns = 0
+        self._memory_mb = 0.0
+        self._cpu_percent = 0.0
+    
+    def read(self) -> Tuple[float, float]:
+        """(RSS[MB], CPU使用率[%]) を取得"""
+        now_ns = time.perf_counter_ns()
+        if now_ns - self._last_read_ns < self.interval * 1_000_000_000:
+            return self._memory_mb, self._cpu_percent
+        
+        with self._lock:
+            if now_ns - self._last_read_ns >= self.interval * 1_000_000_000:
+                self._memory_mb = self._process.memory_info().rss / 1024 / 1024  # MB
+                self._cpu_percent = self._process.cpu_percent()
+                self._last_read_ns = now_ns
+            return self._memory_mb, self._cpu_percent
+
+_resource_sampler: Optional[ResourceSampler] = None
+
+def get_resource_sampler() -> ResourceSampler:
+    """共有のリソースサンプラーを取得"""
+    global _resource_sampler
+    if _resource_sampler is None:
+        _resource_sampler = ResourceSampler(interval=config.PERF_RESOURCE_INTERVAL_SEC)
+    return _resource_sampler
+
+def _collect_process_memory():
+    """スクレイプ時にRSSを更新"""
+    memory_mb, _ = get_resource_sampler().read()
+    _process_memory.set(memory_mb)
+
+_metrics.add_collector(_collect_process_memory)
+
+def _record_call(function_name: str, elapsed_ns: int, log_result: bool):
+    """サンプリングされた呼び出しのメトリクスを記録"""
+    execution_time = elapsed_ns / 1_000_000_000
+    memory_mb, cpu_percent = get_resource_sampler().read()
+    
+    _performance_monitor.record_metric(PerformanceMetrics(
+        function_name=function_name,
+        execution_time=execution_time,
+        memory_usage_mb=memory_mb,
+        cpu_percent=cpu_percent
+    ))
+    
+    # ログ出力
+    if log_result:
+        get_logger().info(
+            f"実行完了 [{function_name}] - "
+            f"実行時間: {execution_time:.3f}秒, "
+            f"メモリ使用量: {memory_mb:.1f}MB, "
+            f"CPU使用率: {cpu_percent:.1f}%"
+        )
+
+def _log_call_error(function_name: str, elapsed_ns: int, error: Exception):
+    """エラー終了した呼び出しをログに出力（サンプリング対象外・常に出力）"""
+    get_logger().error(
+        f"実行エラー [{function_name}] - "
+        f"実行時間: {elapsed_ns / 1_000_000_000:.3f}秒, "
+        f"エラー: {str(error)}"
+    )
+
+def measure_time(log_result: bool = True, sample_rate: float = None):
+    """実行時間とシステムリソース使用量を測定するデコレータ
+    
+    sample_rate（0.0〜1.0、未指定時は PERF_SAMPLE_RATE）の割合の呼び出しのみを記録・ログ出力する。
+    計時は perf_counter_ns、リソース値は ResourceSampler のキャッシュを使う。
+    同期関数・async関数のどちらにも使える。エラーはサンプリングに関係なく常にログ出力する。
+    """
     def decorator(func: Callable) -> Callable:
+        rate = config.PERF_SAMPLE_RATE if sample_rate is None else sample_rate
+        function_name = func.__name__
+        
+        def should_sample() -> bool:
+            return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+        
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                sampled = should_sample()
+                start_ns = time.perf_counter_ns()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    _log_call_error(function_name, time.perf_counter_ns() - start_ns, e)
+                    raise
+                if sampled:
+                    _record_call(function_name, time.perf_counter_ns() - start_ns, log_result)
+                return result
+            
+            return async_wrapper
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # 開始時のメトリクス取得
-            start_time = time.time()
-            process = psutil.Process()
-            start_memory = process.memory_info().rss / 1024 / 1024  # MB
-            start_cpu = process.cpu_percent()
-            
+            sampled = should_sample()
+            start_ns = time.perf_counter_ns()
             try:
-                # 関数実行
                 result = func(*args, **kwargs)
-                
-                # 終了時のメトリクス取得
-                end_time = time.time()
-                execution_time = end_time - start_time
-                end_memory = process.memory_info().rss / 1024 / 1024  # MB
-                end_cpu = process.cpu_percent()
-                
-                # メトリクス記録
-                metric = PerformanceMetrics(
-                    function_name=func.__name__,
-                    execution_time=execution_time,
-                    memory_usage_mb=end_memory,
-                    cpu_percent=end_cpu
-                )
-                _performance_monitor.record_metric(metric)
-                
-                # ログ出力
-                if log_result:
-                    logger = get_logger()
-                    logger.info(
-                        f"実行完了 [{func.__name__}] - "
-                        f"実行時間: {execution_time:.3f}秒, "
-                        f"メモリ使用量: {end_memory:.1f}MB, "
-                        f"CPU使用率: {end_cpu:.1f}%"
-                    )
-                
-                return result
-                
             except Exception as e:
-                # エラー時のメトリクス取得
-                end_time = time.time()
-                execution_time = end_time - start_time
-                end_memory = process.memory_info().rss / 1024 / 1024  # MB
-                
-                logger = get_logger()
-                logger.error(
-                    f"実行エラー [{func.__name__}] - "
-                    f"実行時間: {execution_time:.3f}秒, "
-                    f"エラー: {str(e)}"
-                )
+                _log_call_error(function_name, time.perf_counter_ns() - start_ns, e)
                 raise
+            if sampled:
+                _record_call(function_name, time.perf_counter_ns() - start_ns, log_result)
+            return result
         
         return wrapper
     return decorator
@@ -161,6 +346,10 @@ def get_performance_monitor() -> PerformanceMonitor:
     """パフォーマンスモニターのインスタンスを取得"""
     return _performance_monitor
 
+def span(name: str, **attributes):
+    """グローバルモニターでスパンを計測（with span("retrieval", k=5) as s: ...）"""
+    return _performance_monitor.span(name, **attributes)
+
 def log_system_status():
     """システム状態をログに出力"""
     logger = get_logger()
@@ -0,0 +1,130 @@
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 製品を絞り込まずに全体を検索する指定（UI・APIで「すべて」を選んだ場合。質問からの推定も行わない）
+ALL_PRODUCTS = "all"
+# 製品を判定できなかったマニュアル
+UNKNOWN_PRODUCT = "unknown"
+
+# (製品キー, ベンダー, 表示名, パターン)
+# ファイル名・本文・質問に同じパターンを使う。より具体的な製品を先に並べる（同点の場合は先の製品を採用）
+PRODUCT_RULES: Tuple[Tuple[str, str, str, Tuple[str, ...]], ...] = (
+    ("ios-xe", "cisco", "Cisco IOS XE (Catalyst / ISR)", (r"ios[\s-]?xe", r"catalyst", r"\bc9[2-6]00", r"\bisr\s?4\d{3}")),
+    ("ios-xr", "cisco", "Cisco IOS XR (ASR 9000 / NCS)", (r"ios[\s-]?xr", r"\basr\s?9\d{3}", r"\bncs\s?\d{3,4}")),
+    ("nx-os", "cisco", "Cisco NX-OS (Nexus)", (r"nx[\s-]?os", r"nexus")),
+    ("asa", "cisco", "Cisco ASA", (r"\basa\b", r"adaptive security appliance", r"\basdm\b")),
+    ("ios", "cisco", "Cisco IOS", (r"\bios\b(?![\s-]?x[er])",)),
+    ("junos", "juniper", "Juniper Junos", (r"junos", r"juniper")),
+    ("eos", "arista", "Arista EOS", (r"arista", r"\beos[\s-]?\d")),
+    ("fortios", "fortinet", "Fortinet FortiOS (FortiGate)", (r"forti\s?os", r"forti\s?gate")),
+    ("pan-os", "paloalto", "Palo Alto Networks PAN-OS", (r"pan[\s-]?os", r"palo\s?alto")),
+    ("rtx", "yamaha", "YAMAHA RTX", (r"yamaha", r"ヤマハ", r"\brtx\s?\d{3,4}")),
+    ("univerge-ix", "nec", "NEC UNIVERGE IX", (r"univerge", r"\bix\s?[1-3]\d{3}\b")),
+    ("alliedware", "allied-telesis", "Allied Telesis AlliedWare Plus", (r"allied\s?(telesis|ware)", r"アライドテレシス")),
+)
+
+PRODUCT_KEYS = tuple(rule[0] for rule in PRODUCT_RULES)
+_VENDORS = {rule[0]: rule[1] for rule in PRODUCT_RULES}
+_LABELS = {rule[0]: rule[2] for rule in PRODUCT_RULES}
+
+# re.ASCII: 「ASAの設定」のように日本語が続いても \b で区切れるようにする
+_PATTERNS = {
+    product: [re.compile(pattern, re.IGNORECASE | re.ASCII) for pattern in patterns]
+    for product, _, _, patterns in PRODUCT_RULES
+}
+
+# 15.2(4)M3 / 9.3(8) / 17.3.4a / 21.2R3-S2 / 10.4.1 などのOSバージョン
+_VERSION = r"\d{1,2}\.\d{1,2}(?:\.\d{1,3})*(?:\(\w+\))?(?:[a-z]{1,2}\d*(?:-s\d+)?)?"
+_FILE_VERSION_PATTERN = re.compile(rf"(?<!\d)({_VERSION})(?![\d.])", re.IGNORECASE | re.ASCII)
+_TEXT_VERSION_PATTERN = re.compile(
+    rf"(?:release|version|ver\.?|rel\.?|rev\.?|バージョン|リリース)\s*[:：]?\s*({_VERSION})", re.IGNORECASE | re.ASCII
+)
+
+# ファイル名に製品名がある場合の重み（本文の一致数より優先する）
+FILE_NAME_WEIGHT = 100
+# 本文のみで判定する場合に必要な一致数（1回だけの言及で誤判定しないため）
+MIN_TEXT_MATCHES = 2
+
+def _normalize(text: str) -> str:
+    # ファイル名の区切り（nxos_9.3_config_guide）を単語の区切りとして扱う
+    return text.replace("_", " ")
+
+def _match_counts(text: str, limit: int = None) -> Dict[str, int]:
+    """製品ごとのパターンの一致数（limit 件で打ち切り）"""
+    counts = {}
+    text = _normalize(text)
+    for product, patterns in _PATTERNS.items():
+        count = 0
+        for pattern in patterns:
+            for _ in pattern.finditer(text):
+                count += 1
+                if limit is not None and count >= limit:
+                    break
+            if limit is not None and count >= limit:
+                break
+        if count:
+            counts[product] = count
+    return counts
+
+def _best(scores: Dict[str, int]) -> Optional[str]:
+    if not scores:
+        return None
+    best_score = max(scores.values())
+    # 同点の場合は PRODUCT_RULES で先に並ぶ（より具体的な）製品
+    return next(product for product in PRODUCT_KEYS if scores.get(product) == best_score)
+
+def _detect_version(file_name: str, texts: List[str]) -> str:
+    match = _FILE_VERSION_PATTERN.search(_normalize(Path(file_name).stem))
+    if match:
+        return match.group(1)
+    versions = Counter(
+        match.group(1) for text in texts for match in _TEXT_VERSION_PATTERN.finditer(text)
+    )
+    return versions.most_common(1)[0][0] if versions else ""
+
+def detect_product(file_name: str, texts: List[str]) -> Dict[str, str]:
+    """ファイル名と先頭ページの本文からベンダー・製品・OSバージョンを判定
+
+    戻り値はチャンクのメタデータにそのまま追加する（判定できない項目は unknown / 空文字）。
+    """
+    scores = {product: FILE_NAME_WEIGHT for product in _match_counts(Path(file_name).stem)}
+    text_counts = _match_counts("\n".join(texts), limit=FILE_NAME_WEIGHT)
+    for product, count in text_counts.items():
+        scores[product] = scores.get(product, 0) + count
+    scores = {
+        product: score for product, score in scores.items()
+        if score >= FILE_NAME_WEIGHT or score >= MIN_TEXT_MATCHES
+    }
+
+    product = _best(scores)
+    if product is None:
+        return {"vendor": UNKNOWN_PRODUCT, "product": UNKNOWN_PRODUCT, "os_version": ""}
+    return {"vendor": _VENDORS[product], "product": product, "os_version": _detect_version(file_name, texts)}
+
+def infer_product(question: str, available: Iterable[str] = None) -> Optional[str]:
+    """質問に製品名が1つだけ含まれる場合はその製品（available にない製品・複数の製品の場合はNone）
+
+    「IOS XEとNX-OSの違い」のような比較の質問では絞り込まない。
+    """
+    matched = set(_match_counts(question, limit=1))
+    # 「CatalystのIOSで」のように総称として IOS と書かれることがあるため、Ciscoの他の製品がある場合は ios を除く
+    if "ios" in matched and any(_VENDORS[product] == "cisco" for product in matched - {"ios"}):
+        matched.discard("ios")
+    if len(matched) != 1:
+        return None
+    product = matched.pop()
+    if available is not None and product not in set(available):
+        return None
+    return product
+
+def product_label(product: str) -> str:
+    """UI・ログに表示する製品名"""
+    if product == UNKNOWN_PRODUCT:
+        return "その他（製品を判定できなかったマニュアル）"
+    return _LABELS.get(product, product)
+
+def product_collection_name(product: str) -> str:
+    """製品ごとのChromaコレクション名"""
+    return f"product-{product}"
@@ -0,0 +1,244 @@
+import cProfile
+import json
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from config import config
+from src.logger import get_logger
+from src.tracing import get_request_id
+
+# 関数の識別子（ファイル名, 行番号, 関数名）
+FrameKey = Tuple[str, int, str]
+
+TOP_FUNCTIONS = 30
+
+class StackSampler:
+    """対象スレッドのスタックを一定間隔で記録する軽量プロファイラー
+
+    cProfile と異なり全関数呼び出しをフックしないため、遅いリクエストを
+    検出するために常時動かしても負荷が小さい。
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.sample_count = 0
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.sample_count += 1
+            seen = set()
+            leaf = True
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if leaf:
+                    self.self_counts[key] += 1
+                    leaf = False
+                if key not in seen:
+                    self.total_counts[key] += 1
+                    seen.add(key)
+                frame = frame.f_back
+
+    def summary(self, limit: int = TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+        """自己時間の多い順に関数を集計"""
+        if not self.sample_count:
+            return []
+        rows = []
+        for key, self_samples in self.self_counts.most_common(limit):
+            filename, lineno, function = key
+            rows.append({
+                "function": function,
+                "file": filename,
+                "line": lineno,
+                "self_pct": self_samples / self.sample_count * 100,
+                "total_pct": self.total_counts[key] / self.sample_count * 100,
+                "samples": self_samples
+            })
+        return rows
+
+def _cprofile_summary(profiler: cProfile.Profile, limit: int = TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+    """cProfileの結果を自己時間の多い順に集計"""
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, lineno, function), (_, total_calls, self_time, cumulative_time, _) in stats.stats.items():
+        rows.append({
+            "function": function,
+            "file": filename,
+            "line": lineno,
+            "calls": total_calls,
+            "self_sec": self_time,
+            "cumulative_sec": cumulative_time
+        })
+    rows.sort(key=lambda row: row["self_sec"], reverse=True)
+    return rows[:limit]
+
+class CaptureScheduler:
+    """詳細プロファイル（cProfile）を取得する呼び出しを決めるクラス
+
+    基本は sample_rate の確率で取得するが、1時間あたりの取得数が上限に
+    近づくほど確率を下げ、上限に達したらその時間帯は取得しない。
+    """
+
+    def __init__(self, sample_rate: float, max_per_hour: int):
+        self.sample_rate = sample_rate
+        self.max_per_hour = max_per_hour
+        self._capture_times: List[float] = []
+        self._lock = threading.Lock()
+
+    def should_capture(self) -> bool:
+        if self.sample_rate <= 0 or self.max_per_hour <= 0:
+            return False
+        now = time.time()
+        with self._lock:
+            self._capture_times = [t for t in self._capture_times if now - t < 3600]
+            remaining = self.max_per_hour - len(self._capture_times)
+            if remaining <= 0:
+                return False
+            rate = self.sample_rate * remaining / self.max_per_hour
+            if random.random() >= rate:
+                return False
+            self._capture_times.append(now)
+            return True
+
+class ProfileStore:
+    """プロファイル結果を LOG_DIR/profiles に保存し、件数を上限内に保つクラス"""
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self.logger = get_logger()
+
+    def save(self, name: str, request_id: str, duration: float, mode: str,
+             functions: List[Dict[str, Any]], profiler: cProfile.Profile = None) -> Path:
+        """プロファイルを保存"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stem = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{name}_{request_id}"
+        summary_path = self.directory / f"{stem}.json"
+
+        record = {
+            "name": name,
+            "request_id": request_id,
+            "duration_sec": duration,
+            "mode": mode,
+            "captured_at": datetime.now().isoformat(timespec="seconds"),
+            "functions": functions
+        }
+        if profiler is not None:
+            # snakeviz などで開ける形式でも保存
+            profile_path = self.directory / f"{stem}.prof"
+            profiler.dump_stats(str(profile_path))
+            record["profile_file"] = profile_path.name
+
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+
+        self._rotate()
+        self.logger.info(f"プロファイル保存 [{name}] - リクエストID: {request_id}, 実行時間: {duration:.2f}秒")
+        return summary_path
+
+    def _rotate(self):
+        """古いプロファイルを削除"""
+        summaries = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for summary_path in summaries[:max(0, len(summaries) - self.max_files)]:
+            summary_path.unlink()
+            profile_path = summary_path.with_suffix(".prof")
+            if profile_path.exists():
+                profile_path.unlink()
+
+    def list_profiles(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """新しい順にプロファイルの概要を取得"""
+        if not self.directory.exists():
+            return []
+        summaries = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        profiles = []
+        for summary_path in summaries[:limit]:
+            try:
+                with open(summary_path, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                continue
+            record["path"] = str(summary_path)
+            profiles.append(record)
+        return profiles
+
+_scheduler = CaptureScheduler(config.PROFILE_SAMPLE_RATE, config.PROFILE_MAX_PER_HOUR)
+_store = ProfileStore(str(Path(config.LOG_DIR) / "profiles"), config.PROFILE_MAX_FILES)
+
+def get_profile_store() -> ProfileStore:
+    """プロファイル保存先を取得"""
+    return _store
+
+def profiled(name: str, threshold_sec: float = None):
+    """遅い呼び出しのプロファイルを自動で保存するデコレータ（PROFILE_ENABLED 時のみ有効）
+
+    通常は軽量なスタックサンプラーで記録し、実行時間が threshold_sec を超えた場合のみ保存する。
+    スケジューラーに選ばれた呼び出しは cProfile で詳細に記録し、実行時間に関係なく保存する。
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not config.PROFILE_ENABLED:
+                return func(*args, **kwargs)
+
+            threshold = config.PROFILE_THRESHOLD_SEC if threshold_sec is None else threshold_sec
+            # トレースと突き合わせられるよう、リクエストID があればそれを使う
+            request_id = get_request_id() or uuid.uuid4().hex[:12]
+            capture_full = _scheduler.should_capture()
+
+            profiler: Optional[cProfile.Profile] = None
+            sampler: Optional[StackSampler] = None
+            if capture_full:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Python 3.12 以降は別のスレッドで cProfile が有効な間は有効にできないため、サンプラーで記録する
+                    profiler = None
+            if profiler is None:
+                sampler = StackSampler(threading.get_ident(), config.PROFILE_INTERVAL_MS / 1000)
+                sampler.start()
+
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start_time
+                if profiler is not None:
+                    profiler.disable()
+                if sampler is not None:
+                    sampler.stop()
+
+                try:
+                    if profiler is not None:
+                        _store.save(name, request_id, duration, "cprofile", _cprofile_summary(profiler), profiler)
+                    elif duration >= threshold:
+                        _store.save(name, request_id, duration, "sampling", sampler.summary())
+                except Exception as e:
+                    get_logger().error(f"プロファイル保存エラー: {str(e)}")
+
+        return wrapper
+    return decorator
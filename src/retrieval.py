@@ -0,0 +1,45 @@
+from typing import Dict, List, TYPE_CHECKING
+
+from config import config
+from src.document_processor import DocumentProcessor
+from src.products import ALL_PRODUCTS
+from src.sharded_retrieval import ShardedRetriever, get_shard_pool
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+class ProductScopedRetriever:
+    """製品を指定して検索できるChromaの検索器
+
+    製品ごとのコレクション（PRODUCT_COLLECTIONS）があればそのコレクションだけを検索するため、
+    比較するチャンク数は対象製品の分だけになる。ない場合は全体のコレクションをメタデータで絞り込む。
+    """
+
+    def __init__(self, processor: DocumentProcessor, k: int = None):
+        self.processor = processor
+        self.k = k or config.SEARCH_K
+        self.vectorstore = processor.load_vectorstore()
+        # 製品の一覧はバージョンごとに固定（新しいバージョンでは検索器ごと作り直される）
+        self._products: Dict[str, int] = (processor.read_manifest() or {}).get("products", {})
+
+    def products(self) -> Dict[str, int]:
+        """製品ごとのチャンク数"""
+        return self._products
+
+    def invoke(self, query: str, *args, product: str = None, **kwargs) -> List["Document"]:
+        """質問に近いチャンクを上位k件返す（product を指定するとその製品のチャンクのみ）"""
+        if not product or product == ALL_PRODUCTS:
+            return self.vectorstore.similarity_search(query, k=self.k)
+        if config.PRODUCT_COLLECTIONS and product in self._products:
+            return self.processor.load_product_vectorstore(product).similarity_search(query, k=self.k)
+        return self.vectorstore.similarity_search(query, k=self.k, filter={"product": product})
+
+    get_relevant_documents = invoke
+
+def create_retriever(processor: DocumentProcessor = None):
+    """現在のインデックスの検索器を作成（RETRIEVAL_SHARDS > 0 ならシャード検索）"""
+    processor = processor or DocumentProcessor()
+    if config.RETRIEVAL_SHARDS > 0:
+        pool = get_shard_pool(processor.persist_directory)
+        return ShardedRetriever(pool, processor.embeddings, config.SEARCH_K)
+    return ProductScopedRetriever(processor, config.SEARCH_K)
@@ -0,0 +1,223 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from config import config
+from src.logger import get_logger
+from src.metrics import get_metrics_registry
+from src.performance import get_resource_sampler
+
+_metrics = get_metrics_registry()
+_sessions_active = _metrics.gauge("app_sessions_active", "チャットボットを保持している画面のセッション数")
+_session_evictions = _metrics.counter(
+    "app_session_evictions_total", "破棄したセッションのチャットボット（idle: 無操作 / limit: 上限超過）", ("reason",)
+)
+_session_rebuilds = _metrics.counter("app_session_rebuilds_total", "破棄後に作り直したセッションのチャットボット")
+_rss_per_session = _metrics.gauge("app_session_rss_per_session_mb", "アクティブなセッションあたりのプロセスRSS（MB）")
+_session_data = _metrics.gauge("app_session_data_mb", "全セッションの会話履歴の推定サイズ（MB）")
+
+# 破棄したセッションIDを覚えておく件数（作り直しの回数の集計用）
+EVICTED_ID_HISTORY = 10000
+
+def estimate_size(obj: Any) -> int:
+    """会話履歴などの dict / list / str からなるオブジェクトの推定サイズ（バイト）"""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set)):
+            stack.extend(item)
+    return total
+
+class _Entry:
+    """1つのセッションの重いオブジェクト（チャットボット）と、サイズの見積もりに使う表示用の履歴"""
+
+    def __init__(self, value: Any, history: Optional[list]):
+        self.value = value
+        self.history = history
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+class SessionRegistry:
+    """画面のセッションごとのチャットボットをサーバー側で保持し、使われなくなったものを破棄する
+
+    Streamlit はブラウザを閉じたセッションの状態をすぐには解放しないため、チャットボット（LLMクライアント・
+    会話メモリ）は session_state ではなくここに置く。idle_ttl 秒使われなかったセッションと、
+    max_sessions を超えた古いセッションのチャットボットは破棄し、次に使われたときに factory で作り直す。
+    """
+
+    def __init__(self, idle_ttl: float = None, max_sessions: int = None):
+        self.idle_ttl = idle_ttl or config.SESSION_IDLE_TTL_SEC
+        self.max_sessions = max_sessions or config.SESSION_MAX_ACTIVE
+        self.logger = get_logger()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._evicted_ids: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted_total = 0
+        self.rebuilt_total = 0
+        self._stop_event = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def start(self):
+        """無操作のセッションを定期的に破棄するスレッドを開始"""
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._run_sweeper, name="session-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run_sweeper(self):
+        interval = min(60.0, max(1.0, self.idle_ttl / 4))
+        while not self._stop_event.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                self.logger.error(f"セッションの破棄エラー: {str(e)}")
+
+    def _evict(self, session_id: str, reason: str):
+        """ロックを取得した状態で呼ぶ"""
+        self._entries.pop(session_id, None)
+        self._evicted_ids[session_id] = None
+        while len(self._evicted_ids) > EVICTED_ID_HISTORY:
+            self._evicted_ids.popitem(last=False)
+        self.evicted_total += 1
+        _session_evictions.inc(reason=reason)
+
+    def get(self, session_id: str, factory: Callable[[], Any], history: Optional[list] = None) -> Any:
+        """セッションのオブジェクトを取得（なければ factory で作成）
+
+        history は画面のセッションが持つ表示用の履歴で、サイズの見積もりにのみ使う。
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry.last_used = time.time()
+                if history is not None:
+                    entry.history = history
+                self._entries.move_to_end(session_id)
+                return entry.value
+
+        # 作成（チャットボットの初期化）には時間がかかるため、ロックの外で行う
+        value = factory()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                return entry.value
+            self._entries[session_id] = _Entry(value, history)
+            if session_id in self._evicted_ids:
+                del self._evicted_ids[session_id]
+                self.rebuilt_total += 1
+                _session_rebuilds.inc()
+                self.logger.info(f"破棄したセッションを作り直しました: {session_id}")
+            while len(self._entries) > self.max_sessions:
+                evicted_id = next(iter(self._entries))
+                self._evict(evicted_id, "limit")
+                self.logger.info(f"セッション上限のためチャットボットを破棄: {evicted_id}")
+            _sessions_active.set(len(self._entries))
+        return value
+
+    def peek(self, session_id: str) -> Any:
+        """セッションのオブジェクトを取得（なければNone。作成・最終使用時刻の更新は行わない）"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return entry.value if entry is not None else None
+
+    def discard(self, session_id: str) -> bool:
+        """セッションのオブジェクトを破棄（作り直しとしては数えない）"""
+        with self._lock:
+            removed = self._entries.pop(session_id, None) is not None
+            _sessions_active.set(len(self._entries))
+        return removed
+
+    def sweep(self) -> int:
+        """idle_ttl 秒使われていないセッションを破棄し、破棄した件数を返す"""
+        expires_before = time.time() - self.idle_ttl
+        with self._lock:
+            # 最終使用時刻の古い順に並んでいる
+            idle_ids = []
+            for session_id, entry in self._entries.items():
+                if entry.last_used >= expires_before:
+                    break
+                idle_ids.append(session_id)
+            for session_id in idle_ids:
+                self._evict(session_id, "idle")
+            remaining = len(self._entries)
+            _sessions_active.set(remaining)
+        if idle_ids:
+            self.logger.info(f"無操作のセッションのチャットボットを破棄: {len(idle_ids)}件（残り {remaining}件）")
+        return len(idle_ids)
+
+    def _session_bytes(self, entry: _Entry) -> int:
+        """セッション固有のデータ（表示用の履歴と会話メモリ）の推定サイズ"""
+        size = estimate_size(entry.history) if entry.history is not None else 0
+        if hasattr(entry.value, "get_chat_history"):
+            size += estimate_size(entry.value.get_chat_history())
+        return size
+
+    def get_stats(self, limit: int = 20) -> Dict[str, Any]:
+        """アクティブなセッション数とセッションあたりのメモリ（sessions は最近使われた順に limit 件）"""
+        now = time.time()
+        with self._lock:
+            entries = list(self._entries.items())
+        sessions: List[Dict[str, Any]] = []
+        data_bytes = 0
+        for session_id, entry in reversed(entries):
+            size = self._session_bytes(entry)
+            data_bytes += size
+            if len(sessions) < limit:
+                sessions.append({
+                    "session_id": session_id,
+                    "idle_sec": now - entry.last_used,
+                    "age_sec": now - entry.created_at,
+                    "history_messages": len(entry.history) if entry.history is not None else 0,
+                    "data_kb": size / 1024
+                })
+        rss_mb, _ = get_resource_sampler().read()
+        active = len(entries)
+        return {
+            "active": active,
+            "max_sessions": self.max_sessions,
+            "idle_ttl_sec": self.idle_ttl,
+            "evicted_total": self.evicted_total,
+            "rebuilt_total": self.rebuilt_total,
+            "rss_mb": rss_mb,
+            "rss_per_session_mb": rss_mb / active if active else 0.0,
+            "data_mb": data_bytes / 1024 / 1024,
+            "data_per_session_kb": data_bytes / 1024 / active if active else 0.0,
+            "sessions": sessions
+        }
+
+_registry: Optional[SessionRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_session_registry() -> SessionRegistry:
+    """プロセスで共有するセッションのレジストリを取得（初回に破棄スレッドを開始）"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = SessionRegistry()
+                _registry.start()
+    return _registry
+
+def _collect_session_stats():
+    """スクレイプ時にセッションあたりのメモリを更新"""
+    if _registry is None:
+        return
+    stats = _registry.get_stats(limit=0)
+    _rss_per_session.set(stats["rss_per_session_mb"])
+    _session_data.set(stats["data_mb"])
+
+_metrics.add_collector(_collect_session_stats)
@@ -0,0 +1,439 @@
+import atexit
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Dict, Any, List, Tuple, TYPE_CHECKING
+
+from config import config
+from src.deadline import DeadlineExceeded, remaining_time
+from src.document_processor import read_manifest
+from src.lazy_imports import lazy_import
+from src.logger import get_logger
+from src.metrics import get_metrics_registry
+from src.performance import span
+from src.products import UNKNOWN_PRODUCT
+from src.snapshot import VectorSnapshot, SnapshotError, export_snapshot
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import Embeddings
+
+# バージョンディレクトリ内に書き出すシャード用スナップショット（複製対象外: index_versions.py）
+SHARD_SNAPSHOT_FILENAME = "shards.vsnap"
+
+PARTITION_STRATEGIES = ("file", "product", "hash")
+
+# ワーカーの起動完了を知らせるメッセージのリクエストID
+_READY = -1
+
+_metrics = get_metrics_registry()
+_shard_duration = _metrics.histogram(
+    "retrieval_shard_seconds", "シャードごとの検索時間（秒、ワーカー内の計算時間）", ("shard",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+_shard_chunks = _metrics.gauge("retrieval_shard_chunks", "シャードごとのチャンク数", ("shard",))
+_shard_failures = _metrics.counter(
+    "retrieval_shard_failures_total", "応答しなかった・エラーになったシャード検索の回数", ("shard", "reason")
+)
+
+def _product(metadata: dict) -> str:
+    return (metadata or {}).get("product") or UNKNOWN_PRODUCT
+
+def _shard_key(metadata: dict, strategy: str) -> str:
+    """まとめて同じシャードに置く単位のキー（製品、またはファイル名・読み込み元）"""
+    metadata = metadata or {}
+    if strategy == "product":
+        return _product(metadata)
+    return str(metadata.get("file_name") or metadata.get("source") or "")
+
+def partition_rows(ids: List[str], metadatas: List[dict], shards: int, strategy: str = "file") -> List[List[int]]:
+    """スナップショットの行番号をシャードに振り分ける
+
+    file: 同じマニュアルのチャンクを同じシャードに置き、チャンク数の多いマニュアルから
+          最も空いているシャードへ順に割り当てる（マニュアル数がシャード数より少ないと偏る）
+    product: file と同じ割り当てを製品単位で行う（製品を指定した検索は少数のシャードだけに送られる）
+    hash: チャンクIDのハッシュで均等に分ける
+    """
+    if strategy not in PARTITION_STRATEGIES:
+        raise ValueError(f"未対応の分割方法です: {strategy}")
+    partitions: List[List[int]] = [[] for _ in range(shards)]
+
+    if strategy == "hash":
+        for row, chunk_id in enumerate(ids):
+            digest = hashlib.md5(chunk_id.encode("utf-8")).digest()
+            partitions[int.from_bytes(digest[:8], "little") % shards].append(row)
+        return partitions
+
+    groups: Dict[str, List[int]] = {}
+    for row, metadata in enumerate(metadatas):
+        groups.setdefault(_shard_key(metadata, strategy), []).append(row)
+    loads = [(0, shard) for shard in range(shards)]
+    for _, rows in sorted(groups.items(), key=lambda item: (-len(item[1]), item[0])):
+        load, shard = heapq.heappop(loads)
+        partitions[shard].extend(rows)
+        heapq.heappush(loads, (load + len(rows), shard))
+    for rows in partitions:
+        rows.sort()
+    return partitions
+
+def _order_by_product(rows: List[int], products: List[str]) -> Tuple[List[int], Dict[str, Tuple[int, int]]]:
+    """行を製品ごとに並べ替え、製品 -> (開始, 終了) の範囲を返す（製品を指定した検索はその範囲だけを比較する）"""
+    ordered = sorted(rows, key=lambda row: (products[row], row))
+    slices: Dict[str, Tuple[int, int]] = {}
+    for position, row in enumerate(ordered):
+        start, _ = slices.get(products[row], (position, position))
+        slices[products[row]] = (start, position + 1)
+    return ordered, slices
+
+def _shard_worker(
+    snapshot_path: str,
+    rows: List[int],
+    slices: Dict[str, Tuple[int, int]],
+    shard: int,
+    requests,
+    responses
+):
+    """シャードのワーカープロセス（担当する行のベクトルだけを保持して総当たりで検索）"""
+    # 複数のワーカーがそれぞれ全コアを使うと奪い合いになるため、行列演算は1スレッドにする
+    for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(name, "1")
+    try:
+        np = lazy_import("numpy")
+        snapshot = VectorSnapshot(snapshot_path, verify=False)
+        row_numbers = np.asarray(rows, dtype=np.int64)
+        vectors = np.ascontiguousarray(snapshot.vectors[row_numbers], dtype=np.float32)
+        norms = np.einsum("ij,ij->i", vectors, vectors)
+        del snapshot
+    except Exception as e:
+        responses.put((_READY, shard, None, f"{type(e).__name__}: {e}", 0.0))
+        return
+    responses.put((_READY, shard, len(row_numbers), None, 0.0))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, query, k, product = request
+        start = time.perf_counter()
+        try:
+            query = np.asarray(query, dtype=np.float32)
+            # 製品の指定があれば、その製品の行（連続した範囲）だけを比較する
+            begin, end = slices.get(product, (0, 0)) if product else (0, len(row_numbers))
+            # Chromaの既定（l2）と同じ二乗ユークリッド距離
+            distances = norms[begin:end] - 2.0 * (vectors[begin:end] @ query) + float(query @ query)
+            top_k = min(k, len(distances))
+            if top_k < len(distances):
+                top = np.argpartition(distances, top_k - 1)[:top_k]
+            else:
+                top = np.arange(len(distances))
+            top = top[np.argsort(distances[top], kind="stable")]
+            result = (distances[top].tolist(), row_numbers[begin:end][top].tolist())
+            responses.put((request_id, shard, result, None, time.perf_counter() - start))
+        except Exception as e:
+            responses.put((request_id, shard, None, f"{type(e).__name__}: {e}", time.perf_counter() - start))
+
+class ShardPool:
+    """スナップショットをN個のワーカープロセスに分割して保持し、検索を全シャードに並列に投げる
+
+    各シャードが返した上位k件を距離順にまとめて全体の上位k件にする。
+    ワーカーはスナップショットを memmap で開き、担当分のベクトルだけをコピーして保持する。
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        shards: int,
+        partition: str = "file",
+        start_timeout: float = 120.0
+    ):
+        self.logger = get_logger()
+        self.snapshot_path = str(snapshot_path)
+        self.shards = shards
+        self.partition = partition
+        self.snapshot = VectorSnapshot(snapshot_path, verify=False)
+        ids, _, metadatas = self.snapshot.records()
+        products = [_product(metadata) for metadata in metadatas]
+        self.product_counts: Dict[str, int] = dict(sorted(Counter(products).items()))
+        self.partitions = []
+        self.shard_slices: List[Dict[str, Tuple[int, int]]] = []
+        for rows in partition_rows(ids, metadatas, shards, partition):
+            ordered, slices = _order_by_product(rows, products)
+            self.partitions.append(ordered)
+            self.shard_slices.append(slices)
+
+        self._ids = itertools.count()
+        self._pending: Dict[Tuple[int, int], Future] = {}
+        self._ready: Dict[int, Future] = {shard: Future() for shard in range(shards)}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {shard: {"requests": 0, "total_sec": 0.0, "max_sec": 0.0, "failures": 0} for shard in range(shards)}
+
+        # Streamlit・APIサーバーのスレッドを複製しないよう spawn で起動する
+        context = lazy_import("multiprocessing").get_context("spawn")
+        self._responses = context.Queue()
+        self._requests = [context.Queue() for _ in range(shards)]
+        self._processes = [
+            context.Process(
+                target=_shard_worker,
+                args=(self.snapshot_path, rows, self.shard_slices[shard], shard, self._requests[shard], self._responses),
+                name=f"retrieval-shard-{shard}",
+                daemon=True
+            )
+            for shard, rows in enumerate(self.partitions)
+        ]
+        start_time = time.time()
+        for process in self._processes:
+            process.start()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="retrieval-shard-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+        try:
+            expires_at = time.time() + start_timeout
+            for shard, future in self._ready.items():
+                _shard_chunks.set(self._wait_ready(shard, future, expires_at), shard=str(shard))
+        except Exception:
+            self.close()
+            raise
+        self.logger.info(
+            f"シャード検索の準備完了 - シャード数: {shards}, 分割: {partition}, "
+            f"チャンク数: {[len(rows) for rows in self.partitions]}, 起動時間: {time.time() - start_time:.2f}秒"
+        )
+
+    def _wait_ready(self, shard: int, future: Future, expires_at: float) -> int:
+        """ワーカーの起動完了を待ってチャンク数を返す（起動中に終了した場合はすぐにエラー）"""
+        while True:
+            try:
+                return future.result(timeout=0.5)
+            except FutureTimeoutError:
+                process = self._processes[shard]
+                if not process.is_alive():
+                    raise RuntimeError(f"シャード{shard}のワーカーが起動中に終了しました（終了コード: {process.exitcode}）")
+                if time.time() >= expires_at:
+                    raise TimeoutError(f"シャード{shard}のワーカーが起動しませんでした")
+
+    def _dispatch(self):
+        """ワーカーからの応答を待っている検索に渡す"""
+        while True:
+            message = self._responses.get()
+            if message is None:
+                break
+            request_id, shard, result, error, elapsed = message
+            if request_id == _READY:
+                future = self._ready[shard]
+            else:
+                with self._lock:
+                    future = self._pending.pop((request_id, shard), None)
+                if future is None:
+                    # 期限切れで打ち切った検索への応答
+                    continue
+                self._record(shard, elapsed, failed=error is not None)
+            if error is not None:
+                future.set_exception(RuntimeError(f"シャード{shard}: {error}"))
+            else:
+                future.set_result((result, elapsed) if request_id != _READY else result)
+
+    def _record(self, shard: int, elapsed: float, failed: bool = False):
+        with self._lock:
+            stats = self.stats[shard]
+            if failed:
+                stats["failures"] += 1
+                return
+            stats["requests"] += 1
+            stats["total_sec"] += elapsed
+            stats["max_sec"] = max(stats["max_sec"], elapsed)
+        _shard_duration.observe(elapsed, shard=str(shard))
+
+    def search(
+        self,
+        vector: List[float],
+        k: int,
+        timeout: float = None,
+        product: str = None
+    ) -> Tuple[List[Tuple[float, int]], Dict[int, float]]:
+        """全シャードを並列に検索し、(距離, 行番号) の上位k件とシャードごとの所要時間（秒）を返す
+
+        product を指定した場合は、その製品のチャンクを持つシャードだけに送り、各シャードでも製品の範囲だけを比較する。
+        timeout までに応答しなかったシャードは結果に含めない（すべて応答しなければ DeadlineExceeded）。
+        """
+        if self._closed:
+            raise RuntimeError("シャード検索は終了しています")
+        targets = [shard for shard in range(self.shards) if not product or product in self.shard_slices[shard]]
+        if not targets:
+            return [], {}
+        request_id = next(self._ids)
+        futures: List[Tuple[int, Future]] = []
+        with self._lock:
+            for shard in targets:
+                future: Future = Future()
+                self._pending[(request_id, shard)] = future
+                futures.append((shard, future))
+        query = lazy_import("numpy").asarray(vector, dtype="float32")
+        for shard in targets:
+            self._requests[shard].put((request_id, query, k, product))
+
+        expires_at = time.perf_counter() + timeout if timeout is not None else None
+        hits: List[Tuple[float, int]] = []
+        timings: Dict[int, float] = {}
+        errors: List[str] = []
+        for shard, future in futures:
+            wait = None if expires_at is None else max(0.0, expires_at - time.perf_counter())
+            try:
+                (distances, rows), elapsed = future.result(timeout=wait)
+            except FutureTimeoutError:
+                with self._lock:
+                    self._pending.pop((request_id, shard), None)
+                    self.stats[shard]["failures"] += 1
+                _shard_failures.inc(shard=str(shard), reason="timeout")
+                continue
+            except RuntimeError as e:
+                _shard_failures.inc(shard=str(shard), reason="error")
+                self.logger.warning(f"シャード検索エラー: {str(e)}")
+                errors.append(str(e))
+                continue
+            timings[shard] = elapsed
+            hits.extend(zip(distances, rows))
+
+        if not timings:
+            if errors:
+                raise RuntimeError(f"すべてのシャード検索が失敗しました: {errors[0]}")
+            raise DeadlineExceeded("シャード検索が期限内に完了しませんでした")
+        if len(timings) < len(targets):
+            self.logger.warning(f"一部のシャードが応答しませんでした - 応答: {len(timings)}/{len(targets)}")
+        return heapq.nsmallest(k, hits), timings
+
+    def get_stats(self) -> Dict[str, Any]:
+        """シャードごとのチャンク数・検索回数・平均/最大時間"""
+        with self._lock:
+            shards = [
+                {
+                    "shard": shard,
+                    "chunks": len(self.partitions[shard]),
+                    "products": {product: end - start for product, (start, end) in self.shard_slices[shard].items()},
+                    "alive": self._processes[shard].is_alive(),
+                    "requests": stats["requests"],
+                    "failures": stats["failures"],
+                    "mean_ms": stats["total_sec"] / stats["requests"] * 1000 if stats["requests"] else 0.0,
+                    "max_ms": stats["max_sec"] * 1000
+                }
+                for shard, stats in self.stats.items()
+            ]
+        return {"snapshot": self.snapshot_path, "partition": self.partition, "shards": shards}
+
+    def close(self):
+        """ワーカープロセスと応答待ちのスレッドを終了"""
+        if self._closed:
+            return
+        self._closed = True
+        for shard_queue in self._requests:
+            shard_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._responses.put(None)
+        self._dispatcher.join(timeout=5)
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(RuntimeError("シャード検索は終了しています"))
+        self.logger.info(f"シャード検索を終了: {self.snapshot_path}")
+
+class ShardedRetriever:
+    """ShardPool で検索する検索器（src/retrieval.py の create_retriever から作成する）"""
+
+    def __init__(self, pool: ShardPool, embeddings: "Embeddings", k: int = None, timeout: float = None):
+        self.pool = pool
+        self.embeddings = embeddings
+        self.k = k or config.SEARCH_K
+        self.timeout = timeout if timeout is not None else config.RETRIEVAL_SHARD_TIMEOUT_SEC
+
+    def products(self) -> Dict[str, int]:
+        """製品ごとのチャンク数"""
+        return self.pool.product_counts
+
+    def invoke(self, query: str, *args, product: str = None, **kwargs) -> List["Document"]:
+        """質問に近いチャンクを上位k件返す（product を指定するとその製品のチャンクのみ）"""
+        Document = lazy_import("langchain_core.documents").Document
+        with span("shard_search", shards=self.pool.shards, product=product or "") as search_span:
+            vector = self.embeddings.embed_query(query)
+            hits, timings = self.pool.search(
+                vector, self.k, timeout=remaining_time(self.timeout or None), product=product
+            )
+            for shard, elapsed in timings.items():
+                search_span.set_attribute(f"shard_{shard}_ms", round(elapsed * 1000, 2))
+            search_span.set_attribute("answered_shards", len(timings))
+
+        _, documents, metadatas = self.pool.snapshot.records()
+        return [Document(page_content=documents[row], metadata=metadatas[row] or {}) for _, row in hits]
+
+    get_relevant_documents = invoke
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.pool.get_stats()
+
+def ensure_snapshot(persist_directory: str) -> str:
+    """シャード用スナップショットのパスを返す
+
+    RETRIEVAL_SNAPSHOT_PATH を指定した場合は読み取り専用で使い、書き出さない（存在しない・壊れている場合は
+    SnapshotError）。未指定ならインデックスのディレクトリの shards.vsnap を、なければ・インデックスより古ければ書き出す。
+    """
+    manifest = read_manifest(persist_directory) or {}
+    if config.RETRIEVAL_SNAPSHOT_PATH:
+        path = Path(config.RETRIEVAL_SNAPSHOT_PATH)
+        if not path.is_file():
+            raise SnapshotError(f"RETRIEVAL_SNAPSHOT_PATH のスナップショットがありません: {path}")
+        snapshot_manifest = VectorSnapshot(path, verify=True).manifest
+        if any(snapshot_manifest.get(key) != manifest.get(key) for key in ("built_at", "chunk_count")):
+            get_logger().warning(
+                f"指定のスナップショットは現在のインデックスと異なります（書き出し直さずに使用）: {path} - "
+                f"チャンク数: {snapshot_manifest.get('chunk_count')} / {manifest.get('chunk_count')}"
+            )
+        return str(path)
+
+    path = Path(persist_directory) / SHARD_SNAPSHOT_FILENAME
+    if path.exists():
+        try:
+            snapshot_manifest = VectorSnapshot(path, verify=False).manifest
+            if all(snapshot_manifest.get(key) == manifest.get(key) for key in ("built_at", "chunk_count")):
+                return str(path)
+        except SnapshotError as e:
+            get_logger().warning(f"シャード用スナップショットを作り直します: {str(e)}")
+    export_snapshot(str(path), persist_directory)
+    return str(path)
+
+# インデックスのディレクトリ -> ワーカー群（切り替え直後の検索のため INDEX_KEEP_VERSIONS 世代まで残す）
+_pools: "OrderedDict[str, ShardPool]" = OrderedDict()
+_pools_lock = threading.Lock()
+
+def get_shard_pool(persist_directory: str) -> ShardPool:
+    """インデックスのディレクトリに対応するワーカー群を取得（初回はスナップショットの書き出しと起動を行う）"""
+    key = str(Path(persist_directory).resolve())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is not None:
+            _pools.move_to_end(key)
+            return pool
+        snapshot_path = ensure_snapshot(persist_directory)
+        pool = ShardPool(snapshot_path, config.RETRIEVAL_SHARDS, config.RETRIEVAL_SHARD_PARTITION)
+        _pools[key] = pool
+        while len(_pools) > max(1, config.INDEX_KEEP_VERSIONS):
+            _, old_pool = _pools.popitem(last=False)
+            old_pool.close()
+        return pool
+
+def close_shard_pools():
+    """すべてのワーカー群を終了"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+atexit.register(close_shard_pools)
@@ -0,0 +1,331 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Any, Iterable, List, Optional, Tuple
+
+from config import config
+from src.document_processor import (
+    INSERT_BATCH_SIZE, MANIFEST_FILENAME, _directory_size, count_products, read_manifest, release_vectorstore,
+    upsert_product_chunks
+)
+from src.index_versions import active_index_directory, get_index_versions
+from src.lazy_imports import lazy_import
+from src.logger import get_logger
+
+# ファイル構成:
+#   [0, 64)        ヘッダー（MAGIC + 形式バージョン、残りは0埋め）
+#   [64, ...)      ベクトル（float32 リトルエンディアン、count x dim の連続配列。memmap で直接読める）
+#   [..., ...)     レコード（id・本文・メタデータのJSONLをzlib圧縮）
+#   [..., -16)     フッター（JSON: 件数・次元・各領域の位置とSHA-256・マニフェスト）
+#   [-16, end)     フッターの長さ（uint64 LE）+ END_MAGIC
+MAGIC = b"NMCVSNAP"
+END_MAGIC = b"NMCVSEND"
+FORMAT_VERSION = 1
+HEADER_SIZE = 64
+TRAILER = struct.Struct("<Q8s")
+
+# Chromaから一度に読み出すチャンク数
+EXPORT_BATCH_SIZE = 5000
+# チェックサム計算の読み込み単位
+_READ_SIZE = 4 * 1024 * 1024
+
+class SnapshotError(Exception):
+    """スナップショットが壊れている・形式が異なる"""
+
+def _open_store(directory: str):
+    """ディレクトリのChromaを開く（埋め込みモデルは読み込まない）"""
+    Chroma = lazy_import("langchain_community.vectorstores").Chroma
+    return Chroma(persist_directory=directory)
+
+def _write_section(f: BinaryIO, data: bytes, hasher) -> int:
+    f.write(data)
+    hasher.update(data)
+    return len(data)
+
+def write_snapshot(
+    output_path: str,
+    batches: Iterable[Tuple[Any, List[str], List[str], List[dict]]],
+    manifest: Dict[str, Any] = None
+) -> Dict[str, Any]:
+    """(ベクトル, ID, 本文, メタデータ) のバッチを順にスナップショットへ書き出し、フッターの内容を返す
+
+    一時ファイルに書いてから置き換えるため、書き込み途中のファイルが読まれることはない。
+    """
+    np = lazy_import("numpy")
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+
+    vector_hasher = hashlib.sha256()
+    record_hasher = hashlib.sha256()
+    compressor = zlib.compressobj(level=6)
+    records_buffer: List[bytes] = []
+    dim = None
+    count = 0
+
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", FORMAT_VERSION) + b"\0" * (HEADER_SIZE - len(MAGIC) - 4))
+
+        # ベクトルは受け取った順に連続して書き、レコードは圧縮してメモリに溜める（ベクトルより十分小さい）
+        for embeddings, ids, documents, metadatas in batches:
+            if len(ids) == 0:
+                continue
+            vectors = np.asarray(embeddings, dtype="<f4")
+            if dim is None:
+                dim = int(vectors.shape[1])
+            elif vectors.shape[1] != dim:
+                raise SnapshotError(f"ベクトルの次元が一致しません: {vectors.shape[1]} != {dim}")
+            _write_section(f, np.ascontiguousarray(vectors).tobytes(), vector_hasher)
+
+            lines = "".join(
+                json.dumps({"id": chunk_id, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n"
+                for chunk_id, document, metadata in zip(ids, documents, metadatas)
+            )
+            records_buffer.append(compressor.compress(lines.encode("utf-8")))
+            count += len(ids)
+
+        vectors_length = f.tell() - HEADER_SIZE
+        records_offset = f.tell()
+        records_buffer.append(compressor.flush())
+        records_length = sum(_write_section(f, block, record_hasher) for block in records_buffer)
+
+        footer = {
+            "format_version": FORMAT_VERSION,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "count": count,
+            "dim": dim or 0,
+            "dtype": "<f4",
+            "vectors": {"offset": HEADER_SIZE, "length": vectors_length, "sha256": vector_hasher.hexdigest()},
+            "records": {
+                "offset": records_offset,
+                "length": records_length,
+                "sha256": record_hasher.hexdigest(),
+                "encoding": "zlib+jsonl"
+            },
+            "manifest": manifest or {}
+        }
+        footer_bytes = json.dumps(footer, ensure_ascii=False).encode("utf-8")
+        f.write(footer_bytes)
+        f.write(TRAILER.pack(len(footer_bytes), END_MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output_path)
+    return footer
+
+def export_snapshot(output_path: str, source_directory: str = None) -> Dict[str, Any]:
+    """ベクトルストアを1つのスナップショットファイルに書き出し、フッターの内容を返す"""
+    logger = get_logger()
+    source_directory = source_directory or active_index_directory()
+    start_time = time.time()
+
+    collection = _open_store(source_directory)._collection
+    total = collection.count()
+
+    def batches():
+        for offset in range(0, total, EXPORT_BATCH_SIZE):
+            batch = collection.get(
+                include=["embeddings", "documents", "metadatas"], limit=EXPORT_BATCH_SIZE, offset=offset
+            )
+            yield batch["embeddings"], batch["ids"], batch["documents"], batch["metadatas"]
+
+    footer = write_snapshot(output_path, batches(), read_manifest(source_directory) or {})
+    size_mb = Path(output_path).stat().st_size / 1024 / 1024
+    logger.info(
+        f"スナップショット書き出し完了 - チャンク数: {footer['count']}, 次元: {footer['dim']}, "
+        f"サイズ: {size_mb:.1f}MB, 処理時間: {time.time() - start_time:.2f}秒, 出力先: {output_path}"
+    )
+    return footer
+
+class VectorSnapshot:
+    """スナップショットファイルの読み込み
+
+    ベクトルは numpy.memmap で開くため、読み込み時にファイル全体をメモリへ展開しない
+    （同じファイルを開いた複数プロセスはOSのページキャッシュを共有する）。
+    """
+
+    def __init__(self, path: str, verify: bool = True):
+        self.path = Path(path)
+        self.footer = self._read_footer()
+        self.count: int = self.footer["count"]
+        self.dim: int = self.footer["dim"]
+        self.manifest: Dict[str, Any] = self.footer.get("manifest", {})
+        self._vectors = None
+        self._records: Optional[Tuple[List[str], List[str], List[dict]]] = None
+        if verify:
+            self.verify()
+
+    def _read_footer(self) -> Dict[str, Any]:
+        size = self.path.stat().st_size
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+                raise SnapshotError(f"スナップショットファイルではありません: {self.path}")
+            version = struct.unpack("<I", header[len(MAGIC):len(MAGIC) + 4])[0]
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"未対応のスナップショット形式です: バージョン {version}")
+
+            f.seek(size - TRAILER.size)
+            footer_length, end_magic = TRAILER.unpack(f.read(TRAILER.size))
+            if end_magic != END_MAGIC or footer_length > size:
+                raise SnapshotError(f"スナップショットが途中で切れています: {self.path}")
+            f.seek(size - TRAILER.size - footer_length)
+            return json.loads(f.read(footer_length).decode("utf-8"))
+
+    def _section_digest(self, section: Dict[str, Any]) -> str:
+        hasher = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            f.seek(section["offset"])
+            remaining = section["length"]
+            while remaining > 0:
+                block = f.read(min(_READ_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher.hexdigest()
+
+    def verify(self):
+        """各領域のSHA-256を照合（一致しなければ SnapshotError）"""
+        for name in ("vectors", "records"):
+            section = self.footer[name]
+            if self._section_digest(section) != section["sha256"]:
+                raise SnapshotError(f"スナップショットのチェックサムが一致しません（{name}）: {self.path}")
+
+    @property
+    def vectors(self):
+        """count x dim の float32 配列（読み取り専用の memmap）"""
+        if self._vectors is None:
+            np = lazy_import("numpy")
+            self._vectors = np.memmap(
+                self.path, dtype=self.footer["dtype"], mode="r",
+                offset=self.footer["vectors"]["offset"], shape=(self.count, self.dim)
+            )
+        return self._vectors
+
+    def records(self) -> Tuple[List[str], List[str], List[dict]]:
+        """(ID, 本文, メタデータ) のリスト（ベクトルと同じ順）"""
+        if self._records is None:
+            section = self.footer["records"]
+            with open(self.path, "rb") as f:
+                f.seek(section["offset"])
+                data = zlib.decompress(f.read(section["length"])).decode("utf-8")
+            ids, documents, metadatas = [], [], []
+            for line in data.splitlines():
+                record = json.loads(line)
+                ids.append(record["id"])
+                documents.append(record["document"])
+                metadatas.append(record["metadata"])
+            self._records = (ids, documents, metadatas)
+        return self._records
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "size_bytes": self.path.stat().st_size,
+            "created_at": self.footer.get("created_at"),
+            "count": self.count,
+            "dim": self.dim,
+            "embedding_model": self.manifest.get("embedding_model"),
+            "chunk_size": self.manifest.get("chunk_size"),
+            "files": len(self.manifest.get("files", []))
+        }
+
+def import_snapshot(path: str, activate: bool = True, force: bool = False) -> Dict[str, Any]:
+    """スナップショットから新しいインデックスのバージョンを作成し、切り替える
+
+    埋め込みの計算は行わず、保存されたベクトルをそのままChromaに書き込む。
+    埋め込みモデルが現在の設定と異なる場合は、質問のベクトルと比較できないため force なしでは中止する。
+    """
+    logger = get_logger()
+    start_time = time.time()
+    snapshot = VectorSnapshot(path)
+    snapshot_model = snapshot.manifest.get("embedding_model")
+    if snapshot_model and snapshot_model != config.EMBEDDING_MODEL and not force:
+        raise SnapshotError(
+            f"スナップショットの埋め込みモデル ({snapshot_model}) が設定 ({config.EMBEDDING_MODEL}) と異なります"
+        )
+
+    versions = get_index_versions()
+    prepared = versions.prepare(copy_current=False)
+    try:
+        store = _open_store(prepared["directory"])
+        collection = store._collection
+        ids, documents, metadatas = snapshot.records()
+        vectors = snapshot.vectors
+        for start in range(0, snapshot.count, INSERT_BATCH_SIZE):
+            end = min(start + INSERT_BATCH_SIZE, snapshot.count)
+            batch_vectors = vectors[start:end].tolist()
+            collection.add(
+                ids=ids[start:end],
+                embeddings=batch_vectors,
+                documents=documents[start:end],
+                metadatas=metadatas[start:end]
+            )
+            # スナップショットには全体のコレクションのみ含まれるため、製品ごとのコレクションはメタデータから作り直す
+            if config.PRODUCT_COLLECTIONS:
+                upsert_product_chunks(store._client, ids[start:end], batch_vectors, metadatas[start:end], documents[start:end])
+
+        manifest = dict(snapshot.manifest)
+        manifest["chunk_count"] = collection.count()
+        manifest["products"] = count_products(store)
+        manifest["size_bytes"] = _directory_size(Path(prepared["directory"]))
+        manifest["restored_from"] = {"snapshot": str(Path(path).resolve()), "created_at": snapshot.footer.get("created_at")}
+        manifest_path = Path(prepared["directory"]) / MANIFEST_FILENAME
+        tmp_path = manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+    except Exception:
+        release_vectorstore(prepared["directory"])
+        versions.discard(prepared["version"])
+        raise
+
+    if activate:
+        for removed_directory in versions.activate(prepared["version"]):
+            release_vectorstore(removed_directory)
+
+    elapsed = time.time() - start_time
+    logger.info(
+        f"スナップショット読み込み完了 - チャンク数: {snapshot.count}, バージョン: {prepared['version']}, "
+        f"切り替え: {activate}, 処理時間: {elapsed:.2f}秒"
+    )
+    return {**prepared, "chunk_count": snapshot.count, "activated": activate, "elapsed_sec": elapsed}
+
+def main() -> int:
+    """コマンドラインからスナップショットを書き出し・読み込み"""
+    parser = argparse.ArgumentParser(description="ベクトルストアのスナップショット")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="現在のインデックスをスナップショットに書き出し")
+    export_parser.add_argument("output")
+    export_parser.add_argument("--source-dir", default=None, help="省略時は現在有効なバージョン")
+    import_parser = subparsers.add_parser("import", help="スナップショットから新しいバージョンを作成して切り替え")
+    import_parser.add_argument("snapshot")
+    import_parser.add_argument("--no-activate", action="store_true", help="作成のみ行い、切り替えない")
+    import_parser.add_argument("--force", action="store_true", help="埋め込みモデルが異なっても読み込む")
+    info_parser = subparsers.add_parser("info", help="スナップショットの内容を検証して表示")
+    info_parser.add_argument("snapshot")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            footer = export_snapshot(args.output, args.source_dir)
+            result = {key: footer[key] for key in ("created_at", "count", "dim")}
+        elif args.command == "import":
+            result = import_snapshot(args.snapshot, activate=not args.no_activate, force=args.force)
+        else:
+            result = VectorSnapshot(args.snapshot).info()
+    except SnapshotError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
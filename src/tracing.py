@@ -0,0 +1,249 @@
+import argparse
+import atexit
+import json
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional
+
+from config import config
+from src.logger import get_logger, request_id_var as _request_id
+
+# 現在のスパン（リクエストID = トレースIDはロガーと共有）
+_current_trace_span: ContextVar[Optional["Span"]] = ContextVar("current_trace_span", default=None)
+
+def new_request_id() -> str:
+    """新しいリクエストIDを生成"""
+    return uuid.uuid4().hex[:16]
+
+def get_request_id() -> Optional[str]:
+    """現在のリクエストIDを取得（リクエスト外ではNone）"""
+    return _request_id.get()
+
+@contextmanager
+def request_context(request_id: str = None):
+    """リクエストIDを設定するコンテキストマネージャ（既に設定済みならそれを引き継ぐ）"""
+    current = _request_id.get()
+    if current is not None and request_id is None:
+        yield current
+        return
+    token = _request_id.set(request_id or new_request_id())
+    try:
+        yield _request_id.get()
+    finally:
+        _request_id.reset(token)
+
+class Span:
+    """処理区間（開始時刻・所要時間・属性・イベント）を表すクラス"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_time", "duration_ms",
+                 "attributes", "events", "status", "_start_ns")
+
+    def __init__(self, name: str, trace_id: Optional[str], parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start_time = time.time()
+        self.duration_ms: Optional[float] = None
+        self.attributes = dict(attributes)
+        self.events: List[Dict[str, Any]] = []
+        self.status = "ok"
+        self._start_ns = time.perf_counter_ns()
+
+    def set_attribute(self, key: str, value: Any):
+        """属性を設定"""
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        """スパン内の出来事（再試行など）を記録"""
+        self.events.append({
+            "name": name,
+            "offset_ms": (time.perf_counter_ns() - self._start_ns) / 1_000_000,
+            **attributes
+        })
+
+    def finish(self, error: Exception = None):
+        """スパンを終了"""
+        self.duration_ms = (time.perf_counter_ns() - self._start_ns) / 1_000_000
+        if error is not None:
+            self.status = "error"
+            self.attributes["error"] = str(error)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events
+        }
+
+class _NoopSpan:
+    """トレース無効時に返すダミーのスパン"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str, **attributes):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class TraceSink:
+    """スパンをバッファしてJSONLファイルにまとめて書き込むクラス
+
+    リクエスト処理中のスレッドではメモリ上のリストに追加するだけで、
+    ファイルへの書き込みはバッファが一定数に達したときか、定期フラッシュで行う。
+    ファイルは日付ごとに切り替える。
+    """
+
+    def __init__(self, directory: str, buffer_size: int, flush_interval: float):
+        self.directory = Path(directory)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.logger = get_logger()
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+
+    def _ensure_flusher(self):
+        """定期フラッシュ用スレッドを起動"""
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="trace-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def emit(self, record: Dict[str, Any]):
+        """スパンを追加"""
+        with self._lock:
+            self._buffer.append(record)
+            self._ensure_flusher()
+            should_flush = len(self._buffer) >= self.buffer_size
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """バッファをファイルに書き込み"""
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return
+        try:
+            with self._write_lock:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                path = self.directory / f"traces_{datetime.now().strftime('%Y%m%d')}.jsonl"
+                with open(path, 'a', encoding='utf-8') as f:
+                    for record in records:
+                        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except Exception as e:
+            self.logger.error(f"トレース書き込みエラー: {str(e)}")
+
+_sink = TraceSink(
+    str(Path(config.LOG_DIR) / "traces"),
+    buffer_size=config.TRACE_BUFFER_SIZE,
+    flush_interval=config.TRACE_FLUSH_INTERVAL_SEC
+)
+atexit.register(_sink.flush)
+
+def get_trace_sink() -> TraceSink:
+    """トレースの出力先を取得"""
+    return _sink
+
+def get_current_span():
+    """現在のスパンを取得（スパン外・トレース無効時はダミー）"""
+    return _current_trace_span.get() or NOOP_SPAN
+
+@contextmanager
+def trace_span(name: str, **attributes):
+    """スパンを記録するコンテキストマネージャ（親スパン・リクエストIDは自動で引き継ぐ）"""
+    if not config.TRACE_ENABLED:
+        yield NOOP_SPAN
+        return
+
+    parent = _current_trace_span.get()
+    current_span = Span(
+        name,
+        trace_id=_request_id.get(),
+        parent_id=parent.span_id if parent else None,
+        attributes=attributes
+    )
+    token = _current_trace_span.set(current_span)
+    error: Optional[Exception] = None
+    try:
+        yield current_span
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _current_trace_span.reset(token)
+        current_span.finish(error)
+        _sink.emit(current_span.to_dict())
+
+def load_traces(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """JSONLファイルからスパンを読み込み"""
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+def summarize_traces(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """スパン名ごとの件数・エラー数・所要時間の分位点を集計"""
+    # performance は tracing をインポートするため、ここで読み込む
+    from src.performance import _percentile
+
+    durations: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for record in spans:
+        durations.setdefault(record["name"], []).append(record["duration_ms"])
+        if record.get("status") == "error":
+            errors[record["name"]] = errors.get(record["name"], 0) + 1
+
+    summary = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "avg_ms": sum(values) / len(values),
+            "p50_ms": _percentile(values, 50),
+            "p95_ms": _percentile(values, 95),
+            "p99_ms": _percentile(values, 99),
+            "max_ms": values[-1]
+        }
+    return summary
+
+def main() -> int:
+    """コマンドラインからトレースを集計、または1リクエスト分のスパンを表示"""
+    parser = argparse.ArgumentParser(description="トレース（JSONL）の集計")
+    parser.add_argument("files", nargs="*", help="省略時は LOG_DIR/traces 内の全ファイル")
+    parser.add_argument("--request-id", help="指定したリクエストIDのスパンのみ表示")
+    args = parser.parse_args()
+
+    files = args.files or sorted(str(p) for p in (Path(config.LOG_DIR) / "traces").glob("*.jsonl"))
+    spans = list(load_traces(files))
+    if args.request_id:
+        matched = sorted((r for r in spans if r["trace_id"] == args.request_id), key=lambda r: r["start_time"])
+        print(json.dumps(matched, ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(summarize_traces(spans), ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
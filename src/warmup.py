@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from config import config
+from src.lazy_imports import lazy_import, get_import_times
+from src.logger import get_logger
+
+# ウォームアップ時に事前読み込みするモジュール
+WARMUP_MODULES = [
+    "sentence_transformers",
+    "langchain_community.vectorstores",
+    "pypdf",
+    "langchain_core.documents",
+    "langchain.text_splitter",
+    "langchain_groq",
+    "langchain.prompts",
+    "langchain.chains",
+    "langchain.memory",
+    "groq",
+]
+
+WARMUP_QUERY = "show running-config"
+
+class WarmupState:
+    """ウォームアップの進行状況を保持するクラス"""
+
+    def __init__(self):
+        self.status = "pending"  # pending / running / ready / failed
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.step_times: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self.ready_event = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """状態を辞書形式で取得"""
+        total_time = None
+        if self.started_at is not None and self.finished_at is not None:
+            total_time = self.finished_at - self.started_at
+        return {
+            "status": self.status,
+            "ready": self.ready_event.is_set(),
+            "step_times": dict(self.step_times),
+            "total_time": total_time,
+            "import_times": get_import_times(),
+            "error": self.error
+        }
+
+_state = WarmupState()
+_warmup_lock = threading.Lock()
+_warmup_thread: Optional[threading.Thread] = None
+
+def _run_step(name: str, func):
+    """ウォームアップの1ステップを実行して所要時間を記録"""
+    step_start = time.perf_counter()
+    result = func()
+    _state.step_times[name] = time.perf_counter() - step_start
+    get_logger().info(f"ウォームアップ [{name}] 完了 - 所要時間: {_state.step_times[name]:.3f}秒")
+    return result
+
+def _write_ready_file():
+    """準備完了ファイルを作成（デプロイ時の待機に利用）"""
+    ready_path = Path(config.READY_FILE)
+    ready_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = ready_path.with_suffix(ready_path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"pid": os.getpid(), "timestamp": time.time(), **_state.to_dict()}, f, ensure_ascii=False)
+    os.replace(tmp_path, ready_path)
+
+def _remove_ready_file():
+    """前回起動時の準備完了ファイルを削除"""
+    try:
+        Path(config.READY_FILE).unlink()
+    except FileNotFoundError:
+        pass
+
+def warm_up(persist_directory: str = None) -> Dict[str, Any]:
+    """埋め込みモデル・ベクトルストアを事前ロードしてダミー検索を実行"""
+    logger = get_logger()
+
+    with _warmup_lock:
+        if _state.status in ("running", "ready"):
+            return _state.to_dict()
+        _state.status = "running"
+        _state.started_at = time.time()
+        _state.error = None
+
+    _remove_ready_file()
+    logger.info("ウォームアップ開始")
+
+    try:
+        def import_modules():
+            for module_name in WARMUP_MODULES:
+                lazy_import(module_name)
+        _run_step("import", import_modules)
+
+        from src.document_processor import DocumentProcessor
+        from src.embeddings import get_embeddings
+
+        embeddings = _run_step("embedding_model", get_embeddings)
+        _run_step("embedding_query", lambda: embeddings.embed_query(WARMUP_QUERY))
+
+        processor = DocumentProcessor(persist_directory=persist_directory)
+        if Path(processor.persist_directory).exists() and config.RETRIEVAL_SHARDS > 0:
+            # シャード検索ではワーカーの起動（初回はスナップショットの書き出し）を済ませておく
+            from src.retrieval import create_retriever
+            retriever = _run_step("shard_pool", lambda: create_retriever(processor))
+            _run_step("dummy_query", lambda: retriever.invoke(WARMUP_QUERY))
+        elif Path(processor.persist_directory).exists():
+            vectorstore = _run_step("vectorstore", processor.load_vectorstore)
+            _run_step("dummy_query", lambda: vectorstore.similarity_search(WARMUP_QUERY, k=1))
+        else:
+            logger.info("ベクトルストアが未作成のため検索のウォームアップをスキップ")
+
+        _state.status = "ready"
+        _state.finished_at = time.time()
+        _state.ready_event.set()
+        _write_ready_file()
+
+        logger.info(f"ウォームアップ完了 - 所要時間: {_state.finished_at - _state.started_at:.2f}秒")
+        for module_name, elapsed in get_import_times().items():
+            logger.info(f"インポート時間 [{module_name}] - {elapsed:.3f}秒")
+
+    except Exception as e:
+        _state.status = "failed"
+        _state.finished_at = time.time()
+        _state.error = str(e)
+        logger.error(f"ウォームアップエラー: {str(e)}")
+
+    return _state.to_dict()
+
+def start_background_warmup(persist_directory: str = None):
+    """バックグラウンドでウォームアップを開始（プロセス内で1回のみ）"""
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is not None or _state.status != "pending":
+            return
+        _warmup_thread = threading.Thread(
+            target=warm_up,
+            kwargs={"persist_directory": persist_directory},
+            name="warmup",
+            daemon=True
+        )
+        _warmup_thread.start()
+
+def is_ready() -> bool:
+    """ウォームアップが完了しているか"""
+    return _state.ready_event.is_set()
+
+def wait_until_ready(timeout: float = None) -> bool:
+    """ウォームアップ完了まで待機"""
+    return _state.ready_event.wait(timeout)
+
+def get_warmup_status() -> Dict[str, Any]:
+    """ウォームアップの状態を取得"""
+    return _state.to_dict()
+
+def main() -> int:
+    """コマンドラインからウォームアップを実行（完了時に終了コード0）"""
+    parser = argparse.ArgumentParser(description="埋め込みモデルとベクトルストアのウォームアップ")
+    parser.add_argument("--persist-directory", default=None, help="ベクトルストアのディレクトリ")
+    args = parser.parse_args()
+
+    status = warm_up(persist_directory=args.persist_directory)
+    print(json.dumps(status, ensure_ascii=False, indent=2))
+    return 0 if status["ready"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())